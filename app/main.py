@@ -1,37 +1,112 @@
+import functools
+import importlib
 import logging.config
 import typing
 
 import sentry_sdk
 import yaml
 from celery import Celery
-from celery.signals import after_setup_logger, after_setup_task_logger
-from fastapi import APIRouter, FastAPI
-from fastapi.exceptions import RequestValidationError
-from starlette.exceptions import HTTPException
+from celery.signals import (
+    after_setup_logger,
+    after_setup_task_logger,
+    worker_init,
+    worker_process_init,
+)
 
 from app import ExtraTaskFormatter
-from app.exceptions.api_errors import APIError
-from app.exceptions.handlers import (
-    api_error_exception_handler,
-    http_exception_handler,
-    validation_exception_handler,
-)
-from app.exceptions.schemas import ValidationError
 from app.metrics.celery import instrument as celery_metrics_instrument
-from app.metrics.server import ASGIMetricsMiddleware
-from app.routers import gitlab, healthcheck, metrics, security
+from app.metrics.celery import instrument_queues as celery_queues_instrument
+from app.secbot.artifacts import CLEANUP_TASK_NAME as ARTIFACTS_CLEANUP_TASK_NAME
+from app.secbot.artifacts import cleanup_artifacts
+from app.secbot.codec import CELERY_SERIALIZER, register_celery_serializer
+from app.secbot.plugins import get_manifest
+from app.secbot.runtime import instrument as worker_runtime_instrument
+from app.secbot.settings import settings as secbot_settings
 from app.settings import BASE_PATH, flatten_settings_values, settings
 
 
 def init_celery() -> Celery:
+    """Create the celery application publishing and running the secbot tasks."""
     celery = Celery(__name__)
     celery.conf.broker_url = settings.celery_broker_url
     celery.conf.result_backend = settings.celery_result_backend
+
+    # The task arguments and results are encoded by the typed codec,
+    # the JSON messages are still accepted from the older publishers
+    register_celery_serializer()
+    celery.conf.task_serializer = CELERY_SERIALIZER
+    celery.conf.result_serializer = CELERY_SERIALIZER
+    celery.conf.accept_content = [CELERY_SERIALIZER, "json"]
+    celery.conf.result_accept_content = [CELERY_SERIALIZER, "json"]
+    celery.conf.task_compression = secbot_settings.task_compression
+    celery.conf.result_compression = secbot_settings.task_compression
+
+    celery.task(name=ARTIFACTS_CLEANUP_TASK_NAME, ignore_result=True)(
+        cleanup_artifacts
+    )
+
+    beat_schedule = {}
+    # The queued workflows of the inputs are released periodically,
+    # when no events come in to release them
+    if secbot_settings.workflow_release_interval > 0:
+        beat_schedule.update(
+            {
+                f"secbot.input.{input_name}.release": {
+                    "task": f"secbot.input.{input_name}.release",
+                    "schedule": secbot_settings.workflow_release_interval,
+                    "options": {"expires": secbot_settings.workflow_release_interval},
+                }
+                for input_name in get_manifest().inputs
+            }
+        )
+    if (
+        secbot_settings.artifacts_backend
+        and secbot_settings.artifacts_ttl > 0
+        and secbot_settings.artifacts_cleanup_interval > 0
+    ):
+        beat_schedule[ARTIFACTS_CLEANUP_TASK_NAME] = {
+            "task": ARTIFACTS_CLEANUP_TASK_NAME,
+            "schedule": secbot_settings.artifacts_cleanup_interval,
+            "options": {"expires": secbot_settings.artifacts_cleanup_interval},
+        }
+    celery.conf.beat_schedule = beat_schedule
     celery_metrics_instrument()
 
     return celery
 
 
+def init_worker(celery: Celery) -> None:
+    """Set up the worker process of the celery application."""
+    celery_queues_instrument(
+        str(settings.celery_broker_url),
+        [
+            celery.conf.task_default_queue,
+            *(
+                queue
+                for queue in (
+                    secbot_settings.scans_queue,
+                    secbot_settings.outputs_queue,
+                    secbot_settings.notifications_queue,
+                    secbot_settings.async_handlers_queue,
+                )
+                if queue
+            ),
+        ],
+    )
+    worker_runtime_instrument()
+    # The forked processes of the pool don't inherit the watcher thread
+    worker_init.connect(watch_workflow_config, weak=False)
+    worker_process_init.connect(watch_workflow_config, weak=False)
+
+
+def watch_workflow_config(**kwargs) -> None:
+    """Load the workflow config, and reload it when its file changes, without restarts."""
+    from app.secbot.config import config as workflow_config
+
+    workflow_config.load()
+    workflow_config.watch(secbot_settings.config_reload_interval)
+
+
 def sanitize_event_values(
     value: typing.Union[dict, list, tuple, str],
     sensitive_values: typing.Set[typing.Union[str, int]],
@@ -70,6 +145,12 @@ def before_send(event, hint):
     return event
 
 
+def init_sentry() -> None:
+    """Set up the sentry error reporting of the process, if its DSN is set."""
+    if settings.sentry_dsn:
+        sentry_sdk.init(dsn=settings.sentry_dsn, before_send=before_send)
+
+
 def initial_secbot(celery_application):
     """Initializes the secbot workflow runner with auto-discovery.
     This process finds and registers workflow components.
@@ -88,101 +169,61 @@ def initial_secbot(celery_application):
     return SecurityBot(celery_app=celery_application)
 
 
-def init_app(
-    title: str,
-    routers: typing.List[APIRouter],
-    openapi_tags: typing.List[typing.Dict[str, typing.Any]] = None,
-):
-    application = FastAPI(
-        title=title,
-        debug=settings.debug,
-        version="1.0.0",
-        docs_url="/docs" if settings.docs_enable else None,
-        openapi_tags=openapi_tags,
-    )
+def configure_logging():
+    with open(BASE_PATH / "logging.yml") as logging_yml:
+        logging_config = yaml.safe_load(logging_yml.read())
+        logging.config.dictConfig(logging_config)
 
-    # Setup exceptions
-    application.add_exception_handler(
-        APIError,
-        api_error_exception_handler,
-    )
-    application.add_exception_handler(
-        HTTPException,
-        http_exception_handler,
-    )
-    application.add_exception_handler(
-        RequestValidationError,
-        validation_exception_handler,
-    )
 
-    # Setup routes
-    application.include_router(healthcheck.router)
+@functools.lru_cache(maxsize=None)
+def get_celery_app() -> Celery:
+    """Get the celery application of the process, it publishes the secbot tasks."""
+    return init_celery()
 
-    router_v1 = APIRouter(
-        prefix="/v1",
-        responses={
-            422: {
-                "model": ValidationError,
-                "description": "Validation Error",
-            }
-        },
-    )
-    for router in routers:
-        router_v1.include_router(router)
-
-    application.include_router(router_v1)
-
-    # Setup metrics
-    application.add_middleware(
-        ASGIMetricsMiddleware,
-        tier=1,
-        include_latency_histogram=True,
-        record_source_ip=True,
-        include_not_found_url_label=False,
-    )
-    application.include_router(metrics.router)
 
-    # Setup sentry
-    if settings.sentry_dsn:
-        sentry_sdk.init(dsn=settings.sentry_dsn, before_send=before_send)
+@functools.lru_cache(maxsize=None)
+def get_security_bot():
+    """Get the secbot workflow runner of the process.
 
-    return application
-
-
-with open(BASE_PATH / "logging.yml") as logging_yml:
-    logging_config = yaml.safe_load(logging_yml.read())
-    logging.config.dictConfig(logging_config)
-
-app = init_app(
-    title=settings.app_name,
-    routers=[
-        gitlab.router,
-    ],
-    openapi_tags=[
-        {"name": "common"},
-        {
-            "name": "gitlab",
-            "externalDocs": {
-                "description": "Gitlab webhook events",
-                "url": "https://docs.gitlab.com/ee/user/project/integrations/webhook_events.html",
-            },
-        },
-    ],
-)
-security_gateway_app = init_app(
-    title="Security Gateway",
-    routers=[security.router],
-    openapi_tags=[{"name": "common"}, {"name": "security"}],
-)
-celery_app = init_celery()
-security_bot = initial_secbot(celery_app)
+    The inputs and the handlers are imported on first use,
+    see `app.secbot.plugins`.
+    """
+    return initial_secbot(get_celery_app())
+
+
+def bootstrap_worker() -> Celery:
+    """Bootstrap the celery worker, with the tasks of all the handlers registered."""
+    configure_logging()
+    init_sentry()
+    celery = get_celery_app()
+    init_worker(celery)
+    get_security_bot().load_plugins()
+    return celery
+
+
+# The objects of the entry points, e.g. `uvicorn app.main:app` or
+# `celery -A app.main:celery_app worker`, bootstrapped on first access,
+# so every process imports and sets up only its own role
+ENTRY_POINTS = {
+    "app": "app.web:bootstrap_webhook",
+    "security_gateway_app": "app.web:bootstrap_security_gateway",
+    "celery_app": "app.main:bootstrap_worker",
+    "security_bot": "app.main:get_security_bot",
+}
+
+
+def __getattr__(name: str):
+    if name not in ENTRY_POINTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module_name, bootstrap = ENTRY_POINTS[name].split(":")
+    value = getattr(importlib.import_module(module_name), bootstrap)()
+    globals()[name] = value
+    return value
 
 
 @after_setup_logger.connect
 def setup_loggers(logger, *args, **kwargs):
-    with open(BASE_PATH / "logging.yml") as logging_yml:
-        logging_config = yaml.safe_load(logging_yml.read())
-        logging.config.dictConfig(logging_config)
+    configure_logging()
 
 
 @after_setup_task_logger.connect
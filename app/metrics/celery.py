@@ -1,14 +1,52 @@
+import logging
+import time
 import timeit
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, cast
 
+import redis
 from celery import signals
+from prometheus_client import REGISTRY
+from prometheus_client.core import GaugeMetricFamily
 
-from app.metrics.common import get_location_labels_from_env
-from app.metrics.job import SRE_JOB_ERRORS, SRE_JOB_EXECUTION_TIME, SRE_JOB_EXECUTIONS
+from app.metrics.common import get_location_labels_from_env, location_labels
+from app.metrics.job import (
+    SRE_JOB_ERRORS,
+    SRE_JOB_EXECUTION_TIME,
+    SRE_JOB_EXECUTIONS,
+    SRE_QUEUE_LATENCY,
+)
+from app.secbot.redis import get_broker_queue_names
+
+# The header with the time the task message has been published
+PUBLISHED_AT_HEADER = "secbot_published_at"
+
+logger = logging.getLogger(__name__)
+
+
+def before_publish(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault(PUBLISHED_AT_HEADER, time.time())
 
 
 def prerun(task, *args, **kwargs):
     task._started_at = timeit.default_timer()
 
+    # The latency of the delayed tasks (e.g. with a countdown) is measured
+    # from their ETA, when they were due to start
+    published_at = getattr(task.request, PUBLISHED_AT_HEADER, None)
+    queue = (task.request.delivery_info or {}).get("routing_key")
+    if published_at is None or queue is None:
+        return
+    eta = task.request.eta
+    if isinstance(eta, str):
+        eta = datetime.fromisoformat(eta)
+    if eta is not None:
+        published_at = max(published_at, eta.timestamp())
+    SRE_QUEUE_LATENCY.labels(**get_location_labels_from_env(), queue=queue).observe(
+        max(0.0, time.time() - published_at)
+    )
+
 
 def postrun(task, *args, **kwargs):
     labels = get_location_labels_from_env()
@@ -25,7 +63,49 @@ def on_error(exception, sender, *args, **kwargs):
     ).inc()
 
 
+class QueueDepthCollector:
+    """Collects the number of the messages waiting in the redis broker queues.
+
+    The messages of all the priorities are counted, like the admission control
+    does with `get_broker_queue_depth`, e.g. the low priority prefetch tasks.
+    """
+
+    def __init__(self, broker_url: str, queues: Iterable[str]):
+        self.broker_url = broker_url
+        self.queues = list(dict.fromkeys(queues))
+        self._redis: Optional[redis.Redis] = None
+
+    def collect(self) -> List[GaugeMetricFamily]:
+        metric = GaugeMetricFamily(
+            "job_queue_depth",
+            "Amount of messages waiting in the broker queue",
+            labels=("queue", *location_labels),
+        )
+        labels = cast(Dict[str, str], get_location_labels_from_env())
+        try:
+            if self._redis is None:
+                self._redis = redis.Redis.from_url(self.broker_url)
+            for queue in self.queues:
+                depth = sum(
+                    self._redis.llen(name) for name in get_broker_queue_names(queue)
+                )
+                metric.add_metric(
+                    (queue, *(labels[name] for name in location_labels)),
+                    depth,
+                )
+        except redis.RedisError:
+            logger.warning("Failed to measure the depth of the broker queues")
+        return [metric]
+
+
+def instrument_queues(broker_url: str, queues: Iterable[str]):
+    if not broker_url.startswith(("redis://", "rediss://")):
+        return
+    REGISTRY.register(QueueDepthCollector(broker_url, queues))
+
+
 def instrument():
+    signals.before_task_publish.connect(before_publish, weak=False)
     signals.task_prerun.connect(prerun, weak=False)
     signals.task_postrun.connect(postrun, weak=False)
     signals.task_failure.connect(on_error, weak=False)
@@ -0,0 +1,16 @@
+from prometheus_client import Counter, Gauge
+
+from app.metrics.common import location_labels
+
+SECBOT_CONFIG_VERSION = Gauge(
+    "secbot_config_version_info",
+    "Version of the workflow config, 1 for the active one",
+    ("version", *location_labels),
+    multiprocess_mode="livemax",
+)
+
+SECBOT_CONFIG_RELOAD_ERRORS = Counter(
+    "secbot_config_reload_errors_total",
+    "Amount of the workflow config reloads failed because of an invalid config",
+    location_labels,
+)
@@ -0,0 +1,41 @@
+from prometheus_client import Counter, Histogram
+
+from app.metrics.common import location_labels
+
+SECBOT_INGEST_EVENTS = Counter(
+    "secbot_ingest_events_total",
+    "Amount of webhook events put on the ingest queue",
+    ("input", "event", *location_labels),
+)
+
+SECBOT_INGEST_LAG = Histogram(
+    "secbot_ingest_lag_seconds",
+    "Time between an event being ingested and dispatched",
+    ("input", *location_labels),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+
+SECBOT_DISPATCH_ERRORS = Counter(
+    "secbot_dispatch_errors_total",
+    "Amount of ingested events that failed to be dispatched",
+    ("input", *location_labels),
+)
+
+SECBOT_DISPATCH_SUPPRESSED = Counter(
+    "secbot_dispatch_suppressed_total",
+    "Amount of security checks not dispatched because they are duplicates",
+    ("input", "reason", *location_labels),
+)
+
+SECBOT_DISPATCH_ADMISSION = Counter(
+    "secbot_dispatch_admission_total",
+    "Amount of workflows deferred or shed by the admission control",
+    ("input", "decision", *location_labels),
+)
+
+SECBOT_SCHEDULER_WAIT = Histogram(
+    "secbot_scheduler_wait_seconds",
+    "Time the workflows of a project wait in the fair scheduler",
+    ("project", "priority", *location_labels),
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+)
@@ -1,4 +1,4 @@
-from prometheus_client import Counter
+from prometheus_client import Counter, Histogram
 
 from app.metrics.common import location_labels
 
@@ -19,3 +19,10 @@ SRE_JOB_ERRORS = Counter(
     "Amount of errors",
     ("job_name", "job_error", *location_labels),
 )
+
+SRE_QUEUE_LATENCY = Histogram(
+    "job_queue_latency_seconds",
+    "Time between a job being published and started",
+    ("queue", *location_labels),
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+)
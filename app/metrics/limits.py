@@ -0,0 +1,23 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+from app.metrics.common import location_labels
+
+SECBOT_LIMIT_WAIT = Histogram(
+    "secbot_limit_wait_seconds",
+    "Time to acquire a slot of the concurrency limit of an external service",
+    ("limit", *location_labels),
+    buckets=(0.01, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+
+SECBOT_LIMIT_SATURATION = Gauge(
+    "secbot_limit_saturation",
+    "Share of the slots of the concurrency limit held across all the workers, "
+    "as last seen by the process",
+    ("limit", *location_labels),
+)
+
+SECBOT_LIMIT_TIMEOUTS = Counter(
+    "secbot_limit_timeouts_total",
+    "Amount of the slots of the concurrency limit not acquired in time",
+    ("limit", *location_labels),
+)
@@ -0,0 +1,43 @@
+from prometheus_client import Counter, Histogram
+
+from app.metrics.common import location_labels
+
+SECBOT_REPOSITORY_FETCH_TIME = Histogram(
+    "secbot_repository_fetch_seconds",
+    "Time to fetch and check out the repository of a scan",
+    ("scan", "strategy", *location_labels),
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
+
+SECBOT_REPOSITORY_FETCH_BYTES = Histogram(
+    "secbot_repository_fetch_bytes",
+    "Size of the packs received by the repository fetch of a scan",
+    ("scan", "strategy", *location_labels),
+    buckets=(2**16, 2**20, 2**22, 2**24, 2**26, 2**28, 2**30, 2**32),
+)
+
+SECBOT_REPOSITORY_CACHE_REQUESTS = Counter(
+    "secbot_repository_cache_requests_total",
+    "Amount of checkouts from the repository mirrors by the result: "
+    "hit, fetch (of the missing commits), or miss (of the mirror)",
+    ("result", *location_labels),
+)
+
+SECBOT_REPOSITORY_CACHE_EVICTIONS = Counter(
+    "secbot_repository_cache_evictions_total",
+    "Amount of the repository mirrors evicted over the disk budget",
+    location_labels,
+)
+
+SECBOT_REPOSITORY_PREFETCH = Counter(
+    "secbot_repository_prefetch_total",
+    "Amount of the scans finding their commit prefetched into the mirror (hit), "
+    "or fetching it themselves while the prefetch is enabled (miss)",
+    ("result", *location_labels),
+)
+
+SECBOT_REPOSITORY_PREFETCH_SAVED = Counter(
+    "secbot_repository_prefetch_saved_seconds_total",
+    "Time of the fetches done by the prefetch ahead of the scans",
+    location_labels,
+)
@@ -1,17 +1,24 @@
 import logging
-from typing import Optional
+from typing import Optional, cast
 
 import sentry_sdk
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request, Response, status
 from pydantic import BaseModel
 
 from app.exceptions.schemas import ValidationError
+from app.secbot.exceptions import DispatchShed
+from app.secbot.inputs.gitlab import GitlabInput
 from app.secbot.inputs.gitlab.dependencies import (
+    WEBHOOK_PAYLOAD_EXAMPLES,
     get_gitlab_webhook_token_header,
     gitlab_event,
+    webhook_jobs,
     webhook_model,
+    webhook_payload,
 )
-from app.secbot.inputs.gitlab.schemas import AnyGitlabModel, GitlabEvent
+from app.secbot.inputs.gitlab.ingest import get_ingest_queue
+from app.secbot.inputs.gitlab.schemas import GitlabEvent, PushWebhookModel
+from app.secbot.settings import settings as secbot_settings
 
 logger = logging.getLogger(__name__)
 router = APIRouter(
@@ -31,7 +38,24 @@ class WebhookReplyModel(BaseModel):
     response_description=f"""We support only {', '.join(GitlabEvent)} events.
      For the rest any events we will return 200 OK and do nothing.
     """,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {
+                    "schema": {"type": "object"},
+                    "examples": WEBHOOK_PAYLOAD_EXAMPLES,
+                }
+            },
+        }
+    },
     responses={
+        202: {
+            "description": "The event has been put on the ingest queue "
+            "(only in the webhook ingest mode)",
+            "model": WebhookReplyModel,
+            "content": {"application/json": {"example": {"status": "accepted"}}},
+        },
         403: {
             "description": "Gitlab webhook secret token missing or invalid",
             "model": ValidationError,
@@ -48,13 +72,39 @@ class WebhookReplyModel(BaseModel):
     },
 )
 async def post_webhook(
+    request: Request,
+    response: Response,
     event: Optional[GitlabEvent] = Depends(gitlab_event),
-    data: Optional[AnyGitlabModel] = Depends(webhook_model),
 ):
     if not event:
         logger.info("Unsupported event", extra={"event": event})
         return WebhookReplyModel()
 
+    # The config rules are applied to the raw payload, so the events that don't
+    # match any job are rejected before the model validation and the queueing.
+    payload = await webhook_payload(request)
+
+    # The pushes are prefetched ahead of the merge request events of their
+    # commits, so they are prefetched even if no job matches the push itself.
+    if event is GitlabEvent.PUSH and secbot_settings.repository_prefetch_enabled:
+        push_data = webhook_model(body=payload, event=event)
+        if isinstance(push_data, PushWebhookModel):
+            from app.main import security_bot
+
+            cast(GitlabInput, security_bot.get_input("gitlab")).prefetch(push_data)
+
+    if not webhook_jobs(payload):
+        logger.info("No matching workflow job", extra={"event": event})
+        return WebhookReplyModel()
+
+    # In the ingest mode, we acknowledge the event right away and leave
+    # the validation and dispatching to the gitlab dispatcher.
+    if secbot_settings.gitlab_ingest_enabled:
+        await get_ingest_queue().put(event, payload)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return WebhookReplyModel(status="accepted")
+
+    data = webhook_model(body=payload, event=event)
     if not data:
         logger.warning("Unsupported event data", extra={"data": data})
         with sentry_sdk.push_scope() as scope:
@@ -69,5 +119,9 @@ async def post_webhook(
     )
     from app.main import security_bot
 
-    await security_bot.run("gitlab", data=data, event=event)
+    try:
+        await security_bot.run("gitlab", data=data, event=event)
+    except DispatchShed:
+        # The event is dropped on purpose, GitLab must not retry it
+        return WebhookReplyModel(status="shed")
     return WebhookReplyModel()
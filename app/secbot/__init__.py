@@ -1,13 +1,9 @@
-import importlib
-import inspect
-import os
-import pkgutil
 from typing import Type
 
 from celery import Celery
 
 from .inputs import SecbotInput
-from .logger import logger
+from .plugins import LazyRegistry, get_manifest
 from .schemas import SecurityCheckStatus
 
 
@@ -18,37 +14,31 @@ class SecurityBot:
 
     Attributes:
         celery_app: Celery application instance for managing asynchronous tasks.
-        _registered_inputs: Dictionary of registered inputs (security checks).
+        _registered_inputs: Registry of the inputs (security checks).
     """
 
     def __init__(self, celery_app: Celery):
         self.celery_app = celery_app
-        self._registered_inputs = {}  # Contains the registered inputs
+        # Contains the registered inputs
+        self._registered_inputs = LazyRegistry(self.create_input)
         self.autodiscover_inputs()
 
     def autodiscover_inputs(self):
         """
-        Automatically discover all available inputs (security checks)
-        from the inputs module, and register them to the bot.
+        Declare all available inputs (security checks) listed by the plugins
+        manifest. The inputs are imported and registered on first use,
+        see `app.secbot.plugins`.
         """
-        base_package = "app.secbot.inputs"
-        base_path = os.path.dirname(__import__(base_package, fromlist=[""]).__file__)
-
-        # Iterate over all modules in the base package
-        for _, package_name, _ in pkgutil.iter_modules([base_path]):
-            full_package_name = f"{base_package}.{package_name}"
-            try:
-                module = importlib.import_module(full_package_name)
-            except ImportError as e:
-                logger.warning(
-                    f"Could not import {full_package_name}. Error: {str(e)}"
-                )
-                continue
-
-            # Register all classes that are a subclass of SecbotInput (excluding SecbotInput itself)
-            for name, cls in inspect.getmembers(module, inspect.isclass):
-                if issubclass(cls, SecbotInput) and cls != SecbotInput:
-                    self.register_input(package_name, cls)
+        for config_name, entry in get_manifest().inputs.items():
+            self._registered_inputs.declare(config_name, entry)
+
+    def load_plugins(self):
+        """Import and register all the inputs and their handlers.
+
+        The worker needs all of them at once to register their celery tasks.
+        """
+        for registered_input in self._registered_inputs.load_all().values():
+            registered_input.load_handlers()
 
     def register_input(self, config_name: str, input_cls: Type[SecbotInput]):
         """
@@ -58,11 +48,27 @@ class SecurityBot:
             config_name: The name of the configuration for the input.
             input_cls: The class representing the input.
         """
-        self._registered_inputs[config_name] = input_cls(
+        self._registered_inputs[config_name] = self.create_input(
+            config_name, input_cls
+        )
+
+    def create_input(
+        self, config_name: str, input_cls: Type[SecbotInput]
+    ) -> SecbotInput:
+        return input_cls(
             config_name=config_name,
             celery_app=self.celery_app,
         )
 
+    def get_input(self, input_name: str) -> SecbotInput:
+        """
+        Get a registered input (security check) by its name.
+
+        Args:
+            input_name: The name of the input.
+        """
+        return self._registered_inputs[input_name]
+
     async def run(self, input_name: str, *args, **kwargs):
         """
         Run a registered input (security check).
@@ -70,9 +76,11 @@ class SecurityBot:
         Args:
             input_name: The name of the input to run.
             args, kwargs (optional): Arguments to pass to the input's run method.
+        Returns:
+            The result of the input's run method, e.g. the published workflows.
         """
-        registered_input = self._registered_inputs[input_name]
-        await registered_input.run(*args, **kwargs)
+        registered_input = self.get_input(input_name)
+        return await registered_input.run(*args, **kwargs)
 
     async def fetch_check_result(
         self,
@@ -89,5 +97,5 @@ class SecurityBot:
         Returns:
             The status of the security check.
         """
-        registered_input = self._registered_inputs[input_name]
+        registered_input = self.get_input(input_name)
         return await registered_input.fetch_status(*args, **kwargs)
@@ -0,0 +1,207 @@
+import enum
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional
+
+from celery import Celery
+from celery.canvas import Signature
+from redis import asyncio as aioredis
+
+from app.secbot import codec
+from app.secbot.redis import get_broker_queue_depth, get_broker_redis, get_redis
+from app.secbot.settings import settings
+
+
+class AdmissionDecision(str, enum.Enum):
+    ADMIT = "admit"
+    DEFER = "defer"
+    SHED = "shed"
+
+
+@dataclass
+class AdmissionLimits:
+    """Soft and hard limits of the load, and the limit of the deferred
+    dispatches held, 0 means no limit."""
+
+    queue_soft_limit: int = 0
+    queue_hard_limit: int = 0
+    scans_soft_limit: int = 0
+    scans_hard_limit: int = 0
+    holding_limit: int = 0
+
+
+@dataclass
+class AdmissionLoad:
+    """The current load of the workers."""
+
+    queue_depth: int
+    in_progress_scans: int
+
+
+def is_over_limit(value: int, limit: int) -> bool:
+    return limit > 0 and value >= limit
+
+
+# Puts the dispatch on the holding queue, unless the queue is full.
+# Returns whether the dispatch has been put.
+DEFER_SCRIPT = """
+local limit = tonumber(ARGV[1])
+if limit > 0 and redis.call('LLEN', KEYS[1]) >= limit then
+    return 0
+end
+redis.call('LPUSH', KEYS[1], ARGV[2])
+return 1
+"""
+
+
+class AdmissionController:
+    """Admission control between the inputs and the celery broker.
+
+    A mass event (e.g. a bot pushing to thousands of repositories) may queue
+    hours of scans and starve the gating ones. The load is measured by the
+    depth of the broker queue and the number of the scans in progress.
+    Above the soft limit, the low priority workflows are deferred to the
+    holding queue, and they are released once the load goes down. Above the
+    hard limit, or when the holding queue is full, they are shed. The high
+    priority workflows are always admitted.
+    """
+
+    holding_key_prefix = "secbot:admission:holding"
+
+    def __init__(
+        self,
+        redis: aioredis.Redis,
+        broker_redis: aioredis.Redis,
+        limits: AdmissionLimits,
+    ):
+        self.redis = redis
+        self.broker_redis = broker_redis
+        self.limits = limits
+
+    def holding_key(self, input_name: str) -> str:
+        return f"{self.holding_key_prefix}:{input_name}"
+
+    async def queue_depth(self, queue_name: str) -> int:
+        """Number of the messages waiting in the redis broker queue."""
+        if not (self.limits.queue_soft_limit or self.limits.queue_hard_limit):
+            return 0
+        # E.g. the prefetch tasks are published with the lowest priority
+        return await get_broker_queue_depth(self.broker_redis, queue_name)
+
+    async def measure(
+        self,
+        queue_name: str,
+        count_in_progress_scans: Callable[[], Awaitable[int]],
+    ) -> AdmissionLoad:
+        """Measure the load, skipping the measures without limits."""
+        in_progress_scans = 0
+        if self.limits.scans_soft_limit or self.limits.scans_hard_limit:
+            in_progress_scans = await count_in_progress_scans()
+        return AdmissionLoad(
+            queue_depth=await self.queue_depth(queue_name),
+            in_progress_scans=in_progress_scans,
+        )
+
+    def is_overloaded(self, load: AdmissionLoad) -> bool:
+        return is_over_limit(
+            load.queue_depth, self.limits.queue_soft_limit
+        ) or is_over_limit(load.in_progress_scans, self.limits.scans_soft_limit)
+
+    def is_saturated(self, load: AdmissionLoad) -> bool:
+        return is_over_limit(
+            load.queue_depth, self.limits.queue_hard_limit
+        ) or is_over_limit(load.in_progress_scans, self.limits.scans_hard_limit)
+
+    def decide(self, load: AdmissionLoad, low_priority: bool) -> AdmissionDecision:
+        if low_priority and self.is_saturated(load):
+            return AdmissionDecision.SHED
+        if low_priority and self.is_overloaded(load):
+            return AdmissionDecision.DEFER
+        return AdmissionDecision.ADMIT
+
+    async def defer(
+        self,
+        input_name: str,
+        workflows: List[Signature],
+        countdown: Optional[int] = None,
+        low_priority: bool = False,
+        fair_share_key: Optional[str] = None,
+    ) -> bool:
+        """Put the workflows of the dispatch on the holding queue of the input.
+
+        The options of the dispatch are kept with the workflows, so they are
+        published the same way once released, see `SecbotInput.publish`.
+
+        Returns:
+            Whether the workflows have been deferred, False if the holding
+            queue is full.
+        """
+        if not workflows:
+            return True
+        entry = codec.dumps(
+            {
+                "workflows": workflows,
+                "options": {
+                    "countdown": countdown,
+                    "low_priority": low_priority,
+                    "fair_share_key": fair_share_key,
+                },
+            }
+        )
+        return bool(
+            await self.redis.eval(
+                DEFER_SCRIPT,
+                1,
+                self.holding_key(input_name),
+                self.limits.holding_limit,
+                entry,
+            )
+        )
+
+    async def release(
+        self,
+        celery_app: Celery,
+        input_name: str,
+        count: int,
+        publish: Callable[..., Awaitable[None]],
+    ) -> int:
+        """Publish up to `count` dispatches from the holding queue of the input.
+
+        Args:
+            celery_app: The celery application of the workflows.
+            input_name: The name of the input of the holding queue.
+            count: The maximum number of the dispatches to release.
+            publish: The coroutine function publishing the workflows
+                with the options of the dispatch, see `SecbotInput.publish`.
+
+        Returns:
+            The number of the released dispatches.
+        """
+        released = 0
+        for _ in range(count):
+            item = await self.redis.rpop(self.holding_key(input_name))
+            if item is None:
+                break
+            entry = codec.loads(item)
+            if "workflows" not in entry:
+                # The single workflow deferred by the former versions
+                entry = {"workflows": [entry], "options": {}}
+            await publish(
+                [celery_app.signature(workflow) for workflow in entry["workflows"]],
+                **entry["options"],
+            )
+            released += 1
+        return released
+
+
+def get_admission_controller() -> AdmissionController:
+    return AdmissionController(
+        get_redis(),
+        get_broker_redis(),
+        limits=AdmissionLimits(
+            queue_soft_limit=settings.admission_queue_soft_limit,
+            queue_hard_limit=settings.admission_queue_hard_limit,
+            scans_soft_limit=settings.admission_scans_soft_limit,
+            scans_hard_limit=settings.admission_scans_hard_limit,
+            holding_limit=settings.admission_holding_limit,
+        ),
+    )
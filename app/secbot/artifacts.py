@@ -0,0 +1,245 @@
+"""Claim-check store of the scan reports.
+
+The reports may be tens of megabytes, so instead of passing them through
+the celery messages (i.e. Redis) from task to task, the scan puts the report
+into the artifact store, and the tasks pass only a small reference to it.
+
+The artifacts are content-addressed by the SHA-256 digest of the report,
+so the same report (e.g. of a re-delivered event) is stored once,
+and optionally gzip-compressed. The artifacts not stored for the TTL
+are removed by the cleanup, scheduled by celery beat.
+"""
+import abc
+import asyncio
+import functools
+import gzip
+import hashlib
+import os
+import pathlib
+import tempfile
+import time
+from typing import List, Optional, cast
+
+import boto3
+from botocore.exceptions import ClientError
+
+from app.secbot.logger import logger
+from app.secbot.schemas import SecbotBaseModel
+from app.secbot.settings import settings
+
+CLEANUP_TASK_NAME = "secbot.artifacts.cleanup"
+
+
+class ArtifactRef(SecbotBaseModel):
+    """Reference to the artifact passed by the tasks instead of its content."""
+
+    key: str
+    size: int
+    compressed: bool = False
+
+
+class ArtifactStore(abc.ABC):
+    """Content-addressed store of the artifacts.
+
+    The backends implement the blocking `_read`, `_write`, `_exists`,
+    `_touch` and `cleanup` methods, the ones used by the tasks are run
+    in a thread to not block the event loop.
+    """
+
+    def __init__(self, compression: bool = True):
+        self.compression = compression
+
+    @staticmethod
+    def get_key(data: bytes, compressed: bool) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        key = f"{digest[:2]}/{digest}"
+        return f"{key}.gz" if compressed else key
+
+    async def put(self, data: bytes) -> ArtifactRef:
+        """Store the artifact, unless the same one is already stored."""
+        ref = ArtifactRef(
+            key=self.get_key(data, self.compression),
+            size=len(data),
+            compressed=self.compression,
+        )
+        if await asyncio.to_thread(self._exists, ref.key):
+            # The age of the shared artifact is counted from its last store
+            await asyncio.to_thread(self._touch, ref.key)
+        else:
+            payload = gzip.compress(data) if ref.compressed else data
+            await asyncio.to_thread(self._write, ref.key, payload)
+        return ref
+
+    async def get(self, ref: ArtifactRef) -> bytes:
+        """Get the content of the artifact.
+
+        Raises:
+            KeyError: If the artifact doesn't exist.
+        """
+        payload = await asyncio.to_thread(self._read, ref.key)
+        return gzip.decompress(payload) if ref.compressed else payload
+
+    @abc.abstractmethod
+    def _read(self, key: str) -> bytes:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def _write(self, key: str, payload: bytes) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def _exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def _touch(self, key: str) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def cleanup(self, before: float) -> int:
+        """Remove the artifacts last stored before the timestamp.
+
+        Returns:
+            The number of the removed artifacts.
+        """
+        raise NotImplementedError
+
+
+class LocalArtifactStore(ArtifactStore):
+    """Artifact store in the local directory.
+
+    The directory must be shared by all the workers of the scans, outputs
+    and notifications, e.g. a volume of the single host or a network one.
+    """
+
+    def __init__(self, path: str, compression: bool = True):
+        super().__init__(compression=compression)
+        self.path = pathlib.Path(path)
+
+    def _read(self, key: str) -> bytes:
+        try:
+            return (self.path / key).read_bytes()
+        except FileNotFoundError:
+            raise KeyError(key)
+
+    def _write(self, key: str, payload: bytes) -> None:
+        path = self.path / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first, so the readers never see a partial file
+        with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as file:
+            file.write(payload)
+        os.replace(file.name, path)
+
+    def _exists(self, key: str) -> bool:
+        return (self.path / key).exists()
+
+    def _touch(self, key: str) -> None:
+        os.utime(self.path / key)
+
+    def cleanup(self, before: float) -> int:
+        removed = 0
+        for path in self.path.glob("*/*"):
+            try:
+                if path.stat().st_mtime < before:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                # Removed by a concurrent cleanup
+                continue
+        return removed
+
+
+class S3ArtifactStore(ArtifactStore):
+    """Artifact store in the S3 bucket."""
+
+    def __init__(
+        self, client, bucket: str, prefix: str = "", compression: bool = True
+    ):
+        super().__init__(compression=compression)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+
+    def get_object_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def _read(self, key: str) -> bytes:
+        try:
+            response = self.client.get_object(
+                Bucket=self.bucket, Key=self.get_object_key(key)
+            )
+        except self.client.exceptions.NoSuchKey:
+            raise KeyError(key)
+        payload: bytes = response["Body"].read()
+        return payload
+
+    def _write(self, key: str, payload: bytes) -> None:
+        self.client.put_object(
+            Bucket=self.bucket, Key=self.get_object_key(key), Body=payload
+        )
+
+    def _exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.get_object_key(key))
+        except ClientError as exc:
+            if exc.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return False
+            raise
+        return True
+
+    def _touch(self, key: str) -> None:
+        # The objects can't be touched, so the object is copied onto itself
+        object_key = self.get_object_key(key)
+        self.client.copy_object(
+            Bucket=self.bucket,
+            Key=object_key,
+            CopySource={"Bucket": self.bucket, "Key": object_key},
+            MetadataDirective="REPLACE",
+        )
+
+    def cleanup(self, before: float) -> int:
+        removed = 0
+        paginator = self.client.get_paginator("list_objects_v2")
+        prefix = f"{self.prefix}/" if self.prefix else ""
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            # The listed page has up to 1000 objects, the limit of the batch delete
+            expired: List[dict] = [
+                {"Key": item["Key"]}
+                for item in page.get("Contents", [])
+                if item["LastModified"].timestamp() < before
+            ]
+            if expired:
+                self.client.delete_objects(
+                    Bucket=self.bucket, Delete={"Objects": expired, "Quiet": True}
+                )
+                removed += len(expired)
+        return removed
+
+
+@functools.lru_cache(maxsize=None)
+def get_artifact_store() -> Optional[ArtifactStore]:
+    """Get the artifact store of the settings, or None if it's disabled."""
+    if settings.artifacts_backend == "local":
+        return LocalArtifactStore(
+            settings.artifacts_path,
+            compression=settings.artifacts_compression,
+        )
+    if settings.artifacts_backend == "s3":
+        return S3ArtifactStore(
+            boto3.client("s3", endpoint_url=settings.artifacts_s3_endpoint_url),
+            # The bucket of the s3 backend is required by the settings
+            bucket=cast(str, settings.artifacts_s3_bucket),
+            prefix=settings.artifacts_s3_prefix,
+            compression=settings.artifacts_compression,
+        )
+    return None
+
+
+def cleanup_artifacts() -> int:
+    """Remove the artifacts older than the TTL, scheduled by celery beat."""
+    store = get_artifact_store()
+    if store is None or settings.artifacts_ttl <= 0:
+        return 0
+    removed = store.cleanup(time.time() - settings.artifacts_ttl)
+    logger.info(f"Removed {removed} expired artifacts")
+    return removed
@@ -0,0 +1,113 @@
+"""Typed codec of the celery task arguments and results.
+
+The pydantic models are encoded as JSON objects tagged with the short type id
+of the model, which is looked up in the table of the registered models when
+the message is decoded. Every `SecbotBaseModel` subclass is registered by its
+class name, so the models are passed between the tasks as is, without
+the dict round-trips and the imports of their classes for every value.
+
+The codec is plugged in as the `secbot` celery serializer, see
+`register_celery_serializer`. The compression of the messages is left
+to celery (the `task_compression` and `result_compression` settings).
+"""
+import json
+from typing import Any, Dict, Optional, Type, Union
+
+from kombu.serialization import register
+from pydantic import BaseModel
+from pydantic.json import pydantic_encoder
+
+from app.secbot.exceptions import SecbotCodecError
+
+CELERY_SERIALIZER = "secbot"
+CELERY_CONTENT_TYPE = "application/x-secbot+json"
+
+TYPE_KEY = "__secbot_type__"
+
+# The models of the type ids, and the type ids of the models
+_models: Dict[str, Type[BaseModel]] = {}
+_type_ids: Dict[Type[BaseModel], str] = {}
+
+# The internal field injected by `SecbotBaseModel`, not worth passing around
+_SKIPPED_FIELDS = frozenset({"__pydantic_path_model__"})
+
+
+def register_model(model: Type[BaseModel], type_id: Optional[str] = None) -> None:
+    """Register the model in the codec under the type id (its class name by default).
+
+    Raises:
+        SecbotCodecError: If another model is already registered under the type id.
+    """
+    type_id = type_id or model.__name__
+    registered = _models.get(type_id)
+    if registered is not None and (
+        registered.__module__,
+        registered.__qualname__,
+    ) != (model.__module__, model.__qualname__):
+        raise SecbotCodecError(
+            f"Type id {type_id} of {model} is already taken by {registered}"
+        )
+    _models[type_id] = model
+    _type_ids[model] = type_id
+
+
+def encode(value: Any) -> Any:
+    """Tag the registered models in the value with their type ids.
+
+    Only the containers of the models (e.g. the task arguments) are walked,
+    the fields of the models are left to the JSON encoder as is.
+    """
+    if isinstance(value, BaseModel):
+        # The models which are not registered (e.g. the webhook models) are
+        # encoded as plain objects, as they are parsed by the fields of their parents
+        type_id = _type_ids.get(type(value))
+        encoded = {} if type_id is None else {TYPE_KEY: type_id}
+        for key, item in value.__dict__.items():
+            if key not in _SKIPPED_FIELDS:
+                encoded[key] = item
+        return encoded
+    if isinstance(value, dict):
+        return {key: encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode(item) for item in value]
+    return value
+
+
+def decode(value: Any) -> Any:
+    """Convert the tagged objects back into the registered models."""
+    if isinstance(value, dict):
+        type_id = value.pop(TYPE_KEY, None)
+        if type_id is None:
+            return {key: decode(item) for key, item in value.items()}
+        try:
+            model = _models[type_id]
+        except KeyError:
+            raise SecbotCodecError(f"Unknown type id {type_id}")
+        # The nested models are validated by the fields of the model
+        return model.parse_obj(value)
+    if isinstance(value, list):
+        return [decode(item) for item in value]
+    return value
+
+
+def dumps(value: Any) -> bytes:
+    """Encode the value into the message body."""
+    return json.dumps(
+        encode(value), default=pydantic_encoder, separators=(",", ":")
+    ).encode()
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Decode the message body encoded with `dumps`."""
+    return decode(json.loads(data))
+
+
+def register_celery_serializer() -> None:
+    """Register the codec as the `secbot` serializer of celery (kombu)."""
+    register(
+        CELERY_SERIALIZER,
+        dumps,
+        loads,
+        content_type=CELERY_CONTENT_TYPE,
+        content_encoding="binary",
+    )
@@ -1,15 +1,23 @@
 from __future__ import annotations
 
+import hashlib
+import json
 import os
 import pathlib
 import re
+import threading
+import time
 from collections import defaultdict
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, List, Optional
 
 import yaml
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 
+from app.metrics.common import get_location_labels_from_env
+from app.metrics.config import SECBOT_CONFIG_RELOAD_ERRORS, SECBOT_CONFIG_VERSION
 from app.secbot.exceptions import SecbotConfigError, SecbotConfigMissingEnv
+from app.secbot.jsonpath import compile_jsonpath
+from app.secbot.logger import logger
 
 ConfigInputName = str
 
@@ -20,6 +28,74 @@ class SecbotConfigComponent(BaseModel):
     handler_name: str
     config: Optional[Dict[str, Any]] = None
     env: Optional[Dict[str, Any]] = None
+    # Queue of the component tasks, overrides the queue of the handler stage
+    queue: Optional[str] = None
+    # Number of the concurrent requests of the handler to its external service
+    # across all the workers, see `app.secbot.limits`. 0 disables the limit.
+    concurrency: int = 0
+
+
+# Regex metacharacters, a rule without them matches only the literal value.
+REGEX_METACHARACTERS = frozenset(".^$*+?{}[]\\|()")
+
+
+def stringify_rule_value(value: Any) -> Optional[str]:
+    """Get the string of the value to match with the rule regex, if it's a scalar."""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)):
+        return str(value)
+    return None
+
+
+class JobRule:
+    """A rule of the workflow job compiled at the config load time.
+
+    The JSONPath is compiled into the accessor of its values, and the regex
+    is precompiled. A path with wildcards (e.g. `labels[*].title`) may have
+    several values: the rule matches if any of them matches, or if all of
+    them match with the `all:` prefix of the path (e.g. `all:commits[*].author.email`).
+
+    The rules without regex metacharacters (e.g. `event_type: merge_request`)
+    keep their literal value, so the jobs can be indexed by it.
+    """
+
+    __slots__ = ("path", "quantifier", "accessor", "pattern", "literal")
+
+    def __init__(self, path: str, regex: str):
+        self.path = path
+        self.quantifier = any
+        jsonpath = path
+        if path.startswith(("any:", "all:")):
+            self.quantifier = all if path.startswith("all:") else any
+            jsonpath = path[4:]
+        try:
+            self.accessor = compile_jsonpath(jsonpath)
+        except ValueError as exc:
+            raise SecbotConfigError(f"Invalid path of rule {path}: {exc}")
+        try:
+            self.pattern = re.compile(regex)
+        except re.error as exc:
+            raise SecbotConfigError(f"Invalid regex {regex!r} of rule {path}: {exc}")
+        self.literal = None if REGEX_METACHARACTERS & set(regex) else regex
+
+    def values(self, data: dict) -> List[str]:
+        """Get the scalar values of the rule path from the data."""
+        return [
+            value
+            for value in map(stringify_rule_value, self.accessor(data))
+            if value is not None
+        ]
+
+    def matches(self, data: dict) -> bool:
+        values = self.values(data)
+        if not values:
+            # The event doesn't have the value at all, e.g. `event_type`
+            # exists only in merge request events.
+            return False
+        return self.quantifier(
+            self.pattern.fullmatch(value) is not None for value in values
+        )
 
 
 # Represents a job in the Secbot workflow.
@@ -31,24 +107,22 @@ class WorkflowJob(BaseModel):
     outputs: List[SecbotConfigComponent]
     notifications: Optional[List[SecbotConfigComponent]] = None
 
+    _compiled_rules: Optional[List[JobRule]] = PrivateAttr(default=None)
 
-def get_jsonpath_value(event_raw: dict, path: str):
-    """Fetches a value from a dictionary by JSONPath.
+    @property
+    def compiled_rules(self) -> List[JobRule]:
+        if self._compiled_rules is None:
+            self._compiled_rules = [
+                JobRule(path, regex) for path, regex in (self.rules or {}).items()
+            ]
+        return self._compiled_rules
 
-    Args:
-        event_raw (dict): Dictionary to fetch value from.
-        path (str): JSONPath specifying value location.
-    Returns:
-        The value specified by the JSONPath.
-    """
-    try:
-        key, rest_keys = path.split(".", 1)
-        value = event_raw[key]
-        if isinstance(value, dict):
-            return get_jsonpath_value(value, rest_keys)
-    except ValueError:
-        key = path
-    return event_raw[key]
+
+def unique_components(
+    components: Iterable[SecbotConfigComponent],
+) -> List[SecbotConfigComponent]:
+    """Get the components by unique names, e.g. the scans of several jobs."""
+    return list({component.name: component for component in components}.values())
 
 
 def is_job_valid_for_rules(job: WorkflowJob, data: dict) -> bool:
@@ -60,14 +134,67 @@ def is_job_valid_for_rules(job: WorkflowJob, data: dict) -> bool:
     Returns:
         bool: True if job's rules match the data.
     """
-    if not (rules := job.rules or {}):
-        return True
+    return all(rule.matches(data) for rule in job.compiled_rules)
 
-    for jsonpath, rule_regex in rules.items():
-        value = get_jsonpath_value(data, jsonpath)
-        if re.fullmatch(rule_regex, value) is None:
-            return False
-    return True
+
+def may_job_match_rules(job: WorkflowJob, data: dict) -> bool:
+    """Checks the rules of the job with values in the data, skipping the others.
+
+    E.g. the merge request job may match the push event data by the rules
+    of the project, while the rules of the merge request can't be checked.
+    """
+    return all(rule.matches(data) for rule in job.compiled_rules if rule.values(data))
+
+
+class WorkflowJobsIndex:
+    """Index of the jobs of an input by their literal rules.
+
+    Every job with a literal rule is indexed by the path and the value of
+    its most common literal rule path (e.g. `event_type`). The candidate jobs
+    of an event are found by a dict lookup per indexed path instead of
+    checking all the rules of every job.
+    """
+
+    def __init__(self, jobs: List[WorkflowJob]):
+        self.positions = {id(job): position for position, job in enumerate(jobs)}
+        self.unindexed: List[WorkflowJob] = []
+        self.indexed: Dict[JobRule, Dict[str, List[WorkflowJob]]] = {}
+
+        paths_counter: Dict[str, int] = defaultdict(int)
+        for job in jobs:
+            for rule in job.compiled_rules:
+                if rule.literal is not None:
+                    paths_counter[rule.path] += 1
+
+        by_path: Dict[str, JobRule] = {}
+        for job in jobs:
+            literal_rules = [
+                (rule, rule.literal)
+                for rule in job.compiled_rules
+                if rule.literal is not None
+            ]
+            if not literal_rules:
+                self.unindexed.append(job)
+                continue
+            rule, literal = max(
+                literal_rules, key=lambda item: paths_counter[item[0].path]
+            )
+            index_rule = by_path.setdefault(rule.path, rule)
+            self.indexed.setdefault(index_rule, defaultdict(list))[literal].append(job)
+
+    def candidates(self, data: dict) -> List[WorkflowJob]:
+        """Get the jobs that may match the data, in the order of the config."""
+        candidates = {id(job): job for job in self.unindexed}
+        for rule, jobs_by_value in self.indexed.items():
+            for value in rule.values(data):
+                for job in jobs_by_value.get(value, ()):
+                    candidates[id(job)] = job
+        return sorted(candidates.values(), key=lambda job: self.positions[id(job)])
+
+    def matching(self, data: dict) -> List[WorkflowJob]:
+        return [
+            job for job in self.candidates(data) if is_job_valid_for_rules(job, data)
+        ]
 
 
 def config_parser(obj: dict) -> Dict[ConfigInputName, List[WorkflowJob]]:
@@ -94,6 +221,8 @@ def config_parser(obj: dict) -> Dict[ConfigInputName, List[WorkflowJob]]:
             name=component_name,
             config=component_data.get("config"),
             env=parsed_env or None,
+            queue=component_data.get("queue"),
+            concurrency=component_data.get("concurrency", 0),
         )
 
     if not components:
@@ -109,16 +238,18 @@ def config_parser(obj: dict) -> Dict[ConfigInputName, List[WorkflowJob]]:
         job_notifications = [components[name] for name in job["notifications"]]
 
         for input_name in set(rules.keys()):
-            jobs[input_name].append(
-                WorkflowJob(
-                    name=job["name"],
-                    input_name=input_name,
-                    rules=rules[input_name],
-                    scans=job_scans,
-                    outputs=job_outputs,
-                    notifications=job_notifications,
-                )
+            workflow_job = WorkflowJob(
+                name=job["name"],
+                input_name=input_name,
+                rules=rules[input_name],
+                scans=job_scans,
+                outputs=job_outputs,
+                notifications=job_notifications,
             )
+            # Compile the rules at the load time, so the invalid regexes
+            # are reported right away, and the events don't pay for it.
+            workflow_job.compiled_rules
+            jobs[input_name].append(workflow_job)
     if not jobs:
         raise SecbotConfigError("No jobs found in config")
     return jobs
@@ -129,7 +260,7 @@ class SecbotConfig:
 
     Methods:
     - from_yml_file: Load configuration from a YAML file.
-    - matching_workflow_job: Returns matching jobs.
+    - matching_workflow_jobs: Returns matching jobs.
     """
 
     # A dictionary that maps configuration version numbers to their corresponding
@@ -168,31 +299,146 @@ class SecbotConfig:
             raise SecbotConfigError(f"Unsupported config version: {version}")
 
         self.jobs: Dict[ConfigInputName, List[WorkflowJob]] = parser(config_obj)
-
-    def matching_workflow_job(
+        # Short digest of the configuration content to tell its revisions apart
+        self.version = hashlib.sha256(
+            json.dumps(config_obj, sort_keys=True, default=str).encode()
+        ).hexdigest()[:12]
+        self.jobs_index: Dict[ConfigInputName, WorkflowJobsIndex] = {
+            input_name: WorkflowJobsIndex(jobs)
+            for input_name, jobs in self.jobs.items()
+        }
+
+    def matching_workflow_jobs(
         self,
         input_name: ConfigInputName,
         data: Dict[str, Any],
-    ) -> Optional[WorkflowJob]:
-        """Returns the job that matches a given input name and data.
-        Currently, only one job per data is supported.
+    ) -> List[WorkflowJob]:
+        """Returns the jobs that match a given input name and data.
+
+        Every matching job is dispatched independently for the event.
 
         Args:
             input_name (ConfigInputName): Input name to match.
             data (Dict[str, Any]): Data to match against.
         Returns:
-            Optional[WorkflowJob]: Matching job, if exists; None otherwise.
+            List[WorkflowJob]: Matching jobs in the order of the config.
         """
-        ret = [
-            job for job in self.jobs[input_name] if is_job_valid_for_rules(job, data)
-        ]
-        # TODO(ivan.zhirov): Currently, we only support one job per data.
-        #                    Consider changing this in the future.
-        if len(ret) > 1:
-            raise SecbotConfigError(
-                f"Multiple jobs found for input {input_name} and data {data}"
+        jobs_index = self.jobs_index.get(input_name)
+        return jobs_index.matching(data) if jobs_index else []
+
+
+class ReloadableSecbotConfig:
+    """The Secbot configuration file that is reloaded when it changes.
+
+    The new configuration is parsed and validated aside, and then swapped in
+    by a single assignment, so the readers see either the old or the new one.
+    An invalid configuration is reported and ignored, the old one stays active.
+
+    The workflows that have already been dispatched are not affected: their
+    tasks carry the components configuration they were dispatched with.
+
+    The file is loaded on first use, so the processes that don't match
+    the workflows (e.g. the workers) don't parse it.
+    """
+
+    def __init__(self, config_path: str):
+        base_path = pathlib.Path(os.path.dirname(__file__))
+        self.path = base_path / config_path
+        self._lock = threading.RLock()
+        self._watcher: Optional[threading.Thread] = None
+        self._mtime: Optional[int] = None
+        self._current: Optional[SecbotConfig] = None
+
+    def load(self) -> SecbotConfig:
+        """Load the configuration file, unless it has been loaded already."""
+        if self._current is None:
+            with self._lock:
+                if self._current is None:
+                    self._mtime = self.path.stat().st_mtime_ns
+                    self._current = SecbotConfig.from_yml_file(str(self.path))
+                    set_config_version(self._current.version)
+        return self._current
+
+    @property
+    def current(self) -> SecbotConfig:
+        return self.load()
+
+    @property
+    def version(self) -> str:
+        return self.current.version
+
+    @property
+    def jobs(self) -> Dict[ConfigInputName, List[WorkflowJob]]:
+        return self.current.jobs
+
+    def matching_workflow_jobs(
+        self,
+        input_name: ConfigInputName,
+        data: Dict[str, Any],
+    ) -> List[WorkflowJob]:
+        return self.current.matching_workflow_jobs(input_name, data)
+
+    def reload(self, force: bool = False) -> bool:
+        """Reload the configuration file if it has been changed.
+
+        Args:
+            force (bool): Reload the file even if its mtime hasn't changed.
+        Returns:
+            bool: True if another configuration has been swapped in.
+        Raises:
+            SecbotConfigError: If the new configuration is invalid.
+        """
+        with self._lock:
+            current = self.load()
+            mtime = self.path.stat().st_mtime_ns
+            if not force and mtime == self._mtime:
+                return False
+            # Don't retry the same broken file until it's changed again
+            self._mtime = mtime
+            try:
+                new_config = SecbotConfig.from_yml_file(str(self.path))
+            except SecbotConfigError:
+                raise
+            except Exception as exc:
+                raise SecbotConfigError(f"Failed to load {self.path}: {exc}")
+
+            if new_config.version == current.version:
+                return False
+            previous_version = current.version
+            self._current = new_config
+            set_config_version(new_config.version, previous_version)
+            logger.info(
+                f"Config has been reloaded: {previous_version} -> {new_config.version}"
             )
-        return next(iter(ret), None)
+            return True
+
+    def watch(self, interval: int) -> None:
+        """Start the thread checking the configuration file every `interval` seconds."""
+        if interval <= 0 or (self._watcher and self._watcher.is_alive()):
+            return
+
+        def watcher():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reload()
+                except SecbotConfigError as exc:
+                    SECBOT_CONFIG_RELOAD_ERRORS.labels(
+                        **get_location_labels_from_env()
+                    ).inc()
+                    logger.error(f"Config has not been reloaded: {exc}")
+
+        self._watcher = threading.Thread(
+            target=watcher, name="secbot-config-watcher", daemon=True
+        )
+        self._watcher.start()
+
+
+def set_config_version(version: str, previous_version: Optional[str] = None) -> None:
+    labels = get_location_labels_from_env()
+    if previous_version is not None:
+        SECBOT_CONFIG_VERSION.labels(**labels, version=previous_version).set(0)
+    SECBOT_CONFIG_VERSION.labels(**labels, version=version).set(1)
 
 
-config = SecbotConfig.from_yml_file("../config.yml")
+config = ReloadableSecbotConfig("../config.yml")
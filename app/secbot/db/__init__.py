@@ -12,9 +12,9 @@ engine = create_async_engine(
     settings.postgres_dsn,
     poolclass=AsyncAdaptedQueuePool,
     pool_pre_ping=True,
-    pool_size=5,
+    pool_size=settings.postgres_pool_size,
     pool_recycle=5 * 60,  # 5 minutes
-    max_overflow=5,
+    max_overflow=settings.postgres_max_overflow,
     pool_timeout=10,
     connect_args={"server_settings": {"jit": "off"}},
     echo=False,
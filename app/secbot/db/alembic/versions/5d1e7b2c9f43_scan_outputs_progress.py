@@ -0,0 +1,29 @@
+"""scan outputs progress
+
+Revision ID: 5d1e7b2c9f43
+Revises: 8c2f4e1d7a90
+Create Date: 2026-10-17 11:40:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "5d1e7b2c9f43"
+down_revision = "8c2f4e1d7a90"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "repository_security_scan",
+        sa.Column(
+            "outputs_progress", postgresql.JSON(astext_type=sa.Text()), nullable=True
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("repository_security_scan", "outputs_progress")
@@ -0,0 +1,58 @@
+"""check notifications
+
+Revision ID: 8c2f4e1d7a90
+Revises: 3611bb3d9dd2
+Create Date: 2026-10-17 07:20:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "8c2f4e1d7a90"
+down_revision = "3611bb3d9dd2"
+branch_labels = None
+depends_on = None
+
+security_check_status = sa.Enum(
+    "NOT_STARTED",
+    "IN_PROGRESS",
+    "ERROR",
+    "FAIL",
+    "SUCCESS",
+    name="securitycheckstatus",
+)
+
+
+def upgrade() -> None:
+    security_check_status.create(op.get_bind(), checkfirst=True)
+    op.add_column(
+        "repository_security_check",
+        sa.Column("status", security_check_status, nullable=True),
+    )
+    op.add_column(
+        "slack_notifications",
+        sa.Column("check_id", sa.Integer(), nullable=True),
+    )
+    op.create_foreign_key(
+        "slack_notifications_check_id_fkey",
+        "slack_notifications",
+        "repository_security_check",
+        ["check_id"],
+        ["id"],
+    )
+    op.alter_column(
+        "slack_notifications", "scan_id", existing_type=sa.Integer(), nullable=True
+    )
+
+
+def downgrade() -> None:
+    op.alter_column(
+        "slack_notifications", "scan_id", existing_type=sa.Integer(), nullable=False
+    )
+    op.drop_constraint(
+        "slack_notifications_check_id_fkey", "slack_notifications", type_="foreignkey"
+    )
+    op.drop_column("slack_notifications", "check_id")
+    op.drop_column("repository_security_check", "status")
+    security_check_status.drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,26 @@
+"""scan mode
+
+Revision ID: b7e3d91a4c62
+Revises: 5d1e7b2c9f43
+Create Date: 2026-10-17 15:20:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "b7e3d91a4c62"
+down_revision = "5d1e7b2c9f43"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "repository_security_scan",
+        sa.Column("mode", sa.String(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("repository_security_scan", "mode")
@@ -0,0 +1,27 @@
+"""security check scan names
+
+Revision ID: c4f8a2d6e913
+Revises: b7e3d91a4c62
+Create Date: 2026-10-17 18:40:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "c4f8a2d6e913"
+down_revision = "b7e3d91a4c62"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "repository_security_check",
+        sa.Column("scan_names", postgresql.JSON(astext_type=sa.Text()), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("repository_security_check", "scan_names")
@@ -0,0 +1,27 @@
+"""superseded scan status
+
+Revision ID: d2b7e5f1a8c4
+Revises: c4f8a2d6e913
+Create Date: 2026-10-17 20:10:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "d2b7e5f1a8c4"
+down_revision = "c4f8a2d6e913"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("ALTER TYPE scanstatus ADD VALUE IF NOT EXISTS 'SUPERSEDED'")
+
+
+def downgrade() -> None:
+    # The values of the enum type can't be dropped, the scans are only
+    # marked as skipped as they were before
+    op.execute(
+        "UPDATE repository_security_scan SET status = 'SKIP' "
+        "WHERE status = 'SUPERSEDED'"
+    )
@@ -0,0 +1,49 @@
+from redis import asyncio as aioredis
+
+from app.secbot.redis import get_redis
+from app.secbot.settings import settings
+
+
+class DispatchDeduplicator:
+    """Dispatch-time deduplication of the security checks.
+
+    GitLab re-delivers webhooks, and many events (e.g. MR approvals) keep the
+    same last commit, so the same security check is dispatched again and again.
+    The first dispatch of a security check marks it in Redis with a TTL,
+    and the following dispatches are suppressed until the mark expires
+    or is released (e.g. when the scan has failed and may be retried).
+    """
+
+    key_prefix = "secbot:dispatch"
+
+    def __init__(self, redis: aioredis.Redis, ttl: int):
+        self.redis = redis
+        self.ttl = ttl
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def key(self, security_id: str) -> str:
+        return f"{self.key_prefix}:{security_id}"
+
+    async def acquire(self, security_id: str) -> bool:
+        """Mark the security check as dispatched.
+
+        Returns:
+            False if the security check has already been dispatched.
+        """
+        if not self.enabled:
+            return True
+        return bool(
+            await self.redis.set(self.key(security_id), "1", nx=True, ex=self.ttl)
+        )
+
+    async def release(self, security_id: str) -> None:
+        """Allow the security check to be dispatched again."""
+        if self.enabled:
+            await self.redis.delete(self.key(security_id))
+
+
+def get_dispatch_deduplicator() -> DispatchDeduplicator:
+    return DispatchDeduplicator(get_redis(), ttl=settings.dispatch_dedupe_ttl)
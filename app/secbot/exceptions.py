@@ -27,10 +27,34 @@ class ScanExecutionSkipped(SecbotException):
     """
 
 
+class ScanExecutionSuperseded(ScanExecutionSkipped):
+    """Raises when the commit of the scan is superseded by a newer one.
+
+    Unlike the other skipped scans, the superseded ones are scanned again
+    if their commit is dispatched again (e.g. by the force push back to it).
+    """
+
+
+class DispatchShed(SecbotException):
+    """Raises when a workflow is not dispatched because the workers are overloaded."""
+
+
+class ConcurrencyLimitTimeout(SecbotException):
+    """Raises when a slot of the concurrency limit is not acquired in time."""
+
+
 class SecbotInputError(SecbotException):
     """Base exception for all input exceptions."""
 
 
+class ArtifactStoreDisabled(SecbotException):
+    """Raises when an artifact is read while the artifact store is disabled."""
+
+
+class SecbotCodecError(SecbotException):
+    """Raises when the task arguments can't be encoded or decoded by the codec."""
+
+
 class SecbotConfigError(SecbotException):
     """This exception is raised when the configuration is invalid.
 
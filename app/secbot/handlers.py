@@ -1,19 +1,25 @@
 import abc
-import asyncio
 import functools
-from typing import List, Optional, Type
+from typing import Awaitable, Callable, List, Optional, Type
 
-from celery import Celery
+from celery import Celery, Task
 from pydantic import BaseModel
 
 from app.secbot import utils
 from app.secbot.config import SecbotConfigComponent
+from app.secbot.limits import get_handler_limit, with_handler_limit
+from app.secbot.logger import logger
+from app.secbot.runtime import run_in_runtime
+from app.secbot.schemas import SecbotContinuation, SecbotFailedResult
+from app.secbot.settings import settings
 
 
 def pydantic_celery_converter(func):
     """Decorator for asynchronous functions that use Pydantic models in their inputs or outputs.
-    Serializes Pydantic models before the function is called and deserializes
-    them after the function returns.
+
+    The models are passed between the tasks as is by the `secbot` celery
+    serializer (see `app.secbot.codec`). The arguments of the messages
+    published in the legacy JSON format are converted back into the models.
 
     Args:
         func: The asynchronous function to decorate.
@@ -23,12 +29,25 @@ def pydantic_celery_converter(func):
 
     @functools.wraps(func)
     async def wrapper(*args, **kwargs):
-        ret = await func(*utils.serializer(args), **utils.serializer(kwargs))
-        return utils.deserializer(ret)
+        return await func(*utils.serializer(args), **utils.serializer(kwargs))
 
     return wrapper
 
 
+def get_stage_queue(stage: str) -> Optional[str]:
+    """Get the queue of the tasks of the workflow stage, None for the default queue.
+
+    Args:
+        stage: The stage of the workflow, one of "scans", "outputs", "notifications".
+    """
+    queues = {
+        "scans": settings.scans_queue,
+        "outputs": settings.outputs_queue,
+        "notifications": settings.notifications_queue,
+    }
+    return queues[stage] or None
+
+
 class SecbotHandler(abc.ABC):
     """Abstract base class for SecbotHandler.
     It provides a unified interface for creating handlers
@@ -40,35 +59,74 @@ class SecbotHandler(abc.ABC):
         celery_app: Celery application instance for managing asynchronous tasks.
         config_name: The name of the configuration for the handler.
         task: The Celery task corresponding to the handler.
+        stage: The stage of the workflow the handler runs at,
+            its tasks are routed to the queue of the stage.
+        io_bound: Whether the handler mostly waits for the I/O, so its tasks
+            may run in the async worker (see `app.secbot.runtime`).
     """
 
     config_model: Optional[Type[BaseModel]] = None
     env_model: Optional[Type[BaseModel]] = None
+    stage: Optional[str] = None
+    io_bound: bool = False
 
     def __init__(self, celery_app: Celery, config_name: str):
         self.celery_app = celery_app
         self.config_name = config_name
 
-        def async_celery_task(*args, **kwargs):
+        def async_celery_task(
+            task: Task,
+            *args,
+            fan_in: bool = False,
+            continuation: Optional[SecbotContinuation] = None,
+            concurrency: int = 0,
+            **kwargs,
+        ):
             """Wrapper function that calls the handler's `run` method
-            in an asyncio event loop.
+            (or the step of the continuation) in the event loop
+            of the worker runtime, with the distributed concurrency limit
+            of the handler (see `app.secbot.limits`).
 
             This function is used as the Celery task for this handler.
             """
-            loop = asyncio.get_event_loop()
-            return loop.run_until_complete(
-                pydantic_celery_converter(self.run)(*args, **kwargs)
+            run = self.run
+            if continuation is not None:
+                run = functools.partial(
+                    getattr(self, continuation.step), **continuation.state
+                )
+            if fan_in:
+                run = functools.partial(self.run_fan_in_part, run)
+            limit = get_handler_limit(self.config_name, concurrency)
+            result = run_in_runtime(
+                with_handler_limit(
+                    pydantic_celery_converter(run)(*args, **kwargs), limit
+                ),
+                limit_key=self.config_name,
             )
+            if isinstance(result, SecbotContinuation):
+                return self.replace_with_continuation(
+                    task,
+                    result,
+                    *args,
+                    fan_in=fan_in,
+                    concurrency=concurrency,
+                    **kwargs,
+                )
+            return result
 
         def async_error_handler(task, exc, task_id, args, kwargs, einfo):
             """
             Error handler that calls the handler's `on_failure` method in
-            an asyncio event loop in case of task failure.
+            the event loop of the worker runtime in case of task failure.
 
             This function is set as the `on_failure` callback for the Celery task.
             """
-            loop = asyncio.get_event_loop()
-            loop.run_until_complete(
+            kwargs = {
+                key: value
+                for key, value in kwargs.items()
+                if key not in ("fan_in", "continuation", "concurrency")
+            }
+            run_in_runtime(
                 pydantic_celery_converter(self.on_failure)(
                     *args,
                     exception=exc,
@@ -76,12 +134,65 @@ class SecbotHandler(abc.ABC):
                 )
             )
 
+        task_options = {}
+        queue = self.get_queue()
+        if queue:
+            task_options["queue"] = queue
+
         generate_task_name = f"secbot.handler.{self.config_name}"
         self.task = self.celery_app.task(
             name=generate_task_name,
+            bind=True,
             on_failure=async_error_handler,
+            **task_options,
         )(async_celery_task)
 
+    def get_queue(self) -> Optional[str]:
+        """Get the queue of the handler tasks, None for the default queue.
+
+        The components of the handler may override it in the config.
+        """
+        if self.io_bound and settings.async_handlers_queue:
+            return settings.async_handlers_queue
+        if self.stage is not None:
+            return get_stage_queue(self.stage)
+        return None
+
+    def continue_later(
+        self, step: str, countdown: float = 0, **state
+    ) -> SecbotContinuation:
+        """Continue the handler with the step in the next task.
+
+        The handler returns the continuation instead of waiting for
+        the external service, e.g. for the processing of the uploaded report,
+        so the worker is free to run the other tasks in the meantime.
+        The result of the last step is passed down the workflow.
+
+        Args:
+            step: The name of the method of the handler to continue with,
+                it's called with the arguments of the task and the state.
+            countdown: Number of seconds to delay the step.
+            state: Keyword arguments passed to the step.
+        """
+        return SecbotContinuation(step=step, countdown=countdown, state=state)
+
+    def replace_with_continuation(
+        self, task: Task, continuation: SecbotContinuation, *args, **kwargs
+    ):
+        """Replace the task with the delayed task of the continuation step.
+
+        The replacing task inherits the id and the callbacks of the task,
+        so the rest of the workflow (e.g. the notifications of the output,
+        or the fan-in chord) goes on with the result of the last step.
+        """
+        signature = task.si(*args, continuation=continuation, **kwargs)
+        signature.set(countdown=continuation.countdown)
+        # The component may be routed to its own queue in the config
+        queue = (task.request.delivery_info or {}).get("routing_key")
+        if queue:
+            signature.set(queue=queue)
+        return task.replace(signature)
+
     async def on_failure(self, *args, **kwargs):
         """Async handler for task failure.
 
@@ -92,6 +203,34 @@ class SecbotHandler(abc.ABC):
             kwargs: Keyword arguments passed to the task that failed.
         """
 
+    async def run_fan_in_part(
+        self, run: Callable[..., Awaitable], *args, component_name: str, **kwargs
+    ):
+        """Run the handler (or its continuation step) as a part
+        of the notifications fan-in.
+
+        The failure is handled right away and passed down the workflow
+        as the result, so the fan-in gets the results of all the scans.
+        The steps after the failed one just pass its result through.
+        """
+        if args and isinstance(args[0], SecbotFailedResult):
+            return args[0]
+        try:
+            return await run(*args, component_name=component_name, **kwargs)
+        except Exception as exc:
+            logger.exception(f"Handler {component_name} has failed")
+            try:
+                await self.on_failure(
+                    *args, exception=exc, component_name=component_name, **kwargs
+                )
+            except Exception:
+                logger.exception(f"Failure of handler {component_name} is not handled")
+            return SecbotFailedResult(
+                handler_name=self.config_name,
+                component_name=component_name,
+                error=repr(exc),
+            )
+
     @abc.abstractmethod
     async def run(self, *args, **kwargs):
         """Abstract method representing the main logic of the handler.
@@ -114,6 +253,8 @@ class SecbotScanHandler(SecbotHandler, abc.ABC):
     Scan handlers are responsible for performing security scans.
     """
 
+    stage = "scans"
+
 
 class SecbotOutputHandler(SecbotHandler, abc.ABC):
     """Abstract base class for SecbotOutputHandler. It inherits from SecbotHandler
@@ -123,6 +264,9 @@ class SecbotOutputHandler(SecbotHandler, abc.ABC):
     and outputting them to the specified destination.
     """
 
+    stage = "outputs"
+    io_bound = True
+
     @abc.abstractmethod
     async def fetch_status(
         self,
@@ -156,3 +300,6 @@ class SecbotNotificationHandler(SecbotHandler, abc.ABC):
     Notification handlers are responsible for sending notifications based
     on the results of the security checks.
     """
+
+    stage = "notifications"
+    io_bound = True
@@ -1,24 +1,38 @@
 import abc
-import importlib
-import inspect
-import os
-import pkgutil
-from typing import Iterator, List, Type, Union
+from typing import Any, Iterator, List, Optional, Type, Union, cast
 
 from celery import Celery
-from celery.canvas import Signature, chain, group
+from celery.canvas import Signature, chain, chord, group
+from celery.result import AsyncResult
 
-from app.secbot import utils
-from app.secbot.config import SecbotConfigComponent, WorkflowJob
-from app.secbot.exceptions import SecbotInputError
+from app.metrics.common import get_location_labels_from_env
+from app.metrics.dispatch import SECBOT_DISPATCH_ADMISSION
+from app.secbot.admission import AdmissionDecision, get_admission_controller
+from app.secbot.config import SecbotConfigComponent, WorkflowJob, unique_components
+from app.secbot.exceptions import DispatchShed, SecbotInputError
 from app.secbot.handlers import (
     SecbotHandler,
     SecbotNotificationHandler,
     SecbotOutputHandler,
     SecbotScanHandler,
+    get_stage_queue,
+    pydantic_celery_converter,
 )
 from app.secbot.logger import logger
-from app.secbot.schemas import ScanStatus, SecurityCheckStatus
+from app.secbot.plugins import LazyRegistry, get_manifest
+from app.secbot.runtime import run_in_runtime
+from app.secbot.scheduler import SchedulerPriority, get_fair_scheduler
+from app.secbot.schemas import SecurityCheckStatus
+from app.secbot.settings import settings
+
+
+def iter_fan_in_results(results) -> Iterator:
+    """Iterate over the results of the fan-in chord, flattening the groups."""
+    for result in results or ():
+        if isinstance(result, (list, tuple)):
+            yield from iter_fan_in_results(result)
+        elif result is not None:
+            yield result
 
 
 class SecbotInput(abc.ABC):
@@ -29,51 +43,79 @@ class SecbotInput(abc.ABC):
     Attributes:
         config_name: The name of the configuration for the input.
         celery_app: Celery application instance for managing asynchronous tasks.
-        scans: Dictionary of registered scan handlers.
-        outputs: Dictionary of registered output handlers.
-        notifications: Dictionary of registered notification handlers.
+        scans: Registry of the scan handlers.
+        outputs: Registry of the output handlers.
+        notifications: Registry of the notification handlers.
     """
 
     def __init__(self, config_name: str, celery_app: Celery):
         self.config_name = config_name
         self.celery_app = celery_app
-        self.scans = {}
-        self.outputs = {}
-        self.notifications = {}
+        self.scans = LazyRegistry(self.create_handler)
+        self.outputs = LazyRegistry(self.create_handler)
+        self.notifications = LazyRegistry(self.create_handler)
+
+        def fan_in_celery_task(results, *args, notifications: List[dict], **kwargs):
+            """Wrapper function that calls the input's `fan_in` method
+            in the event loop of the worker runtime, and sends the aggregated result
+            to the notifications.
+
+            This function is used as the Celery task of the chord body.
+            """
+            check_result = run_in_runtime(
+                pydantic_celery_converter(self.fan_in)(results, *args, **kwargs)
+            )
+            if check_result is not None and notifications:
+                group(
+                    [self.celery_app.signature(item) for item in notifications]
+                ).apply_async(args=(check_result,))
+            return check_result
+
+        fan_in_options = {}
+        notifications_queue = get_stage_queue("notifications")
+        if notifications_queue:
+            fan_in_options["queue"] = notifications_queue
+        self.fan_in_task = self.celery_app.task(
+            name=f"secbot.input.{self.config_name}.fan_in", **fan_in_options
+        )(fan_in_celery_task)
+
+        def release_celery_task() -> int:
+            """Release the queued workflows of the input, scheduled by celery beat."""
+            return run_in_runtime(self.release())
+
+        self.release_task = self.celery_app.task(
+            name=f"secbot.input.{self.config_name}.release",
+            ignore_result=True,
+            **fan_in_options,
+        )(release_celery_task)
 
         self.autodiscover()
 
+    @property
+    def scans_queue(self) -> str:
+        """Queue of the scan tasks, its depth is the load of the workers."""
+        return get_stage_queue("scans") or self.celery_app.conf.task_default_queue
+
     def autodiscover(self):
         """
-        Automatically discover all available handlers (scans, outputs, notifications)
-        from the handlers module associated with this input, and register them.
+        Declare the handlers (scans, outputs, notifications) of this input
+        listed by the plugins manifest. The handlers are imported and registered
+        on first use, see `app.secbot.plugins`.
         """
-        try:
-            base_package = f"app.secbot.inputs.{self.config_name}.handlers"
-            base_path = os.path.dirname(
-                __import__(base_package, fromlist=[""]).__file__
-            )
-        except ModuleNotFoundError:
+        entry = get_manifest().inputs.get(self.config_name)
+        if entry is None:
             logger.warning(f"Could not find handlers for {self.config_name}")
             return
 
-        handlers_cls = [
-            SecbotScanHandler,
-            SecbotOutputHandler,
-            SecbotNotificationHandler,
-        ]
-        for _, package_name, _ in pkgutil.iter_modules([base_path]):
-            full_package_name = f"{base_package}.{package_name}"
-            try:
-                module = importlib.import_module(full_package_name)
-            except ImportError as e:
-                logger.warning(
-                    f"Could not import {full_package_name}. Error: {str(e)}"
-                )
-                continue
-            for name, cls in inspect.getmembers(module, inspect.isclass):
-                if issubclass(cls, tuple(handlers_cls)) and cls not in handlers_cls:
-                    self.register_handler(package_name, cls)
+        for components_group, handlers in entry.handlers.items():
+            registry = getattr(self, components_group)
+            for handler_name, handler_entry in handlers.items():
+                registry.declare(handler_name, handler_entry)
+
+    def load_handlers(self):
+        """Import and register all the declared handlers, e.g. in the worker."""
+        for registry in (self.scans, self.outputs, self.notifications):
+            registry.load_all()
 
     def register_handler(
         self,
@@ -99,67 +141,291 @@ class SecbotInput(abc.ABC):
         else:
             raise SecbotInputError(f"Handler {handler} is not a valid Secbot handler")
 
-        components_group[handler_name] = handler(
+        components_group[handler_name] = self.create_handler(handler_name, handler)
+
+    def create_handler(
+        self, handler_name: str, handler: Type[SecbotHandler]
+    ) -> SecbotHandler:
+        return handler(
             config_name=handler_name,
             celery_app=self.celery_app,
         )
 
+    def build_component_task(
+        self,
+        components_group: str,
+        item: SecbotConfigComponent,
+        *component_args,
+        **component_kwargs,
+    ) -> Signature:
+        """Build the celery signature of the component of the workflow job."""
+        component: SecbotHandler = getattr(self, components_group)[item.handler_name]
+        component_kwargs["component_name"] = item.name
+        if component.env_model and item.env:
+            env_dict = item.env or {}
+            component_kwargs["env"] = component.env_model(**env_dict)
+        if component.config_model:
+            config_dict = item.config or {}
+            component_kwargs["config"] = component.config_model(**config_dict)
+        if item.concurrency:
+            component_kwargs["concurrency"] = item.concurrency
+
+        # The pydantic models are encoded by the `secbot` celery serializer
+        signature = component.task.s(*component_args, **component_kwargs)
+        if item.queue:
+            signature.set(queue=item.queue)
+        return signature
+
+    def build_workflows(
+        self,
+        jobs: List[WorkflowJob],
+        *args,
+        fan_in: bool = False,
+        **kwargs,
+    ) -> List[Signature]:
+        """Build one workflow per unique scan of the jobs.
+
+        Every scan runs exactly once, and its result is fanned out
+        to all the outputs configured for the scan by any of the jobs
+        in parallel. The notifications run once per output result:
+
+            scan -> group(output_1 -> group(notifications), output_2 -> ...)
+
+        In the fan-in mode, the workflows of all the scans are joined
+        into a chord instead, and the notifications run once per check
+        with the aggregated result of the input's `fan_in`:
+
+            chord(scan -> group(output_1, output_2, ...), ...) -> fan_in
+
+        Args:
+            jobs: The WorkflowJob instances to build the workflows of.
+            fan_in: Whether to notify once per check instead of once per output.
+            args: Positional arguments to be passed to the scan handlers.
+            kwargs: Keyword arguments to be passed to the scan handlers.
+        """
+        # The steps of the fan-in handle their failures themselves,
+        # otherwise the chord would never call the fan-in
+        step_kwargs = {"fan_in": True} if fan_in else {}
+
+        workflows = []
+        for scan in unique_components(scan for job in jobs for scan in job.scans):
+            scan_jobs = [
+                job
+                for job in jobs
+                if any(item.name == scan.name for item in job.scans)
+            ]
+            branches = []
+            for output in unique_components(
+                output for job in scan_jobs for output in job.outputs
+            ):
+                branch = [self.build_component_task("outputs", output, **step_kwargs)]
+                if not fan_in:
+                    notifications = unique_components(
+                        notification
+                        for job in scan_jobs
+                        if any(item.name == output.name for item in job.outputs)
+                        for notification in job.notifications or []
+                    )
+                    branch.append(
+                        group(
+                            [
+                                self.build_component_task("notifications", item)
+                                for item in notifications
+                            ]
+                        )
+                    )
+                branches.append(branch)
+
+            scan_task = self.build_component_task(
+                "scans", scan, *args, **kwargs, **step_kwargs
+            )
+            if not branches:
+                workflows.append(scan_task)
+            elif len(branches) == 1:
+                workflows.append(chain(scan_task, *branches[0]))
+            else:
+                workflows.append(
+                    chain(scan_task, group([chain(*branch) for branch in branches]))
+                )
+
+        if not fan_in or not workflows:
+            return workflows
+
+        notifications = [
+            self.build_component_task("notifications", item)
+            for item in unique_components(
+                notification
+                for job in jobs
+                for notification in job.notifications or []
+            )
+        ]
+        fan_in_task = self.fan_in_task.s(*args, notifications=notifications, **kwargs)
+        return [chord(workflows, fan_in_task)]
+
     async def run(
         self,
         *args,
-        job: WorkflowJob,
+        jobs: List[WorkflowJob],
+        countdown: Optional[int] = None,
+        low_priority: bool = False,
+        fair_share_key: Optional[str] = None,
         **kwargs,
-    ):
+    ) -> List[AsyncResult]:
         """Run a secbot workflow by executing a series of consecutive steps.
 
-        The job configuration contains all necessary information
+        The jobs configuration contains all necessary information
         about the graph of dependencies.
         The scan function serves as the entry point for each path in the graph,
-        and its results are sent to all registered outputs as configured by the job.
+        and its results are sent to all registered outputs as configured by the jobs.
 
         Args:
-            job: The WorkflowJob instance that specifies the workflow to be run.
+            jobs: The WorkflowJob instances that specify the workflow to be run.
+            countdown: Number of seconds to delay the start of the workflow.
+            low_priority: Whether the workflow may be deferred or shed
+                by the admission control when the workers are overloaded.
+                The low priority workflows also give way to the others
+                in the fair scheduler.
+            fair_share_key: The key the workflows are scheduled fairly by,
+                e.g. the project, if the fair scheduling is enabled.
             args: Positional arguments to be passed to the scan handler.
             kwargs: Keyword arguments to be passed to the scan handler.
+
+        Returns:
+            The results of the workflows. The deferred workflows and the ones
+            queued in the fair scheduler are published later, but their task
+            ids are assigned up front, so they may be revoked at once.
+
+        Raises:
+            DispatchShed: If the workflow has been shed by the admission control.
+        """
+        workflows = self.build_workflows(
+            jobs, *args, fan_in=settings.notifications_fan_in, **kwargs
+        )
+        # The frozen workflows keep their task ids when they are published
+        results = [workflow.freeze() for workflow in workflows]
+        jobs_names = ", ".join(job.name for job in jobs)
+
+        admission = get_admission_controller()
+        load = await admission.measure(
+            self.scans_queue,
+            self.count_in_progress_scans,
+        )
+        decision = admission.decide(load, low_priority=low_priority)
+        if decision is AdmissionDecision.DEFER and not await admission.defer(
+            self.config_name,
+            workflows,
+            countdown=countdown,
+            low_priority=low_priority,
+            fair_share_key=fair_share_key,
+        ):
+            # The holding queue is full
+            decision = AdmissionDecision.SHED
+        if decision is not AdmissionDecision.ADMIT:
+            labels = get_location_labels_from_env()
+            SECBOT_DISPATCH_ADMISSION.labels(
+                **labels, input=self.config_name, decision=decision.value
+            ).inc()
+        if decision is AdmissionDecision.SHED:
+            logger.warning(f"Workflow of jobs {jobs_names} is shed: {load}")
+            raise DispatchShed(f"Workers are overloaded: {load}")
+        if decision is AdmissionDecision.DEFER:
+            logger.info(f"Workflow of jobs {jobs_names} is deferred: {load}")
+            return results
+
+        await self.publish(
+            workflows,
+            countdown=countdown,
+            low_priority=low_priority,
+            fair_share_key=fair_share_key,
+        )
+
+        # The load is below the soft limits, so the deferred workflows may go on
+        if not admission.is_overloaded(load):
+            await admission.release(
+                self.celery_app,
+                self.config_name,
+                count=settings.admission_release_batch_size,
+                publish=self.publish,
+            )
+        return results
+
+    async def publish(
+        self,
+        workflows: List[Signature],
+        countdown: Optional[int] = None,
+        low_priority: bool = False,
+        fair_share_key: Optional[str] = None,
+    ) -> None:
+        """Publish the admitted workflows to the broker.
+
+        The workflows are queued in the fair scheduler instead, if it's enabled
+        and the workflows have the fair-share key. The arguments are the ones
+        of `run`.
+        """
+        scheduler = get_fair_scheduler()
+        if scheduler is None or not fair_share_key:
+            for workflow in workflows:
+                workflow.apply_async(countdown=countdown)
+            return
+        await scheduler.submit(
+            fair_share_key,
+            workflows,
+            priority=SchedulerPriority.LOW if low_priority else SchedulerPriority.HIGH,
+            countdown=countdown,
+        )
+        await scheduler.release(self.celery_app, self.scans_queue)
+
+    async def release(self) -> int:
+        """Release the deferred workflows and the ones of the fair scheduler.
+
+        The workflows are released by the following dispatches, but there may
+        be none for a while when no events come in, so they are also released
+        periodically by the `release` task of the input scheduled by celery beat.
+
+        Returns:
+            The number of the released workflows.
         """
+        released = 0
+        admission = get_admission_controller()
+        load = await admission.measure(self.scans_queue, self.count_in_progress_scans)
+        if not admission.is_overloaded(load):
+            released += await admission.release(
+                self.celery_app,
+                self.config_name,
+                count=settings.admission_release_batch_size,
+                publish=self.publish,
+            )
+        scheduler = get_fair_scheduler()
+        if scheduler is not None:
+            released += await scheduler.release(self.celery_app, self.scans_queue)
+        return released
+
+    async def fan_in(self, results: tuple, input_data: Any) -> Any:
+        """Aggregate the results of all the scans of the security check.
+
+        Called once all the scans and outputs of the check are finished
+        in the notifications fan-in mode. Should be implemented
+        in the inputs supporting it.
 
-        def build_component_tasks(
-            components_group: str,
-            *component_args,
-            **component_kwargs,
-        ) -> Iterator[Signature]:
-
-            for item in getattr(job, components_group):
-                item: SecbotConfigComponent
-                component: SecbotHandler = getattr(self, components_group)[
-                    item.handler_name
-                ]
-                component_kwargs["component_name"] = item.name
-                if component.env_model and item.env:
-                    env_dict = item.env or {}
-                    component_kwargs["env"] = component.env_model(**env_dict)
-                if component.config_model:
-                    config_dict = item.config or {}
-                    component_kwargs["config"] = component.config_model(**config_dict)
-
-                # Deserialize all pydantic models in the arguments and kwargs converts it
-                # to json serializable objects
-                prepared_args = utils.deserializer(component_args)
-                prepared_kwargs = utils.deserializer(component_kwargs)
-
-                yield component.task.s(*prepared_args, **prepared_kwargs)
-
-        scan_tasks = list(build_component_tasks("scans", *args, **kwargs))
-        output_tasks = list(build_component_tasks("outputs"))
-        notification_tasks = list(build_component_tasks("notifications"))
-
-        for scan_task in scan_tasks:
-            for output_task in output_tasks:
-                chain(
-                    scan_task,
-                    output_task,
-                    group(notification_tasks),
-                ).delay()
+        Args:
+            results: The results of the outputs, or the failed results
+                of the scans (`SecbotFailedResult`), in nested tuples.
+            input_data: The input data of the check passed to the scan handlers.
+
+        Returns:
+            The aggregated result sent to the notifications, or None
+            to skip them.
+        """
+        raise NotImplementedError(
+            f"Input {self.config_name} doesn't support the notifications fan-in"
+        )
+
+    async def count_in_progress_scans(self) -> int:
+        """Count the scans of the input that are in progress.
+
+        Used by the admission control to measure the load of the workers.
+        """
+        return 0
 
     async def fetch_status(
         self,
@@ -177,12 +443,12 @@ class SecbotInput(abc.ABC):
         Returns:
             The status of the security checks (either SUCCESS or FAIL).
         """
-        results: List[ScanStatus] = []
+        results: List[bool] = []
         for output in outputs:
-            handler = self.outputs[output.handler_name]
+            handler = cast(SecbotOutputHandler, self.outputs[output.handler_name])
             if handler.env_model:
                 # Inject env model into kwargs like in output decorator
-                kwargs["env"] = handler.env_model(**output.env)
+                kwargs["env"] = handler.env_model(**(output.env or {}))
             status = await handler.fetch_status(
                 eligible_scans=eligible_scans, **kwargs
             )
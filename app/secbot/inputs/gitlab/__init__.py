@@ -1,62 +1,235 @@
-from sqlalchemy import select
+from celery import Celery
+from sqlalchemy import func, select, update
 
-from app.secbot.config import config
+from app.metrics.common import get_location_labels_from_env
+from app.metrics.dispatch import SECBOT_DISPATCH_SUPPRESSED
+from app.secbot.config import config, may_job_match_rules, unique_components
 from app.secbot.db import db_session
-from app.secbot.inputs import SecbotInput
+from app.secbot.dedupe import get_dispatch_deduplicator
+from app.secbot.inputs import SecbotInput, iter_fan_in_results
 from app.secbot.inputs.gitlab.models import (
     RepositorySecurityCheck,
     RepositorySecurityScan,
 )
 from app.secbot.inputs.gitlab.schemas import (
     AnyGitlabModel,
+    GitlabCheckResult,
     GitlabEvent,
     GitlabInputData,
     GitlabWebhookSecurityID,
+    MergeRequestWebhookModel,
+    PushWebhookModel,
+    RepositoryFetchConfig,
+    RepositoryFetchStrategy,
 )
-from app.secbot.inputs.gitlab.services import get_or_create_security_check
+from app.secbot.inputs.gitlab.services import (
+    add_security_check_scan_names,
+    get_or_create_security_check,
+    is_security_check_scanned,
+    prefetch_repository,
+)
+from app.secbot.inputs.gitlab.supersede import supersede_merge_request
 from app.secbot.inputs.gitlab.utils import (
     generate_gitlab_security_id,
     get_config_from_host,
 )
 from app.secbot.logger import logger
-from app.secbot.schemas import ScanStatus, SecurityCheckStatus
+from app.secbot.schemas import ScanStatus, SecbotFailedResult, SecurityCheckStatus
+from app.secbot.settings import settings
+
+# The priority of the prefetch tasks, the lowest one of the redis broker
+PREFETCH_PRIORITY = 9
 
 
 # noinspection PyMethodOverriding
 class GitlabInput(SecbotInput):
+    def __init__(self, config_name: str, celery_app: Celery):
+        super().__init__(config_name, celery_app)
+        self.prefetch_task = self.celery_app.task(
+            name=f"secbot.input.{self.config_name}.prefetch",
+            ignore_result=True,
+        )(prefetch_repository)
+
     async def run(
         self,
         data: AnyGitlabModel,
         event: GitlabEvent,
     ):
-        job = config.matching_workflow_job("gitlab", data.raw)
-        if not job:
+        jobs = config.matching_workflow_jobs("gitlab", data.raw)
+        if not jobs:
             logger.info(f"No matching workflow job for {event}")
             return
 
         gitlab_config = get_config_from_host(data.repository.homepage.host)
         security_id = generate_gitlab_security_id(gitlab_config.prefix, data=data)
 
-        async with db_session() as session:
-            check = await get_or_create_security_check(
-                db_session=session,
-                external_id=security_id,
-                initial_data={
-                    "event_type": event,
-                    "event_json": data.raw,
-                    "commit_hash": data.commit.id,
-                    "branch": data.target_branch,
-                    "project_name": data.repository.name,
-                    "path": data.repository.homepage,
-                    "prefix": gitlab_config.prefix,
-                },
+        # GitLab re-delivers webhooks, and many events keep the same commit,
+        # so we don't publish the tasks for the checks that are already dispatched.
+        deduplicator = get_dispatch_deduplicator()
+        if not await deduplicator.acquire(security_id):
+            logger.info(f"Security check {security_id} is already dispatched")
+            self.suppress_dispatch(reason="in_flight")
+            return
+
+        scan_names = [
+            scan.name
+            for scan in unique_components(scan for job in jobs for scan in job.scans)
+        ]
+        try:
+            async with db_session() as session:
+                check = await get_or_create_security_check(
+                    db_session=session,
+                    external_id=security_id,
+                    initial_data={
+                        "event_type": event,
+                        "event_json": data.raw,
+                        "commit_hash": data.commit.id,
+                        "branch": data.target_branch,
+                        "project_name": data.repository.name,
+                        "path": data.repository.homepage,
+                        "prefix": gitlab_config.prefix,
+                        "scan_names": scan_names,
+                    },
+                )
+                if await is_security_check_scanned(
+                    db_session=session,
+                    check_id=check.id,
+                    scan_names=scan_names,
+                ):
+                    logger.info(f"Security check {security_id} is already scanned")
+                    self.suppress_dispatch(reason="already_scanned")
+                    return
+                await add_security_check_scan_names(
+                    db_session=session, security_check=check, scan_names=scan_names
+                )
+
+                input_data = GitlabInputData(
+                    event=check.event_type,
+                    data=data,
+                    db_check_id=check.id,
+                )
+            is_merge_request = isinstance(data, MergeRequestWebhookModel)
+            # All the matching jobs are dispatched together for the same check,
+            # so the scans shared by several jobs run once
+            results = await super().run(
+                input_data,
+                jobs=jobs,
+                # The merge request scans wait for the following commits,
+                # which supersede them
+                countdown=(
+                    settings.gitlab_mr_debounce_seconds or None
+                    if is_merge_request
+                    else None
+                ),
+                # Push and tag push events don't gate anything, so they give way
+                # to the merge request ones when the workers are overloaded.
+                low_priority=not is_merge_request,
+                # A flood of the events of one project doesn't hold up the others
+                fair_share_key=data.project.path_with_namespace,
             )
-            input_data = GitlabInputData(
-                event=check.event_type,
-                data=data,
-                db_check_id=check.id,
+            if isinstance(data, MergeRequestWebhookModel):
+                await supersede_merge_request(
+                    self.celery_app,
+                    data,
+                    check_id=check.id,
+                    security_id=security_id,
+                    scan_names=scan_names,
+                    results=results,
+                )
+            return results
+        except Exception:
+            await deduplicator.release(security_id)
+            raise
+
+    def prefetch(self, data: PushWebhookModel) -> None:
+        """Prefetch the pushed commit into the repository mirrors of the scans.
+
+        The pushes usually come seconds before the merge request events
+        of the same commit, so the mirror scans of the merge request jobs
+        that may match the project start with the commit already fetched.
+        The prefetch is sent to the queues of these scans, so it's done
+        by the workers of their mirrors, with the lowest priority.
+        """
+        if not data.after.strip("0"):
+            # The branch is deleted
+            return
+        merge_request_data = {
+            **data.raw,
+            "object_kind": "merge_request",
+            "event_type": "merge_request",
+        }
+        queues = set()
+        for job in config.jobs.get(self.config_name, []):
+            if not may_job_match_rules(job, merge_request_data):
+                continue
+            for scan in job.scans:
+                fetch = RepositoryFetchConfig.parse_obj(
+                    (scan.config or {}).get("fetch", {})
+                )
+                if fetch.strategy is RepositoryFetchStrategy.MIRROR:
+                    queues.add(scan.queue or self.scans_queue)
+
+        for queue in sorted(queues):
+            self.prefetch_task.apply_async(
+                args=(data.project.git_http_url, data.after),
+                queue=queue,
+                priority=PREFETCH_PRIORITY,
             )
-        return await super().run(input_data, job=job)
+
+    async def fan_in(
+        self, results: tuple, input_data: GitlabInputData
+    ) -> GitlabCheckResult:
+        outputs = []
+        failed = {}
+        for result in iter_fan_in_results(results):
+            if isinstance(result, SecbotFailedResult):
+                # The failed scan result is passed through all its outputs
+                failed[result.component_name] = result
+            else:
+                outputs.append(result)
+
+        # The verdict is computed once, when all the scans are finished
+        async with db_session() as session:
+            security_id = (
+                await session.execute(
+                    select(RepositorySecurityCheck.external_id).where(
+                        RepositorySecurityCheck.id == input_data.db_check_id
+                    )
+                )
+            ).scalar()
+        status = await self.fetch_status(security_id)
+        async with db_session() as session:
+            await session.execute(
+                update(RepositorySecurityCheck)
+                .where(RepositorySecurityCheck.id == input_data.db_check_id)
+                .values(status=status)
+            )
+            await session.commit()
+
+        return GitlabCheckResult(
+            input=input_data,
+            status=status,
+            outputs=outputs,
+            failed=list(failed.values()),
+        )
+
+    async def count_in_progress_scans(self) -> int:
+        async with db_session() as session:
+            count: int = (
+                await session.execute(
+                    select(func.count(RepositorySecurityScan.id)).where(
+                        RepositorySecurityScan.status == ScanStatus.IN_PROGRESS
+                    )
+                )
+            ).scalar()
+        return count
+
+    @staticmethod
+    def suppress_dispatch(reason: str) -> None:
+        labels = get_location_labels_from_env()
+        SECBOT_DISPATCH_SUPPRESSED.labels(
+            **labels, input="gitlab", reason=reason
+        ).inc()
 
     async def fetch_status(
         self, security_check_id: GitlabWebhookSecurityID
@@ -85,16 +258,41 @@ class GitlabInput(SecbotInput):
             ).all()
 
             # Define if we have enough scans
-            # we suppose that we have only one job for a security check
-            job = config.matching_workflow_job("gitlab", check.event_json)
-            has_enough_scans = len(scans) == len(job.scans)
+            # of all the jobs dispatched for the security check
+            if check.scan_names is None:
+                # The check has been dispatched before its scans were stored
+                jobs = config.matching_workflow_jobs("gitlab", check.event_json)
+                dispatched_scans = [
+                    scan.name
+                    for scan in unique_components(
+                        scan for job in jobs for scan in job.scans
+                    )
+                ]
+            else:
+                dispatched_scans = check.scan_names
+                jobs = [
+                    job
+                    for job in config.jobs.get(self.config_name, [])
+                    if any(scan.name in dispatched_scans for scan in job.scans)
+                ]
+            job_scans = [
+                scan
+                for scan in unique_components(
+                    scan for job in jobs for scan in job.scans
+                )
+                if scan.name in dispatched_scans
+            ]
+            job_outputs = unique_components(
+                output for job in jobs for output in job.outputs
+            )
+            has_enough_scans = len(scans) == len(dispatched_scans)
 
             # If we have not enough scans, we should wait for them
             if not has_enough_scans:
                 return SecurityCheckStatus.IN_PROGRESS
 
             # If for some reason we have more scans than jobs
-            if len(scans) > len(job.scans):
+            if len(scans) > len(dispatched_scans):
                 return SecurityCheckStatus.ERROR
 
             # Remove skipped scans from checks
@@ -105,6 +303,10 @@ class GitlabInput(SecbotInput):
                 return SecurityCheckStatus.ERROR
             elif ScanStatus.IN_PROGRESS in statuses:
                 return SecurityCheckStatus.IN_PROGRESS
+            elif ScanStatus.SUPERSEDED in statuses:
+                # The superseded commit hasn't been scanned yet,
+                # it is scanned when it's dispatched again
+                return SecurityCheckStatus.IN_PROGRESS
 
             if all(status == ScanStatus.DONE for status in statuses):
                 scan_outputs = set(
@@ -113,11 +315,11 @@ class GitlabInput(SecbotInput):
                     for output_name in scan.outputs_test_id.keys()
                 )
                 outputs = [
-                    output for output in job.outputs if output.name in scan_outputs
+                    output for output in job_outputs if output.name in scan_outputs
                 ]
                 scan_names = set(scan.scan_name for scan in scans)
                 eligible_scans = [
-                    scan for scan in job.scans if scan.name in scan_names
+                    scan for scan in job_scans if scan.name in scan_names
                 ]
                 return await super().fetch_status(
                     outputs,
@@ -0,0 +1,352 @@
+"""Backfill of the security checks for the existing GitLab repositories.
+
+It feeds synthetic push events of the repositories through the secbot
+workflow, exactly like the webhook does for the real ones. The security id
+deduplication of the gitlab input makes re-running the backfill cheap:
+the finished checks are not dispatched again.
+
+The targets are either all the projects of a GitLab instance, or the
+`<project id or path> [<commit sha>]` lines of a file (the default branch
+head is scanned when the commit is omitted). The processed targets are
+remembered in Redis under the backfill name, so an interrupted backfill
+resumes where it has stopped.
+
+Usage:
+    python -m app.secbot.inputs.gitlab.backfill --host git.env.local
+    python -m app.secbot.inputs.gitlab.backfill --host git.env.local --targets targets.txt
+"""
+import argparse
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterable, Optional
+from urllib.parse import quote
+
+import httpx
+import yarl
+from pydantic import BaseModel
+from redis import asyncio as aioredis
+
+from app.secbot.exceptions import DispatchShed
+from app.secbot.inputs.gitlab.schemas import GitlabEvent, get_gitlab_model_for_event
+from app.secbot.inputs.gitlab.utils import get_config_from_host
+from app.secbot.logger import logger
+from app.secbot.redis import get_redis
+from app.secbot.settings import settings
+
+
+class BackfillTarget(BaseModel):
+    """The project and the commit (the default branch head if not set) to scan."""
+
+    project: str
+    commit: Optional[str] = None
+
+    @property
+    def key(self) -> str:
+        return f"{self.project}@{self.commit or ''}"
+
+
+@dataclass
+class BackfillStats:
+    dispatched: int = 0
+    suppressed: int = 0
+    shed: int = 0
+    resumed: int = 0
+    failed: int = 0
+    started_at: float = 0.0
+
+    @property
+    def processed(self) -> int:
+        return self.dispatched + self.suppressed + self.shed + self.failed
+
+    @property
+    def rate(self) -> float:
+        """Processed targets per second."""
+        elapsed = time.monotonic() - self.started_at
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"processed={self.processed} dispatched={self.dispatched} "
+            f"suppressed={self.suppressed} shed={self.shed} failed={self.failed} "
+            f"resumed={self.resumed} rate={self.rate:.2f}/s"
+        )
+
+
+class BackfillCheckpoint:
+    """Processed targets of the backfill, so it can be resumed."""
+
+    key_prefix = "secbot:gitlab:backfill"
+
+    def __init__(self, redis: aioredis.Redis, name: str):
+        self.redis = redis
+        self.key = f"{self.key_prefix}:{name}"
+
+    async def is_done(self, target: BackfillTarget) -> bool:
+        return bool(await self.redis.sismember(self.key, target.key))
+
+    async def mark_done(self, target: BackfillTarget) -> None:
+        await self.redis.sadd(self.key, target.key)
+
+    async def reset(self) -> None:
+        await self.redis.delete(self.key)
+
+
+class GitlabBackfillClient:
+    """Minimal async client of the GitLab API used by the backfill."""
+
+    page_size = 100
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+
+    async def iter_projects(self) -> AsyncIterator[dict]:
+        """Iterate over all the not archived projects of the instance.
+
+        The keyset pagination is used, since the offset one is limited
+        by GitLab for the big collections.
+        """
+        url: Optional[str] = "/api/v4/projects"
+        params: Optional[dict] = {
+            "archived": "false",
+            "simple": "true",
+            "pagination": "keyset",
+            "order_by": "id",
+            "sort": "asc",
+            "per_page": self.page_size,
+        }
+        while url:
+            response = await self.client.get(url, params=params)
+            response.raise_for_status()
+            for project in response.json():
+                yield project
+            url = response.links.get("next", {}).get("url")
+            params = None
+
+    async def get_project(self, project: str) -> dict:
+        response = await self.client.get(f"/api/v4/projects/{quote(project, safe='')}")
+        response.raise_for_status()
+        return response.json()
+
+    async def get_commit(self, project_id: int, reference: str) -> dict:
+        response = await self.client.get(
+            f"/api/v4/projects/{project_id}/repository/commits/"
+            f"{quote(reference, safe='')}"
+        )
+        response.raise_for_status()
+        return response.json()
+
+
+def build_push_event(project: dict, commit: dict, branch: str) -> dict:
+    """Build the push webhook payload of the commit from the GitLab API objects.
+
+    The payload is marked with `secbot_backfill`, so the workflow jobs
+    can tell the backfill events from the real ones.
+    """
+    web_url = project["web_url"]
+    return {
+        "object_kind": "push",
+        "event_name": "push",
+        "secbot_backfill": "true",
+        "before": commit["parent_ids"][0] if commit.get("parent_ids") else "",
+        "after": commit["id"],
+        "ref": f"refs/heads/{branch}",
+        "checkout_sha": commit["id"],
+        "project_id": project["id"],
+        "project": {
+            "id": project["id"],
+            "name": project["name"],
+            "web_url": web_url,
+            "git_ssh_url": project["ssh_url_to_repo"],
+            "git_http_url": project["http_url_to_repo"],
+            "namespace": project["namespace"]["name"],
+            "path_with_namespace": project["path_with_namespace"],
+            "default_branch": project.get("default_branch"),
+            "homepage": web_url,
+        },
+        "commits": [
+            {
+                "id": commit["id"],
+                "message": commit["message"],
+                "title": commit["title"],
+                "timestamp": commit["committed_date"],
+                "url": commit["web_url"],
+                "author": {
+                    "name": commit["author_name"],
+                    "email": commit["author_email"],
+                },
+            }
+        ],
+        "total_commits_count": 1,
+        "repository": {
+            "name": project["name"],
+            "url": project["ssh_url_to_repo"],
+            "homepage": web_url,
+            "git_http_url": project["http_url_to_repo"],
+            "git_ssh_url": project["ssh_url_to_repo"],
+        },
+    }
+
+
+class GitlabBackfill:
+    """Dispatch the targets through the secbot workflow with bounded concurrency.
+
+    At most `concurrency` targets are processed at once, and the targets
+    are not enumerated further than the workers can take.
+    """
+
+    report_interval = 30
+
+    def __init__(
+        self,
+        security_bot,
+        client: GitlabBackfillClient,
+        checkpoint: BackfillCheckpoint,
+        concurrency: int,
+    ):
+        self.security_bot = security_bot
+        self.client = client
+        self.checkpoint = checkpoint
+        self.concurrency = concurrency
+        self.stats = BackfillStats()
+        self._reported_at = 0.0
+
+    async def all_projects(self) -> AsyncIterator[BackfillTarget]:
+        async for project in self.client.iter_projects():
+            if project.get("default_branch"):
+                yield BackfillTarget(project=str(project["id"]))
+
+    async def dispatch(self, target: BackfillTarget) -> None:
+        project = await self.client.get_project(target.project)
+        branch = project["default_branch"]
+        commit = await self.client.get_commit(project["id"], target.commit or branch)
+        payload = build_push_event(project, commit, branch)
+        data = get_gitlab_model_for_event(GitlabEvent.PUSH, payload)
+
+        results = await self.security_bot.run(
+            "gitlab", data=data, event=GitlabEvent.PUSH
+        )
+        # The deferred workflows (an empty list) are dispatched later
+        if results is None:
+            self.stats.suppressed += 1
+        else:
+            self.stats.dispatched += 1
+
+    async def process(self, target: BackfillTarget) -> None:
+        if await self.checkpoint.is_done(target):
+            self.stats.resumed += 1
+            return
+        try:
+            await self.dispatch(target)
+        except DispatchShed:
+            # The workers are overloaded, the next run will retry the target
+            self.stats.shed += 1
+            return
+        except Exception:
+            self.stats.failed += 1
+            logger.exception(f"Failed to backfill {target.key}")
+            return
+        await self.checkpoint.mark_done(target)
+        self.report()
+
+    def report(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if force or now - self._reported_at >= self.report_interval:
+            self._reported_at = now
+            logger.info(f"Gitlab backfill: {self.stats}")
+
+    async def run(self, targets: AsyncIterator[BackfillTarget]) -> BackfillStats:
+        self.stats = BackfillStats(started_at=time.monotonic())
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency)
+
+        async def worker():
+            while (target := await queue.get()) is not None:
+                await self.process(target)
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            async for target in targets:
+                await queue.put(target)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+        self.report(force=True)
+        return self.stats
+
+
+async def iter_targets(lines: Iterable[str]) -> AsyncIterator[BackfillTarget]:
+    """Parse the `<project id or path> [<commit sha>]` lines of the targets file."""
+    for line in lines:
+        if not (line := line.strip()) or line.startswith("#"):
+            continue
+        project, *commit = line.split()
+        yield BackfillTarget(project=project, commit=next(iter(commit), None))
+
+
+def get_backfill_client(host: str) -> httpx.AsyncClient:
+    gitlab_config = get_config_from_host(host)
+    return httpx.AsyncClient(
+        base_url=str(yarl.URL(gitlab_config.host).with_path("/")),
+        headers={"PRIVATE-TOKEN": gitlab_config.auth_token.get_secret_value()},
+        timeout=30,
+    )
+
+
+async def run_backfill(args: argparse.Namespace) -> BackfillStats:
+    from app.main import security_bot
+
+    checkpoint = BackfillCheckpoint(get_redis(), name=args.name)
+    if args.reset:
+        await checkpoint.reset()
+
+    async with get_backfill_client(args.host) as http_client:
+        backfill = GitlabBackfill(
+            security_bot,
+            client=GitlabBackfillClient(http_client),
+            checkpoint=checkpoint,
+            concurrency=args.concurrency,
+        )
+        if args.targets:
+            with open(args.targets) as targets_file:
+                return await backfill.run(iter_targets(targets_file))
+        return await backfill.run(backfill.all_projects())
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Run the security checks for the existing GitLab repositories."
+    )
+    parser.add_argument(
+        "--host",
+        required=True,
+        help="Host of the GitLab instance from the gitlab configs",
+    )
+    parser.add_argument(
+        "--targets",
+        help="File with `<project id or path> [<commit sha>]` lines "
+        "(all the projects of the instance by default)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=settings.gitlab_backfill_concurrency,
+        help="Number of the targets dispatched at once",
+    )
+    parser.add_argument(
+        "--name",
+        default="default",
+        help="Name of the backfill checkpoint to resume",
+    )
+    parser.add_argument(
+        "--reset",
+        action="store_true",
+        help="Forget the checkpoint and start the backfill from scratch",
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(run_backfill(parse_args()))
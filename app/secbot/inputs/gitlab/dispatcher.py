@@ -0,0 +1,117 @@
+"""Dispatcher of the GitLab events accepted in the webhook ingest mode.
+
+It drains the ingest queue in batches and runs the secbot workflow for
+every event, exactly like the webhook does in the synchronous mode.
+The dispatched events are acknowledged, the shed ones are returned to the
+queue to be dispatched once the load goes down, and the failed ones are left
+unacknowledged, so they are returned to the queue on the dispatcher restart.
+
+Usage:
+    python -m app.secbot.inputs.gitlab.dispatcher
+"""
+import asyncio
+import time
+
+import sentry_sdk
+from pydantic import ValidationError
+
+from app.metrics.common import get_location_labels_from_env, start_http_metrics_server
+from app.metrics.dispatch import SECBOT_DISPATCH_ERRORS, SECBOT_INGEST_LAG
+from app.secbot.config import config
+from app.secbot.exceptions import DispatchShed
+from app.secbot.inputs.gitlab.ingest import (
+    GitlabIngestEnvelope,
+    GitlabIngestQueue,
+    get_ingest_queue,
+)
+from app.secbot.inputs.gitlab.schemas import get_gitlab_model_for_event
+from app.secbot.logger import logger
+from app.secbot.settings import settings
+
+
+async def dispatch_event(security_bot, envelope: GitlabIngestEnvelope) -> None:
+    """Run the secbot workflow for the single ingested event.
+
+    Raises:
+        DispatchShed: If the workflow is shed by the admission control.
+        Exception: If the workflow has failed to be dispatched.
+    """
+    labels = get_location_labels_from_env()
+    SECBOT_INGEST_LAG.labels(**labels, input="gitlab").observe(
+        max(time.time() - envelope.received_at, 0)
+    )
+
+    try:
+        data = get_gitlab_model_for_event(envelope.event, envelope.payload)
+    except (KeyError, ValidationError):
+        logger.warning(
+            "Unsupported event data",
+            extra={"event": envelope.event, "data": envelope.payload},
+        )
+        return
+
+    try:
+        await security_bot.run("gitlab", data=data, event=envelope.event)
+    except DispatchShed:
+        # Already counted and logged by the admission control
+        raise
+    except Exception as exc:
+        SECBOT_DISPATCH_ERRORS.labels(**labels, input="gitlab").inc()
+        logger.exception("Failed to dispatch gitlab event")
+        sentry_sdk.capture_exception(exc)
+        raise
+
+
+async def dispatch_batch(security_bot, queue: GitlabIngestQueue) -> int:
+    """Dispatch one batch of events from the ingest queue.
+
+    Returns:
+        The number of dispatched (acknowledged) events.
+    """
+    batch = await queue.take_batch(
+        size=settings.gitlab_ingest_batch_size,
+        timeout=settings.gitlab_ingest_poll_timeout,
+    )
+    if not batch:
+        return 0
+
+    results = await asyncio.gather(
+        *(dispatch_event(security_bot, envelope) for _, envelope in batch),
+        return_exceptions=True,
+    )
+    dispatched = [item for (item, _), result in zip(batch, results) if result is None]
+    shed = [
+        item
+        for (item, _), result in zip(batch, results)
+        if isinstance(result, DispatchShed)
+    ]
+    await queue.ack(dispatched)
+    if shed:
+        await queue.requeue(shed)
+        # The workers are overloaded, the shed events are not taken again
+        # right away
+        await asyncio.sleep(settings.gitlab_ingest_poll_timeout)
+    return len(dispatched)
+
+
+async def run_dispatcher() -> None:
+    from app.main import security_bot
+
+    config.watch(settings.config_reload_interval)
+    queue = get_ingest_queue()
+    if requeued := await queue.requeue_unacked():
+        logger.warning(f"Returned {requeued} not acknowledged events to the queue")
+
+    logger.info("Gitlab dispatcher has been started")
+    while True:
+        await dispatch_batch(security_bot, queue)
+        # There may be no events to release the queued workflows for a while
+        await security_bot.get_input("gitlab").release()
+
+
+if __name__ == "__main__":
+    from app.main import init_sentry
+
+    init_sentry()
+    start_http_metrics_server(settings.gitlab_ingest_metrics_port)
+    asyncio.run(run_dispatcher())
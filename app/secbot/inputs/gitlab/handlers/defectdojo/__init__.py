@@ -1,4 +1,3 @@
-import json
 from typing import List
 
 from pydantic import AnyUrl
@@ -6,15 +5,26 @@ from pydantic import AnyUrl
 from app.secbot.config import SecbotConfigComponent
 from app.secbot.handlers import SecbotOutputHandler
 from app.secbot.inputs.gitlab.handlers.defectdojo.services import (
+    DEDUPLICATION_DELAY,
+    TEST_POLL_ATTEMPTS,
+    TEST_POLL_INTERVAL,
     OutputResultObject,
-    send_result,
+    get_test_findings,
+    is_test_processed,
+    upload_result,
 )
 from app.secbot.inputs.gitlab.handlers.defectdojo.validator import (
     DefectDojoFindingsValidator,
 )
 from app.secbot.inputs.gitlab.schemas import GitlabOutputResult, GitlabScanResult
 from app.secbot.inputs.gitlab.schemas.output_responses import OutputResponse
-from app.secbot.inputs.gitlab.services import complete_scan, handle_exception
+from app.secbot.inputs.gitlab.services import (
+    complete_scan,
+    get_output_progress,
+    handle_exception,
+    save_output_progress,
+)
+from app.secbot.inputs.gitlab.supersede import raise_if_superseded
 from app.secbot.inputs.gitlab.utils import get_project_name
 from app.secbot.schemas import SecbotBaseModel
 
@@ -62,14 +72,77 @@ class DefectDojoHandler(SecbotOutputHandler):
         component_name: str,
         env: DefectDojoCredentials,
     ):
-        test_id, dd_findings = await send_result(
+        """Upload the scan result, and continue with polling of the test.
+
+        The test uploaded by the redelivered task is not uploaded again.
+        """
+        progress = await get_output_progress(
+            scan_id=scan_result.db_id, output_component_name=component_name
+        )
+        if "test_id" in progress:
+            return self.continue_later(
+                progress["step"],
+                countdown=TEST_POLL_INTERVAL,
+                **{key: value for key, value in progress.items() if key != "step"},
+            )
+
+        await raise_if_superseded(scan_result.input.data)
+        test_id = await upload_result(
             credentials=env,
             output_result=OutputResultObject(
                 data=scan_result.input.data,
                 worker=scan_result.handler_name,
-                result=json.dumps(scan_result.file.content),
+                result=(await scan_result.file.read()).decode(),
             ),
         )
+        return await self.save_progress(
+            scan_result,
+            component_name,
+            "poll_test",
+            countdown=TEST_POLL_INTERVAL,
+            test_id=test_id,
+            attempt=1,
+        )
+
+    async def poll_test(
+        self,
+        scan_result: GitlabScanResult,
+        component_name: str,
+        env: DefectDojoCredentials,
+        test_id: int,
+        attempt: int,
+    ):
+        """Check whether DefectDojo has processed the test, poll it again if not."""
+        if await is_test_processed(env, test_id):
+            return await self.save_progress(
+                scan_result,
+                component_name,
+                "collect_findings",
+                countdown=DEDUPLICATION_DELAY,
+                test_id=test_id,
+            )
+        if attempt >= TEST_POLL_ATTEMPTS:
+            raise RuntimeError(
+                f"Took too much time to handle the output, test_id={test_id}"
+            )
+        return await self.save_progress(
+            scan_result,
+            component_name,
+            "poll_test",
+            countdown=TEST_POLL_INTERVAL,
+            test_id=test_id,
+            attempt=attempt + 1,
+        )
+
+    async def collect_findings(
+        self,
+        scan_result: GitlabScanResult,
+        component_name: str,
+        env: DefectDojoCredentials,
+        test_id: int,
+    ):
+        """Get the deduplicated findings of the test, and complete the scan."""
+        dd_findings = await get_test_findings(env, test_id)
         await complete_scan(
             scan_id=scan_result.db_id,
             output_component_name=component_name,
@@ -86,3 +159,19 @@ class DefectDojoHandler(SecbotOutputHandler):
             scan_result=scan_result,
             response=response,
         )
+
+    async def save_progress(
+        self,
+        scan_result: GitlabScanResult,
+        component_name: str,
+        step: str,
+        countdown: float,
+        **state,
+    ):
+        """Save the progress on the scan, and continue with the step later."""
+        await save_output_progress(
+            scan_id=scan_result.db_id,
+            output_component_name=component_name,
+            progress={"step": step, **state},
+        )
+        return self.continue_later(step, countdown=countdown, **state)
@@ -4,7 +4,9 @@ from typing import List
 
 import aiohttp
 
+from app.secbot.limits import hold_handler_limit
 from app.secbot.logger import logger
+from app.secbot.runtime import http_session
 
 version = "1.2.0."
 
@@ -600,7 +602,10 @@ class DefectDojoAPIv2(object):
         return ret
 
     async def _request(self, method, url, params=None, data=None, files=None):
-        """Common handler for all HTTP requests."""
+        """Common handler for all HTTP requests.
+
+        The request holds a slot of the concurrency limit of the handler.
+        """
         if not params:
             params = {}
 
@@ -629,7 +634,7 @@ class DefectDojoAPIv2(object):
         self.logger.debug("files:" + str(files))
 
         try:
-            async with aiohttp.ClientSession(raise_for_status=True) as session:
+            async with hold_handler_limit(), http_session() as session:
                 response = await session.request(
                     method=method,
                     url=self.host + url,
@@ -637,6 +642,7 @@ class DefectDojoAPIv2(object):
                     data=data,
                     headers=headers,
                     timeout=self.timeout,
+                    raise_for_status=True,
                 )
                 status_code = response.status
                 text = await response.text()
@@ -1,9 +1,8 @@
-import asyncio
 import json
 import tempfile
 from datetime import date
 from pprint import pformat
-from typing import List, Tuple, cast
+from typing import List, cast
 from urllib.parse import urlparse
 
 import requests
@@ -20,6 +19,13 @@ WORKER_TO_SCAN_TYPE_MAPPER = {
     "gitleaks": "Gitleaks Scan",
 }
 
+# The uploaded test is checked every TEST_POLL_INTERVAL seconds,
+# up to TEST_POLL_ATTEMPTS times, until DefectDojo has processed it
+TEST_POLL_INTERVAL = 10
+TEST_POLL_ATTEMPTS = 30
+# Time in seconds DefectDojo takes to deduplicate the findings of the test
+DEDUPLICATION_DELAY = 120
+
 
 class OutputResultObject(BaseModel):
     data: AnyGitlabModel
@@ -269,10 +275,19 @@ async def dd_get_test(
     return test
 
 
-async def send_result(
+async def upload_result(
     credentials: DefectDojoCredentials,
     output_result: OutputResultObject,
-) -> Tuple[int, List[OutputFinding]]:
+) -> int:
+    """Upload the scan result to DefectDojo.
+
+    DefectDojo processes the uploaded report in the background, so the test
+    is ready once `is_test_processed` is true, and its findings are
+    deduplicated for `DEDUPLICATION_DELAY` seconds more after that.
+
+    Returns:
+        The id of the uploaded test.
+    """
     web_url = output_result.data.project.web_url
     product_type = urlparse(web_url).hostname
     product_name = output_result.data.project.path_with_namespace
@@ -298,21 +313,20 @@ async def send_result(
             report_file=tmp_file.name,
             tag=commit_hash,
         )
-        test_upload_id = test_upload.data["test_id"]
-    for i in range(30):
-        test = await dd_get_test(credentials, test_upload_id)
-        if test["percent_complete"] == 100:
-            break
-        await asyncio.sleep(10)
-    else:
-        raise RuntimeError(
-            f"Took too much time to handle the output, test_id={test_upload_id}"
-        )
+        return test_upload.data["test_id"]
 
-    await asyncio.sleep(120)  # wait for deduplication
 
-    response = await dd_findings_by_test(credentials, test_upload_id)
-    findings = [
+async def is_test_processed(credentials: DefectDojoCredentials, test_id: int) -> bool:
+    test = await dd_get_test(credentials, test_id)
+    return test["percent_complete"] == 100
+
+
+async def get_test_findings(
+    credentials: DefectDojoCredentials,
+    test_id: int,
+) -> List[OutputFinding]:
+    response = await dd_findings_by_test(credentials, test_id)
+    return [
         OutputFinding(
             # todo: do smth with types
             title=finding["title"],
@@ -323,4 +337,3 @@ async def send_result(
         )
         for finding in response["results"]
     ]
-    return test_upload_id, findings
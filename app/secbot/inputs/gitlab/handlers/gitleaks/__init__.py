@@ -1,28 +1,45 @@
+import asyncio
 import json
 import subprocess
 import tempfile
+from typing import Optional
 
+import git
 from sqlalchemy import update
 
+from app.secbot.artifacts import get_artifact_store
 from app.secbot.db import db_session
 from app.secbot.exceptions import ScanCheckFailed
 from app.secbot.handlers import SecbotScanHandler
 from app.secbot.inputs.gitlab import RepositorySecurityScan
+from app.secbot.inputs.gitlab.mirrors import has_merge_base
 from app.secbot.inputs.gitlab.schemas import (
     GitlabInputData,
     GitlabScanResult,
     GitlabScanResultFile,
+    RepositoryFetchConfig,
+    ScanMode,
 )
 from app.secbot.inputs.gitlab.services import (
     clone_repository,
+    get_incremental_base,
     handle_exception,
+    is_full_scan_due,
     start_scan,
 )
+from app.secbot.inputs.gitlab.supersede import raise_if_superseded
+from app.secbot.logger import logger
 from app.secbot.schemas import SecbotBaseModel
 
 
 class GitleaksConfig(SecbotBaseModel):
     format: str = "json"
+    fetch: RepositoryFetchConfig = RepositoryFetchConfig()
+    # Incremental mode: only the new commits of the event are scanned, and the
+    # whole history is scanned on the first scan of the project, and then once
+    # in the interval of the full scans (in seconds)
+    incremental: bool = False
+    full_scan_interval: int = 7 * 24 * 60 * 60
 
 
 class GitleaksHandler(SecbotScanHandler):
@@ -41,6 +58,25 @@ class GitleaksHandler(SecbotScanHandler):
             exception=exception,
         )
 
+    async def get_incremental_base(
+        self,
+        input_data: GitlabInputData,
+        scan_id: int,
+        component_name: str,
+        config: GitleaksConfig,
+    ) -> Optional[str]:
+        """Get the base commit of the incremental scan, None for the full scan."""
+        if not config.incremental:
+            return None
+        if await is_full_scan_due(
+            scan_id=scan_id,
+            scan_name=component_name,
+            project_path=str(input_data.data.repository.homepage),
+            interval=config.full_scan_interval,
+        ):
+            return None
+        return await asyncio.to_thread(get_incremental_base, input_data.data)
+
     async def run(
         self,
         input_data: GitlabInputData,
@@ -49,12 +85,33 @@ class GitleaksHandler(SecbotScanHandler):
     ) -> GitlabScanResult:
         # Create and start the gitleaks scan object
         scan = await start_scan(component_name, input_data.db_check_id)
+        await raise_if_superseded(input_data.data)
+        base = await self.get_incremental_base(
+            input_data, scan.id, component_name, config
+        )
 
-        # Clone the entire repository and save it in the temporary directory
+        # Clone the repository, or fetch only the commit with the shallow
+        # fetch strategy, and save it in the temporary directory
         with clone_repository(
             repository_url=input_data.data.project.git_http_url,
             reference=input_data.data.commit.id,
+            fetch=config.fetch,
+            base=base,
+            scan_name=component_name,
         ) as repository_temp_path:
+            await raise_if_superseded(input_data.data)
+
+            # The base may be gone from the repository, e.g. by the force push,
+            # or the fetched history may not reach the merge base, then the range
+            # isn't the new commits only
+            if base and not has_merge_base(
+                git.Repo(repository_temp_path), base, input_data.data.commit.id
+            ):
+                logger.warning(f"Merge base of {base} is not found, scanning in full")
+                base = None
+            mode = ScanMode.INCREMENTAL if base else ScanMode.FULL
+            commits_range = f"{base}..{input_data.data.commit.id}" if base else None
+            log_options = ["--log-opts", commits_range] if commits_range else []
 
             # Create a temporary file and save the result of the check in it
             with tempfile.NamedTemporaryFile(prefix="secbot-gitleaks-") as temp_file:
@@ -68,6 +125,7 @@ class GitleaksHandler(SecbotScanHandler):
                             config.format,
                             "-r",
                             temp_file.name,
+                            *log_options,
                         ],
                         stdout=subprocess.PIPE,
                         stderr=subprocess.PIPE,
@@ -79,24 +137,37 @@ class GitleaksHandler(SecbotScanHandler):
                     raise ScanCheckFailed()
 
                 # Read the content of the temporary file with scan defects
-                # and save it in the database
+                # and save it in the database, or only its reference if the
+                # report is put into the artifact store
                 with open(temp_file.name, "rb") as output_file:
                     content = output_file.read()
+
+                artifact_store = get_artifact_store()
+                if artifact_store is not None:
+                    artifact = await artifact_store.put(content)
+                    response = None
+                    db_response = {"artifact": artifact.dict()}
+                else:
+                    artifact = None
                     response = json.loads(content.decode())
+                    db_response = response
 
-                    async with db_session() as session:
-                        await session.execute(
-                            update(RepositorySecurityScan)
-                            .where(RepositorySecurityScan.id == scan.id)
-                            .values(response=response)
-                        )
-                        await session.commit()
+                async with db_session() as session:
+                    await session.execute(
+                        update(RepositorySecurityScan)
+                        .where(RepositorySecurityScan.id == scan.id)
+                        .values(response=db_response, mode=mode.value)
+                    )
+                    await session.commit()
 
                 scan_file = GitlabScanResultFile(
                     commit_hash=input_data.data.commit.id,
                     scan_name=self.config_name,
                     format=config.format,
                     content=response,
+                    artifact=artifact,
+                    mode=mode,
+                    commits_range=commits_range,
                 )
                 return GitlabScanResult(
                     db_id=scan.id,
@@ -1,13 +1,16 @@
-from typing import List
+from typing import List, Union
 
 from sqlalchemy import select
 
 from app.secbot.db import db_session
 from app.secbot.handlers import SecbotNotificationHandler
 from app.secbot.inputs.gitlab.handlers.slack.api import send_message
-from app.secbot.inputs.gitlab.handlers.slack.utils import generate_message_blocks
+from app.secbot.inputs.gitlab.handlers.slack.utils import (
+    generate_check_message_blocks,
+    generate_message_blocks,
+)
 from app.secbot.inputs.gitlab.models import SlackNotifications
-from app.secbot.inputs.gitlab.schemas import GitlabOutputResult
+from app.secbot.inputs.gitlab.schemas import GitlabCheckResult, GitlabOutputResult
 from app.secbot.inputs.gitlab.services import handle_exception
 from app.secbot.schemas import SecbotBaseModel
 
@@ -28,12 +31,15 @@ class SlackHandler(SecbotNotificationHandler):
 
     async def on_failure(
         self,
-        output: GitlabOutputResult,
+        output: Union[GitlabOutputResult, GitlabCheckResult],
         exception,
         component_name: str,
         config: SlackConfig,
         env: SlackCredentials,
     ):
+        if isinstance(output, GitlabCheckResult):
+            # All the scans of the check are already finished
+            return
         await handle_exception(
             check_id=output.scan_result.input.db_check_id,
             scan_component_name=output.scan_result.component_name,
@@ -42,16 +48,28 @@ class SlackHandler(SecbotNotificationHandler):
 
     async def run(
         self,
-        output: GitlabOutputResult,
+        output: Union[GitlabOutputResult, GitlabCheckResult],
         component_name: str,
         config: SlackConfig,
         env: SlackCredentials,
     ):
-        """Send notification to slack channel."""
-        message_blocks = generate_message_blocks(
-            output=output,
-            render_limit=config.render_limit,
-        )
+        """Send notification to slack channel.
+
+        The notification is sent per output result, or per security check
+        with the aggregated result in the notifications fan-in mode.
+        """
+        if isinstance(output, GitlabCheckResult):
+            message_blocks = generate_check_message_blocks(
+                check_result=output,
+                render_limit=config.render_limit,
+            )
+            owner = {"check_id": output.input.db_check_id}
+        else:
+            message_blocks = generate_message_blocks(
+                output=output,
+                render_limit=config.render_limit,
+            )
+            owner = {"scan_id": output.scan_result.db_id}
         if not message_blocks:
             return
 
@@ -61,17 +79,14 @@ class SlackHandler(SecbotNotificationHandler):
                     await session.execute(
                         select(SlackNotifications)
                         .with_for_update()
-                        .where(
-                            SlackNotifications.scan_id == output.scan_result.db_id,
-                            SlackNotifications.channel == channel,
-                        )
+                        .filter_by(**owner, channel=channel)
                     )
                 ).scalar()
                 if notification and notification.is_sent is True:
                     return
                 if not notification:
                     notification = SlackNotifications(
-                        scan_id=output.scan_result.db_id,
+                        **owner,
                         channel=channel,
                         payload=message_blocks,
                     )
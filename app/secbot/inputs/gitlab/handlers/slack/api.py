@@ -1,15 +1,22 @@
 from slack_sdk.web.async_client import AsyncWebClient
 
+from app.secbot.limits import hold_handler_limit
+from app.secbot.runtime import http_session
+
 
 async def send_message(
     token: str,
     channel: str,
     payload: dict,
 ) -> None:
-    """Send message payload to the specific channel via a secbot app."""
+    """Send message payload to the specific channel via a secbot app.
+
+    The request holds a slot of the concurrency limit of the handler.
+    """
     assert token, "The token is missing."
     assert channel, "The channel name is missing."
     assert payload, "The payload can't be empty."
 
-    client = AsyncWebClient(token=token)
-    await client.chat_postMessage(channel=channel, blocks=payload)
+    async with hold_handler_limit(), http_session() as session:
+        client = AsyncWebClient(token=token, session=session)
+        await client.chat_postMessage(channel=channel, blocks=payload)
@@ -1,6 +1,6 @@
 from typing import Dict, List, Optional
 
-from app.secbot.inputs.gitlab.schemas import GitlabOutputResult
+from app.secbot.inputs.gitlab.schemas import GitlabCheckResult, GitlabOutputResult
 from app.secbot.schemas import Severity
 
 SEVERITY_TO_EMOJI: Dict[Severity, str] = {
@@ -55,3 +55,32 @@ def generate_message_blocks(
         add_to_message_blocks(message)
 
     return message_blocks
+
+
+def generate_check_message_blocks(
+    check_result: GitlabCheckResult,
+    render_limit: int,
+) -> Optional[List[Dict[str, str]]]:
+    """Generate one message of the new findings of all the check outputs."""
+    message_blocks = []
+    for output in check_result.outputs:
+        message_blocks.extend(generate_message_blocks(output, render_limit) or [])
+    if not message_blocks:
+        return None
+
+    message = f"Security check status: *{check_result.status.value}*"
+    message_blocks.insert(
+        0, {"type": "section", "text": {"type": "mrkdwn", "text": message}}
+    )
+
+    # The findings of the failed workers are missing
+    if check_result.failed:
+        workers = ", ".join(
+            f"*{result.component_name}*" for result in check_result.failed
+        )
+        message = f":warning: {workers} failed, the findings may be incomplete"
+        message_blocks.append(
+            {"type": "section", "text": {"type": "mrkdwn", "text": message}}
+        )
+
+    return message_blocks
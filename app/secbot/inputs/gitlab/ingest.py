@@ -0,0 +1,108 @@
+import json
+import time
+from typing import List, Tuple
+
+from pydantic import BaseModel
+from redis import asyncio as aioredis
+
+from app.metrics.common import get_location_labels_from_env
+from app.metrics.dispatch import SECBOT_INGEST_EVENTS
+from app.secbot.inputs.gitlab.schemas import GitlabEvent
+from app.secbot.redis import get_redis
+
+
+class GitlabIngestEnvelope(BaseModel):
+    """Raw GitLab event waiting on the ingest queue to be dispatched."""
+
+    event: GitlabEvent
+    payload: dict
+    received_at: float
+
+
+class GitlabIngestQueue:
+    """Durable queue of the raw GitLab webhook events.
+
+    Events are pushed to the head of the queue list and taken from its tail.
+    Taken events are atomically moved to the processing list, and they stay
+    there until the dispatcher acknowledges them. Therefore, events taken by
+    a dispatcher that died in the middle of a batch are not lost,
+    they are returned to the queue with `requeue_unacked`.
+    """
+
+    queue_key = "secbot:gitlab:ingest"
+    processing_key = "secbot:gitlab:ingest:processing"
+
+    def __init__(self, redis: aioredis.Redis):
+        self.redis = redis
+
+    async def put(self, event: GitlabEvent, payload: dict) -> None:
+        envelope = GitlabIngestEnvelope(
+            event=event,
+            payload=payload,
+            received_at=time.time(),
+        )
+        await self.redis.lpush(self.queue_key, envelope.json())
+
+        labels = get_location_labels_from_env()
+        SECBOT_INGEST_EVENTS.labels(**labels, input="gitlab", event=event.name).inc()
+
+    async def take_batch(
+        self,
+        size: int,
+        timeout: int,
+    ) -> List[Tuple[str, GitlabIngestEnvelope]]:
+        """Take up to `size` events, blocking up to `timeout` seconds for the first one.
+
+        Returns:
+            Pairs of the raw queue item (used to acknowledge it) and the parsed event.
+        """
+        first = await self.redis.blmove(
+            self.queue_key, self.processing_key, timeout, "RIGHT", "LEFT"
+        )
+        if first is None:
+            return []
+
+        items = [first]
+        if size > 1:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for _ in range(size - 1):
+                    pipe.lmove(self.queue_key, self.processing_key, "RIGHT", "LEFT")
+                items.extend(item for item in await pipe.execute() if item)
+        return [(item, GitlabIngestEnvelope(**json.loads(item))) for item in items]
+
+    async def ack(self, items: List[str]) -> None:
+        """Remove dispatched events from the processing list."""
+        if not items:
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for item in items:
+                pipe.lrem(self.processing_key, 1, item)
+            await pipe.execute()
+
+    async def requeue(self, items: List[str]) -> None:
+        """Return the taken events to the back of the queue, e.g. the shed ones,
+        so the events queued after them are dispatched first."""
+        if not items:
+            return
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for item in items:
+                pipe.lrem(self.processing_key, 1, item)
+                pipe.lpush(self.queue_key, item)
+            await pipe.execute()
+
+    async def requeue_unacked(self) -> int:
+        """Return all not acknowledged events back to the queue.
+
+        Must be called only when no other dispatcher is running,
+        e.g. on the dispatcher startup.
+        """
+        count = 0
+        while await self.redis.lmove(
+            self.processing_key, self.queue_key, "LEFT", "RIGHT"
+        ):
+            count += 1
+        return count
+
+
+def get_ingest_queue() -> GitlabIngestQueue:
+    return GitlabIngestQueue(get_redis())
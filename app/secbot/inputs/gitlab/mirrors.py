@@ -0,0 +1,360 @@
+"""Cache of the bare mirrors of the scanned repositories.
+
+The same repository is scanned over and over for its new commits, so instead
+of cloning it from scratch for every scan, the worker keeps a bare mirror of
+it in the cache directory (local, or a shared volume). A scan fetches only
+the objects missing from the mirror, and checks out the target commit into
+an ephemeral `git worktree`, removed once the scan is done. The fetched commits
+are kept as the refs of the mirror, so the next fetches negotiate from them
+and receive only the new objects.
+
+The credentials of the repository URL are passed to every fetch, and never
+stored in the mirror, so the tokens are not left on the (shared) volume.
+
+The mirrors are locked with `flock`: the fetches and the worktree changes
+of the same mirror are exclusive, and every scan holds the shared lock of
+the mirror in use, so the mirrors in use are never evicted. The least
+recently used mirrors are evicted when the cache is over its disk budget.
+
+The mirrors may be warmed ahead of the scans by the prefetch, e.g. of the
+pushed commits before the merge request events, see `prefetch`.
+"""
+import base64
+import contextlib
+import fcntl
+import os
+import pathlib
+import shutil
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import IO, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote, urlparse
+
+import git
+import yarl
+
+from app.metrics.common import get_location_labels_from_env
+from app.metrics.repository import (
+    SECBOT_REPOSITORY_CACHE_EVICTIONS,
+    SECBOT_REPOSITORY_CACHE_REQUESTS,
+    SECBOT_REPOSITORY_PREFETCH,
+    SECBOT_REPOSITORY_PREFETCH_SAVED,
+)
+from app.secbot.logger import logger
+from app.secbot.settings import settings
+
+GIT_ENVIRONMENT = {"GIT_LFS_SKIP_SMUDGE": "1", "GIT_TERMINAL_PROMPT": "0"}
+
+# The directory of the mirror with the markers of the prefetched commits,
+# and the time in seconds the markers of the never scanned commits are kept
+PREFETCH_MARKERS = "secbot-prefetched"
+PREFETCH_MARKER_TTL = 24 * 60 * 60
+
+# The namespace of the refs of the fetched commits
+FETCHED_REFS = "refs/secbot"
+
+
+@dataclass
+class RepositoryCheckout:
+    """The checked out commit of the repository."""
+
+    path: str
+    # Size of the packs received by the fetch, 0 on the cache hit
+    received_bytes: int = 0
+
+
+@dataclass
+class MirrorUpdate:
+    """The update of the mirror by the commits of the checkout or the prefetch."""
+
+    repo: git.Repo
+    # "hit", "fetch" (of the missing commits), or "miss" (of the mirror)
+    result: str
+    fetched: List[str]
+    received_bytes: int = 0
+
+
+def has_commit(repo: git.Repo, commit: str) -> bool:
+    """Whether the commit is in the repository."""
+    try:
+        repo.git.cat_file("-e", f"{commit}^{{commit}}")
+    except git.GitCommandError:
+        return False
+    return True
+
+
+def has_merge_base(repo: git.Repo, base: str, reference: str) -> bool:
+    """Whether the merge base of the commits is in the repository.
+
+    The histories of the commits of the shallow repository may not reach
+    their merge base, then `base..reference` isn't the range of the new
+    commits of the reference.
+    """
+    try:
+        repo.git.merge_base(base, reference)
+    except git.GitCommandError:
+        return False
+    return True
+
+
+def split_credentials(repository_url: str) -> Tuple[str, Dict[str, str]]:
+    """Split the credentials of the repository URL into the git environment.
+
+    The credentials are passed as the `http.extraHeader` of the git command by
+    its environment, so they are neither stored in the git config, nor seen
+    in the command line of the process.
+
+    Returns:
+        The URL without the credentials and the environment of the git command.
+    """
+    url = yarl.URL(repository_url)
+    if url.user is None:
+        return repository_url, {}
+    credentials = base64.b64encode(
+        f"{url.user}:{url.password or ''}".encode()
+    ).decode()
+    return str(url.with_user(None)), {
+        "GIT_CONFIG_COUNT": "1",
+        "GIT_CONFIG_KEY_0": "http.extraHeader",
+        "GIT_CONFIG_VALUE_0": f"Authorization: Basic {credentials}",
+    }
+
+
+def get_received_packs_size(git_directory: str) -> int:
+    """Total size of the object packs of the git directory."""
+    packs = pathlib.Path(git_directory, "objects", "pack").glob("*.pack")
+    return sum(pack.stat().st_size for pack in packs)
+
+
+def get_directory_size(path: pathlib.Path) -> int:
+    return sum(item.stat().st_size for item in path.rglob("*") if item.is_file())
+
+
+@contextlib.contextmanager
+def lock_file(path: pathlib.Path, operation: int) -> Iterator[IO]:
+    """Hold the flock of the file, raises BlockingIOError if it's non-blocking and busy."""
+    with open(path, "a") as file:
+        fcntl.flock(file, operation)
+        try:
+            yield file
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+
+class RepositoryMirrorCache:
+    """Bare mirrors of the repositories keyed by their host and project path.
+
+    Args:
+        path: The cache directory.
+        budget: The disk budget of the mirrors in bytes, 0 means no budget.
+    """
+
+    def __init__(self, path: str, budget: int = 0):
+        self.path = pathlib.Path(path)
+        self.budget = budget
+
+    @staticmethod
+    def get_key(repository_url: str) -> str:
+        """The key of the repository, e.g. `gitlab.example.com/group/project`."""
+        url = urlparse(repository_url)
+        project_path = url.path.strip("/").removesuffix(".git")
+        return f"{url.hostname or ''}/{project_path}"
+
+    def mirror_path(self, key: str) -> pathlib.Path:
+        return self.path / quote(key, safe="")
+
+    @staticmethod
+    def lock_path(mirror_path: pathlib.Path, kind: str) -> pathlib.Path:
+        """The lock file of the mirror, "use" for the scans, "lock" for the changes."""
+        return mirror_path.parent / f"{mirror_path.name}.{kind}"
+
+    @contextlib.contextmanager
+    def checkout(
+        self,
+        repository_url: str,
+        reference: str,
+        base: Optional[str] = None,
+    ) -> Iterator[RepositoryCheckout]:
+        """Check out the commit of the repository into an ephemeral worktree.
+
+        Args:
+            repository_url: The URL of the repository, with the credentials.
+            reference: The commit to check out.
+            base: The base commit of the range to be fetched along with
+                the reference, for the history-aware scanners.
+        """
+        key = self.get_key(repository_url)
+        mirror_path = self.mirror_path(key)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        with lock_file(self.lock_path(mirror_path, "use"), fcntl.LOCK_SH):
+            with tempfile.TemporaryDirectory(prefix="secbot-worktree-") as temp:
+                worktree_path = os.path.join(temp, "repository")
+                with lock_file(self.lock_path(mirror_path, "lock"), fcntl.LOCK_EX):
+                    update = self.update_mirror(
+                        mirror_path, repository_url, [reference, base]
+                    )
+                    self.observe_prefetch(mirror_path, reference, update)
+                    update.repo.git.worktree(
+                        "add", "--detach", worktree_path, reference
+                    )
+                SECBOT_REPOSITORY_CACHE_REQUESTS.labels(
+                    **get_location_labels_from_env(), result=update.result
+                ).inc()
+                try:
+                    yield RepositoryCheckout(worktree_path, update.received_bytes)
+                finally:
+                    with lock_file(self.lock_path(mirror_path, "lock"), fcntl.LOCK_EX):
+                        update.repo.git.worktree("remove", "--force", worktree_path)
+        self.evict(keep=mirror_path)
+
+    def prefetch(self, repository_url: str, reference: str) -> MirrorUpdate:
+        """Fetch the commit into the mirror ahead of its scans.
+
+        The commits fetched by the prefetch are marked with the time of the fetch,
+        so the scans checking them out count the time saved by the prefetch.
+        """
+        mirror_path = self.mirror_path(self.get_key(repository_url))
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        with lock_file(self.lock_path(mirror_path, "use"), fcntl.LOCK_SH):
+            with lock_file(self.lock_path(mirror_path, "lock"), fcntl.LOCK_EX):
+                started = time.perf_counter()
+                update = self.update_mirror(mirror_path, repository_url, [reference])
+                markers_path = mirror_path / PREFETCH_MARKERS
+                markers_path.mkdir(exist_ok=True)
+                expired = time.time() - PREFETCH_MARKER_TTL
+                for marker in markers_path.iterdir():
+                    if marker.stat().st_mtime < expired:
+                        marker.unlink()
+                if update.fetched:
+                    (markers_path / reference).write_text(
+                        str(time.perf_counter() - started)
+                    )
+        self.evict(keep=mirror_path)
+        return update
+
+    @staticmethod
+    def observe_prefetch(
+        mirror_path: pathlib.Path, reference: str, update: MirrorUpdate
+    ) -> None:
+        """Count the prefetch hit, and the time saved by it, or the prefetch miss.
+
+        A miss is a scan that fetches its commit while the prefetch is enabled.
+        """
+        labels = get_location_labels_from_env()
+        marker = mirror_path / PREFETCH_MARKERS / reference
+        if marker.exists():
+            SECBOT_REPOSITORY_PREFETCH.labels(**labels, result="hit").inc()
+            SECBOT_REPOSITORY_PREFETCH_SAVED.labels(**labels).inc(
+                float(marker.read_text())
+            )
+            marker.unlink()
+        elif reference in update.fetched and settings.repository_prefetch_enabled:
+            SECBOT_REPOSITORY_PREFETCH.labels(**labels, result="miss").inc()
+
+    def update_mirror(
+        self,
+        mirror_path: pathlib.Path,
+        repository_url: str,
+        commits: List[Optional[str]],
+    ) -> MirrorUpdate:
+        """Fetch the commits missing from the mirror, creating it if needed."""
+        remote_url, credentials = split_credentials(repository_url)
+        if mirror_path.exists():
+            repo = git.Repo(mirror_path)
+            # The mirrors created before may keep the credentials in the URL
+            repo.remote("origin").set_url(remote_url)
+            # The worktrees of the crashed scans are left behind
+            repo.git.worktree("prune")
+            result = "hit"
+        else:
+            repo = git.Repo.init(mirror_path, bare=True)
+            repo.create_remote("origin", remote_url)
+            with repo.config_writer() as writer:
+                # The received packs are kept as they are, so their size
+                # is the one of the transfer
+                writer.set_value("fetch", "unpackLimit", 1)
+            result = "miss"
+        repo.git.update_environment(**GIT_ENVIRONMENT)
+        # The last use time of the mirror, for the eviction
+        os.utime(mirror_path)
+
+        missing = [
+            commit
+            for commit in dict.fromkeys(filter(None, commits))
+            if not has_commit(repo, commit)
+        ]
+        received = 0
+        if missing:
+            if result == "hit":
+                result = "fetch"
+            packs_size = get_received_packs_size(str(mirror_path))
+            try:
+                self.fetch(repo, missing, credentials)
+            except git.GitCommandError:
+                if len(missing) == 1:
+                    raise
+                # The base commit may be gone, e.g. by the force push
+                missing = missing[:1]
+                self.fetch(repo, missing, credentials)
+            received = get_received_packs_size(str(mirror_path)) - packs_size
+
+        return MirrorUpdate(repo, result, missing, max(received, 0))
+
+    @staticmethod
+    def fetch(repo: git.Repo, commits: List[str], credentials: Dict[str, str]) -> None:
+        """Fetch the commits into the refs of the mirror.
+
+        Without the refs the fetched commits are unknown to the negotiation,
+        and every fetch would receive the whole history again.
+        """
+        repo.git.fetch(
+            "origin",
+            *(f"+{commit}:{FETCHED_REFS}/{commit}" for commit in commits),
+            no_tags=True,
+            env=credentials,
+        )
+
+    def evict(self, keep: Optional[pathlib.Path] = None) -> List[pathlib.Path]:
+        """Evict the least recently used mirrors not in use, down to the budget.
+
+        Returns:
+            The paths of the evicted mirrors.
+        """
+        if not self.budget:
+            return []
+        mirrors = sorted(
+            (path for path in self.path.iterdir() if path.is_dir()),
+            key=lambda path: path.stat().st_mtime,
+        )
+        sizes = {path: get_directory_size(path) for path in mirrors}
+        total = sum(sizes.values())
+        evicted = []
+        for path in mirrors:
+            if total <= self.budget:
+                break
+            if path == keep:
+                continue
+            try:
+                with lock_file(
+                    self.lock_path(path, "use"), fcntl.LOCK_EX | fcntl.LOCK_NB
+                ), lock_file(self.lock_path(path, "lock"), fcntl.LOCK_EX):
+                    shutil.rmtree(path)
+            except BlockingIOError:
+                # The mirror is in use
+                continue
+            logger.info(f"Evicted the repository mirror {path}")
+            SECBOT_REPOSITORY_CACHE_EVICTIONS.labels(
+                **get_location_labels_from_env()
+            ).inc()
+            total -= sizes[path]
+            evicted.append(path)
+        return evicted
+
+
+def get_repository_cache() -> RepositoryMirrorCache:
+    return RepositoryMirrorCache(
+        settings.repository_cache_path, budget=settings.repository_cache_budget
+    )
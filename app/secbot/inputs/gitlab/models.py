@@ -4,7 +4,7 @@ from sqlalchemy.orm import relationship
 
 from app.secbot.db import Base
 from app.secbot.inputs.gitlab.schemas import GitlabEvent
-from app.secbot.schemas import ScanStatus
+from app.secbot.schemas import ScanStatus, SecurityCheckStatus
 
 
 class RepositorySecurityCheck(Base):
@@ -27,6 +27,13 @@ class RepositorySecurityCheck(Base):
     path = Column(String, nullable=False)
     prefix = Column(String, nullable=False)
 
+    # Verdict of the check computed once all its scans are finished,
+    # in the notifications fan-in mode
+    status = Column(Enum(SecurityCheckStatus), nullable=True)
+    # Names of the scans dispatched for the check, its status waits for them
+    # regardless of the workflow config reloaded since
+    scan_names = Column(JSON, nullable=True)
+
     scans = relationship("RepositorySecurityScan", lazy=True)
 
 
@@ -55,16 +62,30 @@ class RepositorySecurityScan(Base):
     # Config name of the scan
     scan_name = Column(String, nullable=False)
 
+    # Mode of the scan ("full" or "incremental") for the scans supporting it,
+    # the full scans are run once in a while, see `is_full_scan_due`
+    mode = Column(String, nullable=True)
+
     # Map to outputs and test id in third party services
     # e.g.
     # {"defectdojo": 42, "other": "test-123"}
     outputs_test_id = Column(JSON)
 
+    # Progress of the outputs of the current run of the scan, the outputs
+    # continue from it in the next tasks instead of waiting for the service
+    # e.g.
+    # {"defectdojo": {"step": "poll_test", "test_id": 42, "attempt": 3}}
+    outputs_progress = Column(JSON, nullable=True)
+
     slack_notification = relationship("SlackNotifications", lazy=True, uselist=False)
 
 
 class SlackNotifications(Base):
-    """State of scan notification to the Slack channel"""
+    """State of scan notification to the Slack channel.
+
+    In the notifications fan-in mode, the notification belongs
+    to the whole security check instead of the scan.
+    """
 
     __tablename__ = "slack_notifications"
 
@@ -76,5 +97,10 @@ class SlackNotifications(Base):
     scan_id = Column(
         Integer,
         ForeignKey("repository_security_scan.id"),
-        nullable=False,
+        nullable=True,
+    )
+    check_id = Column(
+        Integer,
+        ForeignKey("repository_security_check.id"),
+        nullable=True,
     )
@@ -1,13 +1,17 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List, NewType, Type, Union
+import enum
+import json
+from typing import Any, Dict, List, NewType, Optional, Type, Union
 
+from app.secbot.artifacts import ArtifactRef, get_artifact_store
+from app.secbot.exceptions import ArtifactStoreDisabled
 from app.secbot.inputs.gitlab.schemas.base import GitlabEvent
 from app.secbot.inputs.gitlab.schemas.merge_request import MergeRequestWebhookModel
 from app.secbot.inputs.gitlab.schemas.output_responses import OutputResponse
 from app.secbot.inputs.gitlab.schemas.push import PushWebhookModel
 from app.secbot.inputs.gitlab.schemas.tag import TagWebhookModel
-from app.secbot.schemas import SecbotBaseModel
+from app.secbot.schemas import SecbotBaseModel, SecbotFailedResult, SecurityCheckStatus
 
 # A generated hash string of GitLab event.
 # To reference, look at the `generate_gitlab_security_id` method.
@@ -30,6 +34,37 @@ def get_gitlab_model_for_event(event: GitlabEvent, data: dict) -> AnyGitlabModel
     return model(**data, raw=data)
 
 
+class RepositoryFetchStrategy(str, enum.Enum):
+    # The full clone of all the branches with all the history
+    CLONE = "clone"
+    # The fetch of the target commit only, at the depth
+    SHALLOW = "shallow"
+    # The fetch of the missing commits into the cached mirror of the repository,
+    # checked out into a worktree, see `app.secbot.inputs.gitlab.mirrors`
+    MIRROR = "mirror"
+
+
+class RepositoryFetchConfig(SecbotBaseModel):
+    """Options of the repository fetch of the scan handlers.
+
+    The scanners that need only the tree of the commit take the shallow
+    fetch of depth 1, the history-aware ones may take a deeper one, or
+    the range from the base commit, see `clone_repository`.
+    """
+
+    strategy: RepositoryFetchStrategy = RepositoryFetchStrategy.CLONE
+    depth: int = 1
+    # Partial clone: the blobs are fetched only for the checked out tree
+    blobless: bool = False
+
+
+class ScanMode(str, enum.Enum):
+    # The scan of the whole history of the repository
+    FULL = "full"
+    # The scan of the new commits of the event only
+    INCREMENTAL = "incremental"
+
+
 class GitlabInputData(SecbotBaseModel):
     """Input model for GitLab events."""
 
@@ -39,17 +74,38 @@ class GitlabInputData(SecbotBaseModel):
 
 
 class GitlabScanResultFile(SecbotBaseModel):
-    """Scan result file data for GitLab events."""
+    """Scan result file data for GitLab events.
+
+    The content is either passed within the model, or stored in the artifact
+    store and referenced by the `artifact`, see `app.secbot.artifacts`.
+    """
 
     commit_hash: str
     scan_name: str
     format: str
-    content: Union[Dict[str, Any], List[Dict[str, Any]]]
+    content: Optional[Union[Dict[str, Any], List[Dict[str, Any]]]] = None
+    artifact: Optional[ArtifactRef] = None
+    # The mode of the scan, and the range of the commits of the incremental one,
+    # e.g. `<base>..<commit>`, the findings are of these commits only
+    mode: Optional[ScanMode] = None
+    commits_range: Optional[str] = None
 
     @property
     def filename(self) -> str:
         return f"{self.commit_hash}_gitlab_{self.scan_name}.{self.format}"
 
+    async def read(self) -> bytes:
+        """Read the raw content of the file."""
+        if self.artifact is not None:
+            store = get_artifact_store()
+            if store is None:
+                raise ArtifactStoreDisabled(
+                    f"Artifact {self.artifact.key} of the {self.scan_name} scan "
+                    "can't be read, the artifact store is disabled"
+                )
+            return await store.get(self.artifact)
+        return json.dumps(self.content).encode()
+
 
 class GitlabScanResult(SecbotBaseModel):
     """Scan result model for GitLab events."""
@@ -68,3 +124,15 @@ class GitlabOutputResult(SecbotBaseModel):
     handler_name: str
     scan_result: GitlabScanResult
     response: OutputResponse
+
+
+class GitlabCheckResult(SecbotBaseModel):
+    """Aggregated result of all the scans of the security check for GitLab events.
+
+    Sent to the notifications once per check in the notifications fan-in mode.
+    """
+
+    input: GitlabInputData
+    status: SecurityCheckStatus
+    outputs: List[GitlabOutputResult]
+    failed: List[SecbotFailedResult]
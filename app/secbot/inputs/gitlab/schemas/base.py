@@ -1,6 +1,7 @@
 import abc
 import enum
 from datetime import datetime
+from typing import Optional
 
 from pydantic import AnyUrl, BaseModel
 
@@ -26,6 +27,7 @@ class Project(BaseModel):
     git_http_url: AnyUrl
     namespace: str
     path_with_namespace: str
+    default_branch: Optional[str] = None
 
 
 class Commit(BaseModel):
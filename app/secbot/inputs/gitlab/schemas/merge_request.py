@@ -1,9 +1,10 @@
 from __future__ import annotations
 
+from datetime import datetime
 from enum import Enum
 from typing import Optional
 
-from pydantic import AnyUrl, BaseModel
+from pydantic import AnyUrl, BaseModel, validator
 
 from app.secbot.inputs.gitlab.schemas.base import BaseGitlabEventData, Commit
 
@@ -20,12 +21,21 @@ class MergeRequestAction(str, Enum):
 
 class MergeRequestObjectAttributes(BaseModel):
     id: int
+    iid: int
     url: AnyUrl
     state: str
     target_branch: str
     source_branch: str
     action: Optional[MergeRequestAction]
     last_commit: Commit
+    updated_at: Optional[datetime] = None
+
+    @validator("updated_at", pre=True)
+    def parse_updated_at(cls, value):
+        # GitLab sends the time of the update as e.g. "2013-12-03 17:23:34 UTC"
+        if isinstance(value, str) and value.endswith(" UTC"):
+            return f"{value[:-4]}+00:00"
+        return value
 
 
 class MergeRequestWebhookModel(BaseGitlabEventData):
@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 
 from app.secbot.inputs.gitlab.schemas.base import (
     BaseGitlabEventData,
@@ -8,6 +8,8 @@ from app.secbot.inputs.gitlab.schemas.base import (
 
 
 class PushWebhookModel(BaseGitlabEventData):
+    # The previous head of the branch, zeros for the new branch
+    before: Optional[CommitHash] = None
     after: CommitHash
     ref: str
     commits: List[Commit]
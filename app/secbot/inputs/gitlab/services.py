@@ -1,7 +1,10 @@
+import os
+import shutil
 import tempfile
-from contextlib import contextmanager
-from datetime import datetime
-from typing import Dict, Optional, Union, cast
+import time
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Union, cast
 from urllib.parse import urlparse
 
 import git
@@ -11,54 +14,219 @@ from sqlalchemy import and_, select
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import async_scoped_session
 
+from app.metrics.common import get_location_labels_from_env
+from app.metrics.repository import (
+    SECBOT_REPOSITORY_FETCH_BYTES,
+    SECBOT_REPOSITORY_FETCH_TIME,
+)
 from app.secbot.db import db_session as async_db_session
-from app.secbot.exceptions import ScanCantBeScanned, ScanExecutionSkipped
+from app.secbot.dedupe import get_dispatch_deduplicator
+from app.secbot.exceptions import (
+    ScanCantBeScanned,
+    ScanExecutionSkipped,
+    ScanExecutionSuperseded,
+)
+from app.secbot.inputs.gitlab.mirrors import (
+    RepositoryCheckout,
+    get_received_packs_size,
+    get_repository_cache,
+    has_merge_base,
+)
 from app.secbot.inputs.gitlab.models import (
     RepositorySecurityCheck,
     RepositorySecurityScan,
 )
-from app.secbot.inputs.gitlab.schemas import GitlabWebhookSecurityID
+from app.secbot.inputs.gitlab.schemas import (
+    AnyGitlabModel,
+    GitlabWebhookSecurityID,
+    MergeRequestWebhookModel,
+    PushWebhookModel,
+    RepositoryFetchConfig,
+    RepositoryFetchStrategy,
+    ScanMode,
+)
 from app.secbot.inputs.gitlab.schemas.base import Project
-from app.secbot.inputs.gitlab.utils import get_config_from_host
+from app.secbot.inputs.gitlab.utils import get_config_from_host, get_fetch_limit
+from app.secbot.limits import get_concurrency_limiter
 from app.secbot.logger import logger
 from app.secbot.schemas import ScanStatus
 
+# The numbers of the commits the fetched range is deepened by, one after
+# another, until it reaches the merge base of the base and the reference
+RANGE_DEEPEN_STEPS = (50, 200, 1000)
+
 
 @contextmanager
 def clone_repository(
     repository_url: str,
     reference: str = "main",
+    fetch: Optional[RepositoryFetchConfig] = None,
+    base: Optional[str] = None,
+    scan_name: str = "",
 ):
     """
     Clone a Git repository to a temporary directory and checkout to a specific reference.
 
     This context manager clones a Git repository specified by its URL into a temporary
     directory, checks out to a certain reference (default to 'main'), and then cleans
-    up the directory once done.
+    up the directory once done. With the shallow fetch strategy, only the target
+    commit is fetched, see `fetch_revision`. With the mirror fetch strategy, the
+    commit is checked out from the cached mirror of the repository into a worktree,
+    see `RepositoryMirrorCache`.
+
+    The fetch holds a slot of the concurrency limit of the GitLab host, see
+    `app.secbot.limits`. The time of the clone and the size of the received packs
+    are exported per scan.
 
     Args:
         repository_url (str): The URL of the Git repository to clone.
         reference (str, optional): The Git reference to checkout. Defaults to 'main'.
+        fetch (RepositoryFetchConfig, optional): The fetch options. Defaults to
+            the full clone.
+        base (str, optional): The base commit of the range to be fetched along with
+            the reference, for the history-aware scanners.
+        scan_name (str, optional): The name of the scan the metrics are labeled by.
 
     Yields:
         str: The path to the temporary directory where the repository was cloned.
 
+    Raises:
+        AssertionError: If the hostname can't be parsed from the repository URL.
+    """
+    fetch = fetch or RepositoryFetchConfig()
+    repository_url = get_authorized_url(repository_url)
+    fetch_limit = get_fetch_limit(cast(str, urlparse(repository_url).hostname))
+    limiter = get_concurrency_limiter()
+
+    with ExitStack() as stack:
+        started = time.perf_counter()
+        if fetch.strategy is RepositoryFetchStrategy.MIRROR:
+            # The worktree outlives the fetch, only the fetch holds the slot
+            with limiter.hold_sync(fetch_limit):
+                checkout = stack.enter_context(
+                    get_repository_cache().checkout(repository_url, reference, base)
+                )
+        else:
+            temp_directory = stack.enter_context(tempfile.TemporaryDirectory())
+            with limiter.hold_sync(fetch_limit):
+                if fetch.strategy is RepositoryFetchStrategy.SHALLOW:
+                    fetch_revision(
+                        repository_url, temp_directory, reference, fetch, base
+                    )
+                else:
+                    repo = git.Repo.clone_from(repository_url, temp_directory)
+                    repo.git.checkout(reference)
+            checkout = RepositoryCheckout(
+                temp_directory,
+                get_received_packs_size(os.path.join(temp_directory, ".git")),
+            )
+
+        labels = {
+            "scan": scan_name,
+            "strategy": fetch.strategy.value,
+        }
+        SECBOT_REPOSITORY_FETCH_TIME.labels(
+            **get_location_labels_from_env(), **labels
+        ).observe(time.perf_counter() - started)
+        SECBOT_REPOSITORY_FETCH_BYTES.labels(
+            **get_location_labels_from_env(), **labels
+        ).observe(checkout.received_bytes)
+        yield checkout.path
+
+
+def get_authorized_url(repository_url: str) -> str:
+    """Add the credentials of the GitLab host to the repository URL.
+
     Raises:
         AssertionError: If the hostname can't be parsed from the repository URL.
     """
     host = urlparse(repository_url).hostname
     assert host
 
-    with tempfile.TemporaryDirectory() as temp_directory:
-        user = "oauth2"
-        token = get_config_from_host(host).auth_token.get_secret_value()
+    user = "oauth2"
+    token = get_config_from_host(host).auth_token.get_secret_value()
+    return str(yarl.URL(repository_url).with_user(user).with_password(token))
+
+
+def prefetch_repository(repository_url: str, reference: str) -> None:
+    """Fetch the commit into the cached mirror of the repository ahead of its scans."""
+    authorized_url = get_authorized_url(repository_url)
+    fetch_limit = get_fetch_limit(cast(str, urlparse(repository_url).hostname))
+    with get_concurrency_limiter().hold_sync(fetch_limit):
+        update = get_repository_cache().prefetch(authorized_url, reference)
+    logger.info(
+        f"Prefetched {reference} of {repository_url}: {update.result}, "
+        f"{update.received_bytes} bytes"
+    )
 
-        repository_url = str(
-            yarl.URL(repository_url).with_user(user).with_password(token)
-        )
-        repo = git.Repo.clone_from(repository_url, temp_directory)
-        repo.git.checkout(reference)
-        yield temp_directory
+
+def init_repository(repository_url: str, directory: str) -> git.Repo:
+    """Initialize the empty repository with the remote to fetch the commits from."""
+    repo = git.Repo.init(directory)
+    repo.create_remote("origin", repository_url)
+    with repo.config_writer() as writer:
+        # The received packs are kept as they are, so their size is the one
+        # of the transfer
+        writer.set_value("fetch", "unpackLimit", 1)
+    repo.git.update_environment(GIT_LFS_SKIP_SMUDGE="1", GIT_TERMINAL_PROMPT="0")
+    return repo
+
+
+def fetch_revision(
+    repository_url: str,
+    directory: str,
+    reference: str,
+    fetch: RepositoryFetchConfig,
+    base: Optional[str] = None,
+) -> git.Repo:
+    """Fetch only the commit of the reference into an empty repository, and check it out.
+
+    The commit is fetched at the depth of the fetch options, without the tags,
+    the other branches, and the LFS objects. With the base commit, the commits
+    of the range are fetched instead: the base commit itself, and the commits
+    of the reference since its commit date, so `base..reference` may be scanned.
+
+    The commits since the date of the base don't reach the merge base, if the
+    base is newer than the commits of the reference (e.g. the target branch
+    of the merge request has moved on), so both histories are deepened until
+    they reach it. Otherwise, only the commit of the reference is fetched,
+    and the repository has no merge base, see `has_merge_base`.
+    """
+    repo = init_repository(repository_url, directory)
+
+    options: Dict[str, Any] = {"no_tags": True}
+    if fetch.blobless:
+        options["filter"] = "blob:none"
+
+    try:
+        if not base or base == reference:
+            raise ValueError("No range to be fetched")
+        repo.git.fetch("origin", base, depth=1, **options)
+        since = repo.git.log("-1", "--format=%ct", base)
+        try:
+            repo.git.fetch("origin", reference, shallow_since=since, **options)
+        except git.GitCommandError:
+            # No commits of the reference since the base, the base is newer
+            repo.git.fetch("origin", reference, depth=fetch.depth, **options)
+        for deepen in (0, *RANGE_DEEPEN_STEPS):
+            if deepen:
+                repo.git.fetch("origin", base, reference, deepen=deepen, **options)
+            if has_merge_base(repo, base, reference):
+                break
+        else:
+            raise ValueError(f"No merge base of {base} and {reference} is fetched")
+    except (ValueError, git.GitCommandError) as exc:
+        # No range, the base is gone (e.g. by the force push), or the merge
+        # base is too deep in the history of the base and the reference
+        if base:
+            logger.info(f"Fetching {reference} at depth {fetch.depth}: {exc}")
+            # The fetched part of the range is dropped, so the full scan is
+            # of the history of the reference only
+            shutil.rmtree(repo.git_dir)
+            repo = init_repository(repository_url, directory)
+        repo.git.fetch("origin", reference, depth=fetch.depth, **options)
+    repo.git.checkout(reference)
+    return repo
 
 
 def get_gitlab_project_languages(project: Project) -> Optional[Dict[str, float]]:
@@ -168,14 +336,105 @@ async def get_or_create_security_scan(
     return scan
 
 
+# The statuses of the scans not worth to be dispatched again
+HANDLED_SCAN_STATUSES = (
+    ScanStatus.NEW,
+    ScanStatus.IN_PROGRESS,
+    ScanStatus.SKIP,
+    ScanStatus.DONE,
+)
+
+
+async def is_security_check_scanned(
+    db_session: async_scoped_session,
+    check_id: int,
+    scan_names: List[str],
+) -> bool:
+    """Check if all the given scans of the security check are already handled.
+
+    The scans are handled if they are new, in progress, skipped (e.g. of the
+    unsupported language) or done. The failed, the superseded, and the not
+    yet created scans are worth to be dispatched.
+
+    Args:
+        db_session (async_scoped_session): The database session to use for the operation.
+        check_id (int): The ID of the security check.
+        scan_names (List[str]): The names of the scans of the workflow job.
+
+    Returns:
+        bool: True if no scan of the security check needs to be run.
+    """
+    statuses = dict(
+        (
+            await db_session.execute(
+                select(
+                    [RepositorySecurityScan.scan_name, RepositorySecurityScan.status]
+                ).where(RepositorySecurityScan.check_id == check_id)
+            )
+        ).all()
+    )
+    return all(statuses.get(name) in HANDLED_SCAN_STATUSES for name in scan_names)
+
+
+async def add_security_check_scan_names(
+    db_session: async_scoped_session,
+    security_check: RepositorySecurityCheck,
+    scan_names: List[str],
+) -> None:
+    """Add the names of the dispatched scans to the security check.
+
+    The status of the check waits for all the scans dispatched for it,
+    including the ones of the earlier dispatches of the same check.
+
+    Args:
+        db_session (async_scoped_session): The database session to use for the operation.
+        security_check (RepositorySecurityCheck): The dispatched security check.
+        scan_names (List[str]): The names of the dispatched scans.
+    """
+    dispatched = list(dict.fromkeys([*(security_check.scan_names or []), *scan_names]))
+    if dispatched != security_check.scan_names:
+        security_check.scan_names = dispatched
+        await db_session.commit()
+
+
+async def supersede_security_check_scans(
+    db_session: async_scoped_session,
+    check_id: int,
+    scan_names: List[str],
+) -> None:
+    """Mark the not yet started scans of the security check as superseded.
+
+    The revoked tasks of the superseded check never create their scans,
+    so the scans are created as superseded here, otherwise the check would
+    wait for them forever. The scans in progress notice the supersession
+    themselves, see `app.secbot.inputs.gitlab.supersede.raise_if_superseded`.
+
+    Args:
+        db_session (async_scoped_session): The database session to use for the operation.
+        check_id (int): The ID of the superseded security check.
+        scan_names (List[str]): The names of the scans dispatched for the check.
+    """
+    for scan_name in scan_names:
+        scan = await get_or_create_security_scan(
+            db_session=db_session,
+            check_id=check_id,
+            scan_name=scan_name,
+        )
+        if scan.status is ScanStatus.NEW:
+            scan.status = ScanStatus.SUPERSEDED
+            scan.finished_at = datetime.now()
+            db_session.add(scan)
+    await db_session.commit()
+
+
 async def start_scan(scan_name: str, check_id: int) -> RepositorySecurityScan:
     """Initiate a security scan and update its status to 'IN_PROGRESS'.
 
     This asynchronous function starts a security scan by first fetching or creating
     a RepositorySecurityScan entry via the get_or_create_security_scan() function.
-    It then checks the current status of the scan. If the status is neither 'NEW' nor
-    'ERROR', an exception (ScanCantBeScanned) is raised, preventing the scan from starting.
-    If the status is either 'NEW' or 'ERROR', the function updates the status of the scan
+    It then checks the current status of the scan. If the status is neither 'NEW',
+    'ERROR' nor 'SUPERSEDED', an exception (ScanCantBeScanned) is raised, preventing the scan
+    from starting. Otherwise, the function updates the status of the scan
     to 'IN_PROGRESS', sets the start time to the current datetime, commits these changes
     to the database, and finally returns the RepositorySecurityScan entry.
 
@@ -187,7 +446,7 @@ async def start_scan(scan_name: str, check_id: int) -> RepositorySecurityScan:
         RepositorySecurityScan: The updated RepositorySecurityScan entry.
 
     Raises:
-        ScanCantBeScanned: If the status of the scan is not 'NEW' or 'ERROR'.
+        ScanCantBeScanned: If the status of the scan is not 'NEW', 'ERROR' or 'SUPERSEDED'.
     """
     async with async_db_session() as session:
         scan = await get_or_create_security_scan(
@@ -195,7 +454,12 @@ async def start_scan(scan_name: str, check_id: int) -> RepositorySecurityScan:
             check_id=check_id,
             scan_name=scan_name,
         )
-        if scan.status not in [ScanStatus.NEW, ScanStatus.ERROR]:
+        # The scans of the superseded commit may be dispatched again
+        if scan.status not in [
+            ScanStatus.NEW,
+            ScanStatus.ERROR,
+            ScanStatus.SUPERSEDED,
+        ]:
             raise ScanCantBeScanned(
                 f"Scan can't be scanned: reason={scan.status}",
                 scan.id,
@@ -204,6 +468,8 @@ async def start_scan(scan_name: str, check_id: int) -> RepositorySecurityScan:
         # Update the scan status to In progress
         scan.status = ScanStatus.IN_PROGRESS
         scan.started_at = datetime.now()
+        # The outputs of the new run don't continue the previous one
+        scan.outputs_progress = None
 
         session.add(scan)
         await session.commit()
@@ -211,6 +477,138 @@ async def start_scan(scan_name: str, check_id: int) -> RepositorySecurityScan:
         return scan
 
 
+async def is_full_scan_due(
+    *,
+    scan_id: int,
+    scan_name: str,
+    project_path: str,
+    interval: int,
+) -> bool:
+    """Whether the full scan of the project is due, instead of the incremental one.
+
+    The full scan is due on the first scan of the project, and once the last full
+    scan (finished, or still in progress) is older than the interval.
+
+    Args:
+        scan_id (int): The ID of the current scan, it's not counted.
+        scan_name (str): The name of the scan.
+        project_path (str): The path of the project, e.g. its homepage.
+        interval (int): The interval of the full scans in seconds.
+    """
+    async with async_db_session() as session:
+        last_full_scan_id = (
+            await session.execute(
+                select(RepositorySecurityScan.id)
+                .join(RepositorySecurityCheck)
+                .where(
+                    and_(
+                        RepositorySecurityScan.id != scan_id,
+                        RepositorySecurityScan.scan_name == scan_name,
+                        RepositorySecurityScan.mode == ScanMode.FULL.value,
+                        RepositorySecurityScan.status.in_(
+                            [ScanStatus.IN_PROGRESS, ScanStatus.DONE]
+                        ),
+                        RepositorySecurityScan.started_at
+                        >= datetime.now() - timedelta(seconds=interval),
+                        RepositorySecurityCheck.path == project_path,
+                    )
+                )
+                .limit(1)
+            )
+        ).scalar()
+    return last_full_scan_id is None
+
+
+def get_branch_head(repository_url: str, branch: str) -> Optional[str]:
+    """Get the commit of the head of the branch, None if there's no such branch."""
+    output = cast(
+        str,
+        git.cmd.Git().ls_remote(
+            get_authorized_url(repository_url), f"refs/heads/{branch}"
+        ),
+    )
+    return output.split()[0] if output else None
+
+
+def get_incremental_base(data: AnyGitlabModel) -> Optional[str]:
+    """Get the base commit of the new commits of the event, if it has any.
+
+    The new commits of the push are the ones since the previous head of the branch,
+    or since the head of the default branch for the new branch. The new commits
+    of the merge request are the ones not in its target branch, i.e. since their
+    merge base. The tag pushes have no new commits to be scanned incrementally.
+    """
+    if isinstance(data, PushWebhookModel):
+        if (data.before or "").strip("0"):
+            return data.before
+        if not data.project.default_branch:
+            return None
+        base = get_branch_head(data.project.git_http_url, data.project.default_branch)
+    elif isinstance(data, MergeRequestWebhookModel):
+        base = get_branch_head(data.project.git_http_url, data.target_branch)
+    else:
+        return None
+    return base if base != data.commit.id else None
+
+
+async def get_output_progress(*, scan_id: int, output_component_name: str) -> Dict:
+    """Get the progress of the output of the current run of the scan.
+
+    Args:
+        scan_id (int): The ID of the scan.
+        output_component_name (str): The name of the output component.
+
+    Returns:
+        Dict: The progress saved by the output, empty if it hasn't been saved.
+    """
+    async with async_db_session() as session:
+        outputs_progress = (
+            await session.execute(
+                select(RepositorySecurityScan.outputs_progress).where(
+                    RepositorySecurityScan.id == scan_id
+                )
+            )
+        ).scalar()
+    return (outputs_progress or {}).get(output_component_name) or {}
+
+
+async def save_output_progress(
+    *,
+    scan_id: int,
+    output_component_name: str,
+    progress: Dict,
+):
+    """Save the progress of the output of the scan.
+
+    The outputs waiting for the external services (e.g. for the processing
+    of the uploaded report) continue in the next tasks, so the progress
+    is kept on the scan to continue from it if a task is redelivered.
+
+    Args:
+        scan_id (int): The ID of the scan.
+        output_component_name (str): The name of the output component.
+        progress (Dict): The JSON-serializable progress of the output.
+
+    Raises:
+        AssertionError: If the scan with the provided scan_id does not exist.
+    """
+    async with async_db_session() as session:
+        scan = (
+            await session.execute(
+                select(RepositorySecurityScan).where(
+                    RepositorySecurityScan.id == scan_id
+                )
+            )
+        ).scalar()
+        assert scan is not None, "Scan id is not defined"
+
+        scan.outputs_progress = {
+            **(scan.outputs_progress or {}),
+            output_component_name: progress,
+        }
+        await session.commit()
+
+
 async def complete_scan(
     *,
     scan_id: int,
@@ -268,8 +666,12 @@ async def handle_exception(
     according to the type of exception that occurred. If the scan cannot be found,
     it logs a warning and re-raises the exception.
 
-    If the exception is of type ScanExecutionSkipped, the scan status is updated to 'SKIP'.
-    For any other type of exception, the scan status is set to 'ERROR'.
+    If the exception is of type ScanExecutionSkipped, the scan status is updated to 'SKIP',
+    or to 'SUPERSEDED' for ScanExecutionSuperseded.
+    If the exception is of type ScanCantBeScanned, the scan belongs to a duplicate
+    dispatch, and its status is left as is. For any other type of exception,
+    the scan status is set to 'ERROR', and the security check is allowed
+    to be dispatched again.
 
     Args:
         check_id (int): The ID of the security check associated with the scan.
@@ -300,7 +702,14 @@ async def handle_exception(
             logger.warning("Scan id is not defined")
             raise exception
 
-        if isinstance(exception, ScanExecutionSkipped):
+        if isinstance(exception, ScanCantBeScanned):
+            # The scan is already handled by another dispatch of the same check
+            return
+
+        if isinstance(exception, ScanExecutionSuperseded):
+            # The commit may be dispatched again, e.g. by the force push back to it
+            scan.status = ScanStatus.SUPERSEDED
+        elif isinstance(exception, ScanExecutionSkipped):
             # We mark the scan as skipped in order that scan has been failed
             # but in good way (e.g. we don't support the language).
             # Later, the scan will be not be used in result checks.
@@ -308,3 +717,13 @@ async def handle_exception(
         else:
             scan.status = ScanStatus.ERROR
         await session.commit()
+
+        if scan.status is ScanStatus.ERROR:
+            external_id = (
+                await session.execute(
+                    select(RepositorySecurityCheck.external_id).where(
+                        RepositorySecurityCheck.id == check_id
+                    )
+                )
+            ).scalar()
+            await get_dispatch_deduplicator().release(external_id)
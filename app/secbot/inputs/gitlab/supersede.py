@@ -0,0 +1,208 @@
+"""Superseding of the merge request scans by the newer commits.
+
+When a developer pushes several commits to a merge request in a row, only the
+newest one matters for the gate. Every merge request (project id + MR iid)
+remembers its latest revision in Redis, i.e. the commit and the tasks
+dispatched for it. A newer revision revokes the queued tasks of the previous
+one, and marks its not yet started scans as superseded. The running scans of
+the previous revision notice they are superseded at their checkpoints
+(see `raise_if_superseded`) and are marked so too.
+
+The revisions are ordered by the time of the merge request update, not by
+the time of the commit: a force-push may bring an older commit, and the time
+of the update is kept by the re-delivered events.
+"""
+import json
+import time
+from typing import List, Optional, Tuple
+
+from celery import Celery
+from celery.result import AsyncResult, GroupResult
+from pydantic import BaseModel
+from redis import asyncio as aioredis
+
+from app.secbot.db import db_session
+from app.secbot.dedupe import get_dispatch_deduplicator
+from app.secbot.exceptions import ScanExecutionSuperseded
+from app.secbot.inputs.gitlab.schemas import AnyGitlabModel, MergeRequestWebhookModel
+from app.secbot.inputs.gitlab.services import supersede_security_check_scans
+from app.secbot.logger import logger
+from app.secbot.redis import get_redis
+from app.secbot.settings import settings
+
+
+class MergeRequestRevision(BaseModel):
+    """The commit of a merge request and the tasks dispatched to scan it.
+
+    The timestamp is the time of the merge request update the commit came with.
+    """
+
+    commit: str
+    timestamp: float
+    check_id: Optional[int] = None
+    security_id: Optional[str] = None
+    scan_names: List[str] = []
+    task_ids: List[str] = []
+
+
+# Replaces the revision only if it is not older than the current one,
+# so out of order events don't supersede the newer commits.
+# Returns the current revision and whether it has been replaced.
+REPLACE_REVISION_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if current and cjson.decode(current)['timestamp'] > tonumber(ARGV[2]) then
+    return {0, current}
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+return {1, current or ''}
+"""
+
+
+class MergeRequestRevisions:
+    """Registry of the latest revisions of the merge requests."""
+
+    key_prefix = "secbot:gitlab:mr"
+
+    def __init__(self, redis: aioredis.Redis, ttl: int):
+        self.redis = redis
+        self.ttl = ttl
+
+    def key(self, data: MergeRequestWebhookModel) -> str:
+        return f"{self.key_prefix}:{data.project.id}:{data.object_attributes.iid}"
+
+    async def latest(
+        self, data: MergeRequestWebhookModel
+    ) -> Optional[MergeRequestRevision]:
+        if value := await self.redis.get(self.key(data)):
+            return MergeRequestRevision.parse_raw(value)
+        return None
+
+    async def replace(
+        self,
+        data: MergeRequestWebhookModel,
+        revision: MergeRequestRevision,
+    ) -> Tuple[bool, Optional[MergeRequestRevision]]:
+        """Make the revision the latest one of the merge request.
+
+        Returns:
+            Whether the revision has been replaced (it isn't if the given
+            revision is older than the latest one) and the previous latest one.
+        """
+        replaced, current = await self.redis.eval(
+            REPLACE_REVISION_SCRIPT,
+            1,
+            self.key(data),
+            revision.json(),
+            revision.timestamp,
+            self.ttl,
+        )
+        previous = MergeRequestRevision(**json.loads(current)) if current else None
+        return bool(replaced), previous
+
+    async def is_superseded(self, data: MergeRequestWebhookModel) -> bool:
+        latest = await self.latest(data)
+        return latest is not None and latest.commit != data.commit.id
+
+
+def get_merge_request_revisions() -> MergeRequestRevisions:
+    return MergeRequestRevisions(get_redis(), ttl=settings.gitlab_mr_revision_ttl)
+
+
+def get_revision_timestamp(data: MergeRequestWebhookModel) -> float:
+    """Get the time of the merge request update, the time of the delivery
+    for the events without it."""
+    if data.object_attributes.updated_at is None:
+        return time.time()
+    return data.object_attributes.updated_at.timestamp()
+
+
+def get_chain_root_ids(result: AsyncResult) -> List[str]:
+    """Get the ids of the first tasks of the celery chain.
+
+    Revoking the first task is enough to drop the whole queued chain.
+    The chord (the notifications fan-in) starts with all its header chains.
+    """
+    while result.parent is not None:
+        result = result.parent
+    if isinstance(result, GroupResult):
+        return [
+            task_id
+            for child in result.results
+            for task_id in get_chain_root_ids(child)
+        ]
+    return [result.id]
+
+
+async def supersede_merge_request(
+    celery_app: Celery,
+    data: MergeRequestWebhookModel,
+    check_id: int,
+    security_id: str,
+    scan_names: List[str],
+    results: List[AsyncResult],
+) -> None:
+    """Record the dispatched commit as the latest one of the merge request,
+    and revoke the queued tasks of the superseded commit.
+
+    The dispatch of the superseded check is released, so its commit is
+    scanned if it's dispatched again, e.g. by the force push back to it.
+
+    Args:
+        celery_app: The celery application to revoke the tasks with.
+        data: The merge request event of the dispatched commit.
+        check_id: The ID of the security check of the dispatched commit.
+        security_id: The external ID of the security check.
+        scan_names: The names of the scans dispatched for the check.
+        results: The results of the dispatched workflows.
+    """
+    revision = MergeRequestRevision(
+        commit=data.commit.id,
+        timestamp=get_revision_timestamp(data),
+        check_id=check_id,
+        security_id=security_id,
+        scan_names=scan_names,
+        task_ids=[
+            task_id for result in results for task_id in get_chain_root_ids(result)
+        ],
+    )
+    replaced, previous = await get_merge_request_revisions().replace(data, revision)
+    superseded: Optional[MergeRequestRevision]
+    latest: Optional[MergeRequestRevision]
+    if replaced:
+        superseded, latest = previous, revision
+    else:
+        # The event came out of order, and a newer commit is already dispatched
+        superseded, latest = revision, previous
+    if superseded is None or latest is None or superseded.commit == latest.commit:
+        return
+
+    logger.info(
+        f"Commit {superseded.commit} of merge request "
+        f"{data.object_attributes.url} is superseded"
+    )
+    if superseded.task_ids:
+        celery_app.control.revoke(superseded.task_ids)
+    # The revoked tasks never create their scans, and the check would stay
+    # in progress without them
+    if superseded.check_id is not None:
+        async with db_session() as session:
+            await supersede_security_check_scans(
+                db_session=session,
+                check_id=superseded.check_id,
+                scan_names=superseded.scan_names,
+            )
+    if superseded.security_id is not None:
+        await get_dispatch_deduplicator().release(superseded.security_id)
+
+
+async def raise_if_superseded(data: AnyGitlabModel) -> None:
+    """Cooperatively cancel the scan of the superseded merge request commit.
+
+    Raises:
+        ScanExecutionSuperseded: If a newer commit of the merge request has been
+            dispatched, so the scan is marked as superseded by `handle_exception`.
+    """
+    if not isinstance(data, MergeRequestWebhookModel):
+        return
+    if await get_merge_request_revisions().is_superseded(data):
+        raise ScanExecutionSuperseded(f"Commit {data.commit.id} is superseded")
@@ -4,6 +4,7 @@ from pathlib import Path
 import yarl
 
 from app.secbot.inputs.gitlab.schemas import AnyGitlabModel, GitlabWebhookSecurityID
+from app.secbot.limits import ConcurrencyLimit
 from app.settings import GitlabConfig, settings
 
 
@@ -86,3 +87,10 @@ def get_config_from_host(host: str) -> GitlabConfig:
     return next(
         config for config in settings.gitlab_configs if config.host.host == host
     )
+
+
+def get_fetch_limit(host: str) -> ConcurrencyLimit:
+    """Get the limit of the concurrent fetches of the repositories from the host."""
+    return ConcurrencyLimit(
+        name=f"gitlab:{host}", limit=get_config_from_host(host).fetch_concurrency
+    )
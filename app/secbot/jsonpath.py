@@ -0,0 +1,110 @@
+"""Compiled JSONPath accessors of the workflow rules.
+
+The supported subset of JSONPath:
+
+* `project.path_with_namespace` - dotted keys of the nested objects;
+* `commits[0].id`, `commits[-1].id` - indexes of the arrays;
+* `labels[*].title` - all the items of the arrays;
+* `['key.with.dots']` - keys with the special characters;
+* an optional leading `$.` - the root object.
+
+A path is compiled once into an accessor that returns the list of the values
+found in the data (empty if there are none), so it isn't parsed per event.
+"""
+import re
+from typing import Any, Callable, List, Union
+
+JsonPathAccessor = Callable[[Any], List[Any]]
+
+
+class Wildcard:
+    def __repr__(self) -> str:
+        return "[*]"
+
+
+WILDCARD = Wildcard()
+
+Step = Union[str, int, Wildcard]
+
+TOKEN_REGEX = re.compile(
+    r"""
+    \.?(?P<key>[^.\[\]'"]+)       # .key
+    | \[(?P<index>-?\d+)\]        # [0]
+    | \[(?P<wildcard>\*)\]        # [*]
+    | \['(?P<quoted>[^']*)'\]     # ['key']
+    """,
+    re.VERBOSE,
+)
+
+
+def parse_jsonpath(path: str) -> List[Step]:
+    """Split the path into the steps: keys, indexes and wildcards.
+
+    Raises:
+        ValueError: If the path is not valid.
+    """
+    steps: List[Step] = []
+    position = 2 if path.startswith("$.") else 0
+    while position < len(path):
+        match = TOKEN_REGEX.match(path, position)
+        if match is None or (steps and path[position] not in ".["):
+            raise ValueError(f"Invalid JSONPath {path!r} at position {position}")
+        if match["key"] is not None:
+            steps.append(match["key"])
+        elif match["index"] is not None:
+            steps.append(int(match["index"]))
+        elif match["wildcard"] is not None:
+            steps.append(WILDCARD)
+        else:
+            steps.append(match["quoted"])
+        position = match.end()
+    if not steps:
+        raise ValueError(f"Empty JSONPath {path!r}")
+    return steps
+
+
+def compile_jsonpath(path: str) -> JsonPathAccessor:
+    """Compile the path into the accessor of its values.
+
+    Raises:
+        ValueError: If the path is not valid.
+    """
+    steps = parse_jsonpath(path)
+
+    if WILDCARD not in steps:
+        # The fast path: the path has a single value at most
+        def get_value(data: Any) -> List[Any]:
+            try:
+                for step in steps:
+                    if isinstance(step, int) and not isinstance(data, list):
+                        return []
+                    data = data[step]
+            except (KeyError, IndexError, TypeError):
+                return []
+            return [data]
+
+        return get_value
+
+    def get_values(data: Any) -> List[Any]:
+        values = [data]
+        for step in steps:
+            if step is WILDCARD:
+                values = [
+                    item
+                    for value in values
+                    if isinstance(value, list)
+                    for item in value
+                ]
+                continue
+            found = []
+            for value in values:
+                if isinstance(step, int) and not isinstance(value, list):
+                    continue
+                try:
+                    found.append(value[step])
+                except (KeyError, IndexError, TypeError):
+                    continue
+            values = found
+        return values
+
+    return get_values
@@ -0,0 +1,305 @@
+"""Distributed concurrency limits of the external services.
+
+Every worker process talks to the external services on its own, so scaling
+the workers up multiplies the concurrent clones from a GitLab host, or the
+concurrent uploads to DefectDojo, until the services throttle them and
+everything gets slower. The limits are enforced across all the worker
+processes by the semaphores in Redis: a slot of the semaphore is leased to
+its holder, and the lease is renewed while the slot is held, so the slots
+of the crashed workers expire with their leases instead of leaking.
+
+The limits are declared per GitLab host (`fetch_concurrency` of the GitLab
+config), and per handler (`concurrency` of the component in the workflow
+config). The limit of the handler is passed with its tasks, and applied to
+the requests of the handler by `hold_handler_limit`.
+"""
+import asyncio
+import contextlib
+import contextvars
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Iterator, Optional, Tuple, TypeVar
+
+import redis
+from redis import asyncio as aioredis
+
+from app.metrics.common import get_location_labels_from_env
+from app.metrics.limits import (
+    SECBOT_LIMIT_SATURATION,
+    SECBOT_LIMIT_TIMEOUTS,
+    SECBOT_LIMIT_WAIT,
+)
+from app.secbot.exceptions import ConcurrencyLimitTimeout
+from app.secbot.redis import get_redis, get_sync_redis
+from app.secbot.settings import settings
+
+T = TypeVar("T")
+
+# Drops the expired leases, and leases a slot to the token if there's a free one.
+# The leases are the scores of the sorted set in milliseconds of the Redis clock,
+# so the clocks of the workers don't matter. Returns whether the slot has been
+# leased, and the number of the held slots.
+ACQUIRE_SCRIPT = """
+local time = redis.call('TIME')
+local now = time[1] * 1000 + math.floor(time[2] / 1000)
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+local holders = redis.call('ZCARD', KEYS[1])
+if holders < tonumber(ARGV[1]) then
+    redis.call('ZADD', KEYS[1], now + tonumber(ARGV[2]), ARGV[3])
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return {1, holders + 1}
+end
+return {0, holders}
+"""
+
+# Extends the lease of the token, unless it has expired already.
+RENEW_SCRIPT = """
+if not redis.call('ZSCORE', KEYS[1], ARGV[2]) then
+    return 0
+end
+local time = redis.call('TIME')
+local now = time[1] * 1000 + math.floor(time[2] / 1000)
+redis.call('ZADD', KEYS[1], now + tonumber(ARGV[1]), ARGV[2])
+redis.call('PEXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+# Frees the slot of the token. Returns the number of the held slots.
+RELEASE_SCRIPT = """
+redis.call('ZREM', KEYS[1], ARGV[1])
+return redis.call('ZCARD', KEYS[1])
+"""
+
+
+@dataclass(frozen=True)
+class ConcurrencyLimit:
+    """The limit of the concurrent holders, 0 means no limit.
+
+    Args:
+        name: The name of the limit, e.g. `gitlab:<host>` or `handler:<name>`.
+        limit: The number of the slots shared by all the worker processes.
+    """
+
+    name: str
+    limit: int
+
+    @property
+    def enabled(self) -> bool:
+        return self.limit > 0
+
+
+# The limit of the handler of the current task
+HANDLER_LIMIT: contextvars.ContextVar[
+    Optional[ConcurrencyLimit]
+] = contextvars.ContextVar("secbot_handler_limit", default=None)
+
+
+class ConcurrencyLimiter:
+    """Semaphores with leases in Redis shared by all the worker processes.
+
+    Both the coroutines (e.g. the requests of the output handlers) and the
+    blocking code (e.g. the git operations of the scans) hold the slots,
+    so the limiter takes the async and the sync Redis clients.
+
+    Args:
+        redis: The asyncio redis of the semaphores.
+        sync_redis: The synchronous redis of the semaphores.
+        lease: Seconds the slot is leased for, it's renewed every third of it.
+        poll_interval: Seconds between the attempts to acquire the slot.
+        timeout: Seconds to wait for the slot, 0 waits indefinitely.
+    """
+
+    key_prefix = "secbot:limits"
+
+    def __init__(
+        self,
+        redis: aioredis.Redis,
+        sync_redis: redis.Redis,
+        lease: float = 60,
+        poll_interval: float = 0.5,
+        timeout: float = 0,
+    ):
+        self.redis = redis
+        self.sync_redis = sync_redis
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+
+    def key(self, limit: ConcurrencyLimit) -> str:
+        return f"{self.key_prefix}:{limit.name}"
+
+    @property
+    def lease_ms(self) -> int:
+        return int(self.lease * 1000)
+
+    def observe(self, limit: ConcurrencyLimit, holders: int) -> None:
+        SECBOT_LIMIT_SATURATION.labels(
+            **get_location_labels_from_env(), limit=limit.name
+        ).set(holders / limit.limit)
+
+    def attempted(
+        self, limit: ConcurrencyLimit, result: Tuple[int, int], started: float
+    ) -> bool:
+        """Handle the result of the attempt to acquire the slot.
+
+        Returns:
+            Whether the slot has been acquired.
+
+        Raises:
+            ConcurrencyLimitTimeout: If the slot isn't acquired in time.
+        """
+        acquired, holders = map(int, result)
+        self.observe(limit, holders)
+        waited = time.monotonic() - started
+        labels = {"limit": limit.name}
+        if acquired:
+            SECBOT_LIMIT_WAIT.labels(
+                **get_location_labels_from_env(), **labels
+            ).observe(waited)
+            return True
+        if self.timeout and waited + self.poll_interval > self.timeout:
+            SECBOT_LIMIT_TIMEOUTS.labels(
+                **get_location_labels_from_env(), **labels
+            ).inc()
+            raise ConcurrencyLimitTimeout(
+                f"No slot of {limit.name} is free in {self.timeout} seconds"
+            )
+        return False
+
+    async def acquire(self, limit: ConcurrencyLimit) -> str:
+        """Wait for the free slot of the limit, and lease it.
+
+        Returns:
+            The token of the leased slot.
+        """
+        token = uuid.uuid4().hex
+        started = time.monotonic()
+        while True:
+            result = await self.redis.eval(
+                ACQUIRE_SCRIPT, 1, self.key(limit), limit.limit, self.lease_ms, token
+            )
+            if self.attempted(limit, result, started):
+                return token
+            await asyncio.sleep(self.poll_interval)
+
+    async def renew(self, limit: ConcurrencyLimit, token: str) -> bool:
+        """Extend the lease of the slot, False if it has expired already."""
+        return bool(
+            await self.redis.eval(
+                RENEW_SCRIPT, 1, self.key(limit), self.lease_ms, token
+            )
+        )
+
+    async def release(self, limit: ConcurrencyLimit, token: str) -> None:
+        holders = await self.redis.eval(RELEASE_SCRIPT, 1, self.key(limit), token)
+        self.observe(limit, int(holders))
+
+    async def keep_alive(self, limit: ConcurrencyLimit, token: str) -> None:
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            if not await self.renew(limit, token):
+                return
+
+    @contextlib.asynccontextmanager
+    async def hold(self, limit: Optional[ConcurrencyLimit]) -> AsyncIterator[None]:
+        """Hold a slot of the limit, no-op without the limit."""
+        if limit is None or not limit.enabled:
+            yield
+            return
+        token = await self.acquire(limit)
+        keep_alive = asyncio.ensure_future(self.keep_alive(limit, token))
+        try:
+            yield
+        finally:
+            keep_alive.cancel()
+            await self.release(limit, token)
+
+    def acquire_sync(self, limit: ConcurrencyLimit) -> str:
+        """The blocking `acquire`."""
+        token = uuid.uuid4().hex
+        started = time.monotonic()
+        while True:
+            result = self.sync_redis.eval(
+                ACQUIRE_SCRIPT, 1, self.key(limit), limit.limit, self.lease_ms, token
+            )
+            if self.attempted(limit, result, started):
+                return token
+            time.sleep(self.poll_interval)
+
+    def renew_sync(self, limit: ConcurrencyLimit, token: str) -> bool:
+        return bool(
+            self.sync_redis.eval(
+                RENEW_SCRIPT, 1, self.key(limit), self.lease_ms, token
+            )
+        )
+
+    def release_sync(self, limit: ConcurrencyLimit, token: str) -> None:
+        holders = self.sync_redis.eval(RELEASE_SCRIPT, 1, self.key(limit), token)
+        self.observe(limit, int(holders))
+
+    @contextlib.contextmanager
+    def hold_sync(self, limit: Optional[ConcurrencyLimit]) -> Iterator[None]:
+        """The blocking `hold`, the lease is renewed by a thread."""
+        if limit is None or not limit.enabled:
+            yield
+            return
+        token = self.acquire_sync(limit)
+        released = threading.Event()
+
+        def keep_alive(held: ConcurrencyLimit):
+            while not released.wait(self.lease / 3):
+                if not self.renew_sync(held, token):
+                    return
+
+        thread = threading.Thread(
+            target=keep_alive,
+            args=(limit,),
+            name="secbot-limit-keep-alive",
+            daemon=True,
+        )
+        thread.start()
+        try:
+            yield
+        finally:
+            released.set()
+            thread.join()
+            self.release_sync(limit, token)
+
+
+def get_concurrency_limiter() -> ConcurrencyLimiter:
+    return ConcurrencyLimiter(
+        get_redis(),
+        get_sync_redis(),
+        lease=settings.concurrency_lease_seconds,
+        poll_interval=settings.concurrency_poll_interval,
+        timeout=settings.concurrency_wait_timeout,
+    )
+
+
+def get_handler_limit(handler_name: str, concurrency: int) -> ConcurrencyLimit:
+    return ConcurrencyLimit(name=f"handler:{handler_name}", limit=concurrency)
+
+
+async def with_handler_limit(
+    coroutine: Awaitable[T], limit: Optional[ConcurrencyLimit]
+) -> T:
+    """Run the coroutine of the handler task with the limit of the handler."""
+    # The coroutine runs in its own task, so the limit doesn't leak to the others
+    HANDLER_LIMIT.set(limit)
+    return await coroutine
+
+
+@contextlib.asynccontextmanager
+async def hold_handler_limit() -> AsyncIterator[None]:
+    """Hold a slot of the limit of the handler of the current task, if it has one.
+
+    E.g. the requests of the handler to its external service are wrapped with it.
+    """
+    limit = HANDLER_LIMIT.get()
+    if limit is None or not limit.enabled:
+        yield
+        return
+    async with get_concurrency_limiter().hold(limit):
+        yield
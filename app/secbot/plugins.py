@@ -0,0 +1,233 @@
+"""Manifest of the secbot plugins: the inputs and their handlers.
+
+The manifest (`plugins.json`) maps the names of the inputs and handlers
+to their classes, so the processes don't have to import every plugin
+package at the startup to discover them. The plugins are imported
+on first use instead, see `LazyRegistry`, and the worker loads them all
+at once to register their celery tasks.
+
+The manifest is generated from the plugin packages by
+
+    python -m app.secbot.plugins
+
+and the packages are discovered at the runtime when it is missing.
+"""
+import argparse
+import functools
+import importlib
+import inspect
+import json
+import os
+import pathlib
+import pkgutil
+import sys
+import threading
+from typing import Callable, Dict, Iterator, Mapping, Optional, Tuple, TypeVar, Union
+
+from pydantic import BaseModel, Field
+
+from app.secbot.logger import logger
+
+T = TypeVar("T")
+
+MANIFEST_PATH = pathlib.Path(__file__).parent / "plugins.json"
+INPUTS_PACKAGE = "app.secbot.inputs"
+
+
+class PluginEntry(BaseModel):
+    module: str
+    cls: str = Field(alias="class")
+
+    class Config:
+        allow_population_by_field_name = True
+
+    def load(self) -> type:
+        """Import the class of the plugin."""
+        cls: type = getattr(importlib.import_module(self.module), self.cls)
+        return cls
+
+
+class InputPluginEntry(PluginEntry):
+    # The handlers of the input by the components group
+    # ("scans", "outputs", "notifications") and the handler name
+    handlers: Dict[str, Dict[str, PluginEntry]] = {}
+
+
+class PluginManifest(BaseModel):
+    inputs: Dict[str, InputPluginEntry] = {}
+
+    def dumps(self) -> str:
+        return json.dumps(self.dict(by_alias=True), indent=2, sort_keys=True) + "\n"
+
+
+class LazyRegistry(Mapping[str, T]):
+    """Registry of the plugins, instantiated on first use.
+
+    The plugins declared by the manifest are imported and instantiated
+    by the factory when they are got for the first time. The plugins
+    that can't be imported are reported and considered missing.
+
+    Args:
+        factory: The factory of the plugin instance by its name and class.
+    """
+
+    def __init__(self, factory: Callable[[str, type], T]):
+        self._factory = factory
+        self._entries: Dict[str, PluginEntry] = {}
+        self._instances: Dict[str, T] = {}
+        # The threads of the async worker may get the same plugin at once
+        self._lock = threading.Lock()
+
+    def declare(self, name: str, entry: PluginEntry) -> None:
+        """Declare the plugin to be imported on first use."""
+        self._entries[name] = entry
+
+    def __setitem__(self, name: str, instance: T) -> None:
+        self._instances[name] = instance
+
+    def __getitem__(self, name: str) -> T:
+        if name in self._instances:
+            return self._instances[name]
+        entry = self._entries[name]
+        with self._lock:
+            if name not in self._instances:
+                try:
+                    cls = entry.load()
+                except (ImportError, AttributeError) as exc:
+                    logger.warning(
+                        f"Could not import {entry.module}.{entry.cls}. Error: {exc}"
+                    )
+                    raise KeyError(name) from exc
+                self._instances[name] = self._factory(name, cls)
+        return self._instances[name]
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._instances
+        yield from (name for name in self._entries if name not in self._instances)
+
+    def __len__(self) -> int:
+        return len(self._entries.keys() | self._instances.keys())
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._instances or name in self._entries
+
+    def load_all(self) -> Dict[str, T]:
+        """Instantiate all the declared plugins, skipping the missing ones."""
+        instances = {}
+        for name in list(self):
+            try:
+                instances[name] = self[name]
+            except KeyError:
+                continue
+        return instances
+
+
+def iter_plugin_modules(package: str) -> Iterator[Tuple[str, object]]:
+    """Import the subpackages of the package, skipping the broken ones."""
+    try:
+        module_file = importlib.import_module(package).__file__
+    except ModuleNotFoundError:
+        return
+    if module_file is None:
+        return
+    path = os.path.dirname(module_file)
+    for _, name, _ in pkgutil.iter_modules([path]):
+        full_name = f"{package}.{name}"
+        try:
+            yield name, importlib.import_module(full_name)
+        except ImportError as e:
+            logger.warning(f"Could not import {full_name}. Error: {str(e)}")
+
+
+def find_plugin_class(
+    module, base: Union[type, Tuple[type, ...]], excluded=()
+) -> Optional[type]:
+    """Find the subclass of the base among the members of the module."""
+    found = None
+    for _, cls in inspect.getmembers(module, inspect.isclass):
+        if issubclass(cls, base) and cls is not base and cls not in excluded:
+            found = cls
+    return found
+
+
+def discover_plugins() -> PluginManifest:
+    """Discover the plugins by importing all the plugin packages."""
+    from app.secbot.handlers import (
+        SecbotNotificationHandler,
+        SecbotOutputHandler,
+        SecbotScanHandler,
+    )
+    from app.secbot.inputs import SecbotInput
+
+    handlers_groups = {
+        "scans": SecbotScanHandler,
+        "outputs": SecbotOutputHandler,
+        "notifications": SecbotNotificationHandler,
+    }
+    manifest = PluginManifest()
+    for input_name, input_module in iter_plugin_modules(INPUTS_PACKAGE):
+        input_cls = find_plugin_class(input_module, SecbotInput)
+        if input_cls is None:
+            continue
+        handlers: Dict[str, Dict[str, PluginEntry]] = {
+            group: {} for group in handlers_groups
+        }
+        handlers_package = f"{INPUTS_PACKAGE}.{input_name}.handlers"
+        for handler_name, module in iter_plugin_modules(handlers_package):
+            handler_cls = find_plugin_class(
+                module,
+                tuple(handlers_groups.values()),
+                excluded=handlers_groups.values(),
+            )
+            if handler_cls is None:
+                continue
+            for group, base in handlers_groups.items():
+                if issubclass(handler_cls, base):
+                    handlers[group][handler_name] = PluginEntry(
+                        module=handler_cls.__module__, cls=handler_cls.__name__
+                    )
+        manifest.inputs[input_name] = InputPluginEntry(
+            module=input_cls.__module__, cls=input_cls.__name__, handlers=handlers
+        )
+    return manifest
+
+
+def load_manifest(path: pathlib.Path = MANIFEST_PATH) -> Optional[PluginManifest]:
+    """Load the generated manifest, None if it hasn't been generated."""
+    if not path.exists():
+        return None
+    return PluginManifest.parse_file(path)
+
+
+@functools.lru_cache(maxsize=None)
+def get_manifest() -> PluginManifest:
+    """Get the manifest of the plugins, discovering them if it's missing."""
+    manifest = load_manifest()
+    if manifest is None:
+        logger.info(f"{MANIFEST_PATH} is not found, discovering the plugins")
+        manifest = discover_plugins()
+    return manifest
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Generate the plugins manifest.")
+    parser.add_argument("--output", type=pathlib.Path, default=MANIFEST_PATH)
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Exit with an error if the manifest is not up to date.",
+    )
+    args = parser.parse_args(argv)
+
+    content = discover_plugins().dumps()
+    if args.check:
+        if not args.output.exists() or args.output.read_text() != content:
+            print(f"{args.output} is out of date, regenerate it", file=sys.stderr)
+            return 1
+        return 0
+    args.output.write_text(content)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+import functools
+from typing import List
+
+import redis
+from kombu.transport.redis import PRIORITY_STEPS, Channel
+from redis import asyncio as aioredis
+
+from app.secbot.settings import settings as secbot_settings
+from app.settings import settings as app_settings
+
+
+def get_redis_url() -> str:
+    """Redis url for the secbot bookkeeping, defaults to the celery broker."""
+    return str(secbot_settings.redis_url or app_settings.celery_broker_url)
+
+
+@functools.lru_cache(maxsize=None)
+def get_redis() -> aioredis.Redis:
+    """Get the shared asyncio Redis client of the current process.
+
+    The client is created lazily, so every process (e.g. a forked celery worker)
+    gets its own connection pool.
+    """
+    return aioredis.Redis.from_url(get_redis_url(), decode_responses=True)
+
+
+@functools.lru_cache(maxsize=None)
+def get_broker_redis() -> aioredis.Redis:
+    """Get the asyncio Redis client of the celery broker, e.g. to measure its queues."""
+    return aioredis.Redis.from_url(
+        str(app_settings.celery_broker_url), decode_responses=True
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_sync_redis() -> redis.Redis:
+    """Get the shared synchronous Redis client of the current process.
+
+    It's used by the blocking code, e.g. the git operations of the scans.
+    """
+    return redis.Redis.from_url(get_redis_url(), decode_responses=True)
+
+
+def get_broker_queue_names(queue_name: str) -> List[str]:
+    """Names of the lists of the redis broker queue, one per priority step.
+
+    The redis transport keeps the messages of every priority step in its own
+    list, e.g. the messages of the priority 9 in `secbot.scans\\x06\\x169`.
+    """
+    return [
+        queue_name,
+        *(f"{queue_name}{Channel.sep}{step}" for step in PRIORITY_STEPS if step),
+    ]
+
+
+async def get_broker_queue_depth(broker_redis: aioredis.Redis, queue_name: str) -> int:
+    """Number of the messages waiting in the redis broker queue of all priorities."""
+    depth = 0
+    for name in get_broker_queue_names(queue_name):
+        depth += await broker_redis.llen(name)
+    return depth
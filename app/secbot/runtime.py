@@ -0,0 +1,179 @@
+"""Async runtime of the celery worker process.
+
+The celery tasks of the handlers are synchronous, so every task runs its
+coroutine to completion in the event loop of the runtime. The runtime is
+started once per worker process (on the `worker_process_init` signal of
+the prefork pool, or lazily by the first task of the other pools) and closed
+on the shutdown. It owns the long-lived event loop and the pooled HTTP
+session, so the handlers reuse the connections (and the TLS sessions) of
+the external services between the tasks instead of setting them up per task.
+
+In the async mode (`SECBOT_ASYNC_WORKER`) of the worker of the threads pool,
+the loop runs in its own thread instead, and the threads of the pool submit
+the coroutines of their tasks to it. So hundreds of the I/O-bound handler
+coroutines (e.g. of the outputs and notifications) run concurrently in one
+process, capped per handler.
+
+The handlers get the shared HTTP session with the `http_session` context
+manager, which falls back to a short-lived session outside the runtime
+(e.g. in the web application, or in the tests).
+"""
+import asyncio
+import contextlib
+import threading
+from typing import AsyncIterator, Awaitable, Dict, Optional, TypeVar
+
+import aiohttp
+from celery import signals
+
+from app.secbot.db import engine
+from app.secbot.logger import logger
+from app.secbot.settings import settings
+
+T = TypeVar("T")
+
+
+class WorkerRuntime:
+    """Event loop and shared clients of the worker process.
+
+    Args:
+        threaded: Whether to run the loop in its own thread, so the coroutines
+            may be submitted to it by the threads of the pool concurrently.
+        handler_concurrency: Number of the coroutines of the same handler
+            run at once, 0 disables the limit.
+    """
+
+    def __init__(self, threaded: bool = False, handler_concurrency: int = 0):
+        self.loop = asyncio.new_event_loop()
+        self.handler_concurrency = handler_concurrency
+        self._limits: Dict[str, asyncio.Semaphore] = {}
+        self._http_session: Optional[aiohttp.ClientSession] = None
+        self._thread: Optional[threading.Thread] = None
+        if threaded:
+            self._thread = threading.Thread(
+                target=self.loop.run_forever, name="secbot-runtime", daemon=True
+            )
+            self._thread.start()
+
+    def is_current(self) -> bool:
+        """Whether the runtime loop is the running loop of the caller."""
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def run(self, coroutine: Awaitable[T], limit_key: Optional[str] = None) -> T:
+        """Run the coroutine to completion in the runtime loop.
+
+        Args:
+            coroutine: The coroutine to run.
+            limit_key: The key of the concurrency limit, e.g. the handler name.
+        """
+        if limit_key is not None and self.handler_concurrency > 0:
+            coroutine = self._run_limited(limit_key, coroutine)
+        if self._thread is None:
+            return self.loop.run_until_complete(coroutine)
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def _run_limited(self, key: str, coroutine: Awaitable[T]) -> T:
+        # The semaphores are only touched in the loop, so no lock is needed
+        if key not in self._limits:
+            self._limits[key] = asyncio.Semaphore(self.handler_concurrency)
+        async with self._limits[key]:
+            return await coroutine
+
+    def get_http_session(self) -> aiohttp.ClientSession:
+        """Get the pooled HTTP session, it must be used in the runtime loop."""
+        if self._http_session is None or self._http_session.closed:
+            self._http_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=settings.runtime_http_pool_size,
+                    keepalive_timeout=settings.runtime_http_keepalive_timeout,
+                    ttl_dns_cache=300,
+                ),
+            )
+        return self._http_session
+
+    async def aclose(self) -> None:
+        if self._http_session is not None:
+            await self._http_session.close()
+            self._http_session = None
+        await engine.dispose()
+
+    def close(self) -> None:
+        try:
+            self.run(self.aclose())
+        finally:
+            if self._thread is not None:
+                self.loop.call_soon_threadsafe(self.loop.stop)
+                self._thread.join()
+            self.loop.close()
+
+
+_runtime: Optional[WorkerRuntime] = None
+_runtime_lock = threading.Lock()
+
+
+def get_runtime() -> WorkerRuntime:
+    """Get the runtime of the current process, starting it if needed."""
+    global _runtime
+    if _runtime is None:
+        # The threads of the pool of the async worker start it at once
+        with _runtime_lock:
+            if _runtime is None:
+                _runtime = WorkerRuntime(
+                    threaded=settings.async_worker,
+                    handler_concurrency=settings.async_handler_concurrency,
+                )
+                if not settings.async_worker:
+                    asyncio.set_event_loop(_runtime.loop)
+    return _runtime
+
+
+def run_in_runtime(coroutine: Awaitable[T], limit_key: Optional[str] = None) -> T:
+    """Run the coroutine of the celery task in the runtime of the process."""
+    return get_runtime().run(coroutine, limit_key=limit_key)
+
+
+@contextlib.asynccontextmanager
+async def http_session() -> AsyncIterator[aiohttp.ClientSession]:
+    """Get the pooled HTTP session of the runtime.
+
+    The session is not closed on exit, the connections are kept alive
+    for the next tasks. Outside the runtime, the session of the caller
+    is created and closed on exit.
+    """
+    if _runtime is not None and _runtime.is_current():
+        yield _runtime.get_http_session()
+        return
+    async with aiohttp.ClientSession() as session:
+        yield session
+
+
+def start_worker_runtime(**kwargs) -> None:
+    """Start the runtime of the forked worker process.
+
+    The connections of the database pool inherited from the parent process
+    are dropped without closing them, as they are still used by the parent.
+    """
+    engine.sync_engine.dispose(close=False)
+    get_runtime()
+
+
+def stop_worker_runtime(**kwargs) -> None:
+    """Close the runtime of the worker process, if it has been started."""
+    global _runtime
+    if _runtime is None:
+        return
+    try:
+        _runtime.close()
+    except Exception:
+        logger.exception("Worker runtime is not closed properly")
+    finally:
+        _runtime = None
+
+
+def instrument():
+    signals.worker_process_init.connect(start_worker_runtime, weak=False)
+    signals.worker_process_shutdown.connect(stop_worker_runtime, weak=False)
+    signals.worker_shutdown.connect(stop_worker_runtime, weak=False)
@@ -0,0 +1,222 @@
+"""Fair-share scheduling of the workflows in front of the scans queue.
+
+Celery serves the scans queue first in, first out, so a flood of the
+events of one project (e.g. a monorepo with constant pushes) delays the
+scans of every other project, including the merge requests gating the
+merges. With the fair scheduler, the workflows are queued per project
+in Redis instead, and released to the scans queue round robin across
+the projects, one workflow of a project per turn, while the scans queue
+is below its target depth. So the backlog stays in the scheduler, and
+a new project gets the next free slot whatever the size of the backlog.
+
+The merge request workflows are of the high priority, and the push and
+tag ones of the low priority: the high priority projects get `weight`
+turns per one turn of the low priority ones, so the pushes still move
+under a constant flow of the merge requests.
+"""
+import enum
+import time
+from typing import List, Optional, Tuple
+
+from celery import Celery
+from celery.canvas import Signature
+from redis import asyncio as aioredis
+
+from app.metrics.common import get_location_labels_from_env
+from app.metrics.dispatch import SECBOT_SCHEDULER_WAIT
+from app.secbot import codec
+from app.secbot.redis import get_broker_queue_depth, get_broker_redis, get_redis
+from app.secbot.settings import settings
+
+
+class SchedulerPriority(str, enum.Enum):
+    HIGH = "high"
+    LOW = "low"
+
+
+# Adds the workflows to the queue of the project, and the project to the ring
+# of the projects of the priority if its queue was empty. The queue is the sorted
+# set of the ids of the workflows scored by their due time, the workflows are
+# kept in the hash of the queue by their ids. The ids are the zero-padded
+# sequence numbers, so the workflows of the same due time are taken in order.
+# The ring holds every project with the queued workflows exactly once.
+SUBMIT_SCRIPT = """
+local was_empty = redis.call('ZCARD', KEYS[2]) == 0
+for i = 2, #ARGV, 2 do
+    local id = string.format('%020d', redis.call('INCR', KEYS[3]))
+    redis.call('ZADD', KEYS[2], ARGV[i], id)
+    redis.call('HSET', KEYS[2] .. ':items', id, ARGV[i + 1])
+end
+if was_empty then
+    redis.call('RPUSH', KEYS[1], ARGV[1])
+end
+return redis.call('ZCARD', KEYS[2])
+"""
+
+# Takes the next due workflow round robin: the first project of the ring gives
+# its earliest due workflow, and goes to the end of the ring if it has more.
+# The projects without the due workflows (e.g. debounced) go to the end of the
+# ring as is. Every (weight + 1)-th turn starts with the low priority ring.
+# Returns the priority index, the project, and the workflow.
+TAKE_SCRIPT = """
+local now = tonumber(ARGV[4])
+local turn = redis.call('INCR', KEYS[3])
+local order = {1, 2}
+if turn % (tonumber(ARGV[3]) + 1) == 0 then
+    order = {2, 1}
+end
+for _, index in ipairs(order) do
+    for _ = 1, redis.call('LLEN', KEYS[index]) do
+        local project = redis.call('LPOP', KEYS[index])
+        local queue = ARGV[index] .. project
+        local head = redis.call('ZRANGE', queue, 0, 0, 'WITHSCORES')
+        if head[1] then
+            if tonumber(head[2]) > now then
+                redis.call('RPUSH', KEYS[index], project)
+            else
+                local item = redis.call('HGET', queue .. ':items', head[1])
+                redis.call('ZREM', queue, head[1])
+                redis.call('HDEL', queue .. ':items', head[1])
+                if redis.call('ZCARD', queue) > 0 then
+                    redis.call('RPUSH', KEYS[index], project)
+                end
+                return {index, project, item}
+            end
+        end
+    end
+end
+return false
+"""
+
+
+class FairScheduler:
+    """Per-project fair-share queues of the workflows in front of the scans queue.
+
+    Args:
+        redis: The redis of the scheduler queues.
+        broker_redis: The redis of the celery broker, to measure the scans queue.
+        queue_target: The depth of the scans queue the scheduler fills it up to.
+        priority_weight: Turns of the high priority projects per one turn
+            of the low priority ones.
+    """
+
+    key_prefix = "secbot:scheduler"
+    priorities = (SchedulerPriority.HIGH, SchedulerPriority.LOW)
+
+    def __init__(
+        self,
+        redis: aioredis.Redis,
+        broker_redis: aioredis.Redis,
+        queue_target: int,
+        priority_weight: int = 1,
+    ):
+        self.redis = redis
+        self.broker_redis = broker_redis
+        self.queue_target = queue_target
+        self.priority_weight = max(priority_weight, 1)
+
+    def ring_key(self, priority: SchedulerPriority) -> str:
+        return f"{self.key_prefix}:{priority.value}:projects"
+
+    def queue_key_prefix(self, priority: SchedulerPriority) -> str:
+        return f"{self.key_prefix}:{priority.value}:workflows:"
+
+    async def submit(
+        self,
+        project: str,
+        workflows: List[Signature],
+        priority: SchedulerPriority,
+        countdown: Optional[int] = None,
+    ) -> None:
+        """Queue the workflows of the project.
+
+        Args:
+            project: The fair-share key, e.g. the path of the project.
+            workflows: The workflows to be published to the scans queue.
+            priority: The priority of the workflows.
+            countdown: Number of seconds to delay the start of the workflows,
+                counted from the submission. The workflows are held in the
+                scheduler until then, instead of the ETA messages reserved
+                by the workers out of the scans queue.
+        """
+        if not workflows:
+            return
+        submitted_at = time.time()
+        not_before = submitted_at + (countdown or 0)
+        items = [
+            codec.dumps({"workflow": workflow, "submitted_at": submitted_at})
+            for workflow in workflows
+        ]
+        await self.redis.eval(
+            SUBMIT_SCRIPT,
+            3,
+            self.ring_key(priority),
+            self.queue_key_prefix(priority) + project,
+            f"{self.key_prefix}:sequence",
+            project,
+            # The due time of every workflow is its score in the queue
+            *(value for item in items for value in (not_before, item)),
+        )
+
+    async def take(
+        self, now: Optional[float] = None
+    ) -> Optional[Tuple[SchedulerPriority, str, dict]]:
+        """Take the next due workflow, None if no workflow is due."""
+        taken = await self.redis.eval(
+            TAKE_SCRIPT,
+            3,
+            *(self.ring_key(priority) for priority in self.priorities),
+            f"{self.key_prefix}:turn",
+            *(self.queue_key_prefix(priority) for priority in self.priorities),
+            self.priority_weight,
+            time.time() if now is None else now,
+        )
+        if not taken:
+            return None
+        index, project, item = taken
+        return self.priorities[int(index) - 1], project, codec.loads(item)
+
+    async def capacity(self, queue_name: str) -> int:
+        """Number of the workflows the scans queue may take up to its target.
+
+        The workers reserve the ETA messages out of the queue right away,
+        so they are not counted in its depth. The scheduler publishes only
+        the due workflows without the countdown, so the depth is accurate.
+        """
+        depth = await get_broker_queue_depth(self.broker_redis, queue_name)
+        return max(self.queue_target - depth, 0)
+
+    async def release(self, celery_app: Celery, queue_name: str) -> int:
+        """Publish the queued workflows fairly, up to the capacity of the scans queue.
+
+        Returns:
+            The number of the released workflows.
+        """
+        released = 0
+        for _ in range(await self.capacity(queue_name)):
+            taken = await self.take()
+            if taken is None:
+                break
+            priority, project, item = taken
+            SECBOT_SCHEDULER_WAIT.labels(
+                **get_location_labels_from_env(),
+                project=project,
+                priority=priority.value,
+            ).observe(time.time() - item["submitted_at"])
+            # The workflow is due, so it's published without the countdown,
+            # and it stays in the scans queue until a worker starts it
+            celery_app.signature(item["workflow"]).apply_async()
+            released += 1
+        return released
+
+
+def get_fair_scheduler() -> Optional[FairScheduler]:
+    """Get the fair scheduler, None if the fair scheduling is disabled."""
+    if settings.fair_scheduler_queue_target <= 0:
+        return None
+    return FairScheduler(
+        get_redis(),
+        get_broker_redis(),
+        queue_target=settings.fair_scheduler_queue_target,
+        priority_weight=settings.fair_scheduler_priority_weight,
+    )
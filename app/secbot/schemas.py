@@ -1,7 +1,10 @@
 import enum
+from typing import Any, Dict, Optional
 
 from pydantic import BaseModel, root_validator
 
+from app.secbot.codec import register_model
+
 PYDANTIC_CLS_PATH = "__pydantic_path_model__"
 
 
@@ -11,10 +14,18 @@ class SecbotBaseModel(BaseModel):
     This class extends the Pydantic BaseModel for use in Secbot's Celery
     workflow where models need to be serialized and deserialized.
 
-    It ensures the inclusion of an absolute path to the class model in each
-    instance, which is used later for deserialization.
+    Every subclass is registered in the task arguments codec by its class
+    name, or by the `type_id` class keyword, e.g. `class Model(SecbotBaseModel,
+    type_id="gitlab.Model")`, see `app.secbot.codec`.
+
+    It also ensures the inclusion of an absolute path to the class model
+    in each instance, which is used by the legacy `app.secbot.utils.serializer`.
     """
 
+    def __init_subclass__(cls, type_id: Optional[str] = None, **kwargs):
+        super().__init_subclass__(**kwargs)
+        register_model(cls, type_id)
+
     @root_validator
     def populate_with_class_model(cls, values):
         """Populates the model with the absolute class model path.
@@ -73,5 +84,32 @@ class ScanStatus(str, enum.Enum):
     NEW = "new"
     IN_PROGRESS = "in_progress"
     SKIP = "skip"  # we decide to skip a scan for some reason.
+    SUPERSEDED = "superseded"  # the commit is superseded, it may be scanned again.
     ERROR = "error"  # an exception has happened.
     DONE = "done"  # all the data has been obtained.
+
+
+class SecbotFailedResult(SecbotBaseModel):
+    """Result of a failed workflow step in the notifications fan-in mode.
+
+    It's passed down the workflow instead of the exception, so the fan-in
+    gets the results of all the scans, including the failed ones.
+    """
+
+    handler_name: str
+    component_name: str
+    error: str
+
+
+class SecbotContinuation(SecbotBaseModel):
+    """Result of a workflow step that continues later in the next task.
+
+    The task of the handler is replaced with the task of the `step` method
+    of the handler, delayed for the countdown, so the worker doesn't sit idle
+    waiting for the external service. The step gets the arguments of the task
+    along with the state, see `SecbotHandler.continue_later`.
+    """
+
+    step: str
+    countdown: float = 0
+    state: Dict[str, Any] = {}
@@ -1,11 +1,147 @@
-from pydantic import BaseSettings, PostgresDsn
+from typing import Optional
+
+from pydantic import BaseSettings, PostgresDsn, RedisDsn, root_validator
+
+ARTIFACTS_BACKENDS = ("local", "s3")
 
 
 class SecbotSettings(BaseSettings):
     postgres_dsn: PostgresDsn
+    # Database connections of the process, raise them for the async worker
+    postgres_pool_size: int = 5
+    postgres_max_overflow: int = 5
+
+    # Redis instance used for secbot's own bookkeeping (ingest queue, etc.).
+    # Falls back to the celery broker when it is not set.
+    redis_url: Optional[RedisDsn] = None
+
+    # Webhook ingest mode: the webhook is acknowledged right away, and the raw
+    # event is put on a durable queue that is drained by the gitlab dispatcher.
+    gitlab_ingest_enabled: bool = False
+    gitlab_ingest_batch_size: int = 50
+    gitlab_ingest_poll_timeout: int = 5
+    gitlab_ingest_metrics_port: int = 9100
+
+    # Time in seconds the dispatched security check is remembered, so the
+    # re-delivered events are not dispatched again. Set to 0 to disable.
+    dispatch_dedupe_ttl: int = 3600
+
+    # Merge request scans are delayed for the debounce window, so the newer
+    # commits pushed in the meantime supersede them before they are started.
+    gitlab_mr_debounce_seconds: int = 30
+    gitlab_mr_revision_ttl: int = 7 * 24 * 60 * 60
+
+    # Number of the repositories dispatched at once by the gitlab backfill.
+    gitlab_backfill_concurrency: int = 10
+
+    # Admission control: above the soft limits the low priority workflows
+    # (e.g. push events) are deferred to the holding queue, above the hard
+    # limits they are shed. Set a limit to 0 to disable it.
+    admission_queue_soft_limit: int = 1000
+    admission_queue_hard_limit: int = 5000
+    admission_scans_soft_limit: int = 100
+    admission_scans_hard_limit: int = 500
+    # Number of the deferred dispatches released at once when the load goes down.
+    admission_release_batch_size: int = 10
+    # Number of the deferred dispatches held, the following ones are shed. It's
+    # the room between the soft and hard limits of the queue by default, so the
+    # released dispatches don't push the queue over the hard limit. 0 disables it.
+    admission_holding_limit: int = 4000
+
+    # Fair scheduling: the workflows are queued per project and released to the
+    # scans queue round robin across the projects, while the scans queue is
+    # below the target depth. The merge request projects get the weight turns
+    # per one turn of the push and tag ones. Set the target to 0 to disable it.
+    fair_scheduler_queue_target: int = 0
+    fair_scheduler_priority_weight: int = 4
+    # Interval in seconds the deferred and the fair scheduled workflows are
+    # released at by celery beat, when no events come in to release them.
+    # Set to 0 to disable.
+    workflow_release_interval: int = 10
+
+    # Interval in seconds to check the workflow config file for changes,
+    # the changed config is reloaded without restarts. Set to 0 to disable.
+    config_reload_interval: int = 30
+
+    # Notifications fan-in: the notifications are sent once per security check
+    # with the aggregated result of all its scans, instead of once per output.
+    notifications_fan_in: bool = False
+
+    # Compression of the celery task messages and results ("gzip", "zlib",
+    # "bzip2", etc.), worth it for the large scan results. Unset disables it.
+    task_compression: Optional[str] = None
+
+    # Pool of the HTTP connections to the external services (DefectDojo, Slack)
+    # shared by the tasks of the worker process, see `app.secbot.runtime`.
+    runtime_http_pool_size: int = 100
+    runtime_http_keepalive_timeout: float = 30
+
+    # Stage queues: the tasks of the scans, outputs, and notifications are
+    # routed to their own queues, so a backlog of the slow scans doesn't delay
+    # the cheap notifications. Unset keeps the stage on the default queue, so the
+    # workers of the existing deployments consume it until they are moved.
+    scans_queue: Optional[str] = None
+    outputs_queue: Optional[str] = None
+    notifications_queue: Optional[str] = None
+
+    # Async mode of the worker of the threads pool: the handler coroutines run
+    # concurrently in one event loop of the process, up to the concurrency
+    # of each handler. The tasks of the outputs and notifications are routed
+    # to the async handlers queue, consumed by the async worker.
+    async_worker: bool = False
+    async_handler_concurrency: int = 50
+    async_handlers_queue: Optional[str] = None
+
+    # Claim-check artifact store of the scan reports ("local" or "s3"): the
+    # reports are stored once and the tasks pass only a reference to them.
+    # The reports are passed within the task messages when it is not set.
+    # The path of the local backend must be shared by all the workers, so it
+    # fits the workers of a single host only, the s3 one requires the bucket.
+    artifacts_backend: Optional[str] = None
+    artifacts_path: str = "/tmp/secbot-artifacts"
+    artifacts_s3_bucket: Optional[str] = None
+    artifacts_s3_prefix: str = "secbot/artifacts"
+    artifacts_s3_endpoint_url: Optional[str] = None
+    artifacts_compression: bool = True
+    # Time in seconds the artifacts are kept since they were last stored, they
+    # are removed by celery beat every cleanup interval. Set to 0 to keep them.
+    artifacts_ttl: int = 30 * 24 * 60 * 60
+    artifacts_cleanup_interval: int = 60 * 60
+
+    # Cache of the bare mirrors of the repositories for the "mirror" fetch strategy
+    # of the scans (local, or a shared volume), and its disk budget in bytes.
+    # The least recently used mirrors are evicted over the budget, 0 disables it.
+    repository_cache_path: str = "/tmp/secbot-repositories"
+    repository_cache_budget: int = 10 * 2**30
+    # Speculative prefetch: the pushed commits of the projects with the merge
+    # request jobs of the mirror scans are fetched into the mirrors ahead of the
+    # merge request events, by the low priority tasks on the queues of the scans.
+    repository_prefetch_enabled: bool = False
+
+    # Distributed concurrency limits of the external services (see `app.secbot.limits`):
+    # a slot is leased for the seconds and renewed while it's held, so the slots
+    # of the crashed workers expire. The slot is waited for up to the timeout
+    # in seconds, 0 waits for it indefinitely.
+    concurrency_lease_seconds: int = 60
+    concurrency_poll_interval: float = 0.5
+    concurrency_wait_timeout: int = 900
 
     class Config:
         env_prefix = "secbot_"
 
+    @root_validator(skip_on_failure=True)
+    def check_artifacts_backend(cls, values):
+        backend = values.get("artifacts_backend")
+        if backend is not None and backend not in ARTIFACTS_BACKENDS:
+            raise ValueError(
+                f"Unknown artifacts backend {backend}, "
+                f"expected one of {', '.join(ARTIFACTS_BACKENDS)}"
+            )
+        if backend == "s3" and not values.get("artifacts_s3_bucket"):
+            raise ValueError(
+                "The s3 artifacts backend requires the artifacts_s3_bucket"
+            )
+        return values
+
 
 settings = SecbotSettings()
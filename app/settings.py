@@ -39,6 +39,9 @@ class GitlabConfig(BaseModel):
     webhook_secret_token: SecretStr
     auth_token: SecretStr
     prefix: str
+    # Number of the concurrent fetches of the repositories from the host
+    # across all the workers, see `app.secbot.limits`. 0 disables the limit.
+    fetch_concurrency: int = 0
 
 
 class Settings(BaseSettings):
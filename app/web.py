@@ -0,0 +1,112 @@
+"""The web applications of secbot: the GitLab webhook and the security gateway."""
+import typing
+
+from fastapi import APIRouter, FastAPI
+from fastapi.exceptions import RequestValidationError
+from starlette.exceptions import HTTPException
+
+from app.exceptions.api_errors import APIError
+from app.exceptions.handlers import (
+    api_error_exception_handler,
+    http_exception_handler,
+    validation_exception_handler,
+)
+from app.exceptions.schemas import ValidationError
+from app.main import configure_logging, init_sentry, watch_workflow_config
+from app.metrics.server import ASGIMetricsMiddleware
+from app.routers import gitlab, healthcheck, metrics, security
+from app.settings import settings
+
+
+def init_app(
+    title: str,
+    routers: typing.List[APIRouter],
+    openapi_tags: typing.Optional[typing.List[typing.Dict[str, typing.Any]]] = None,
+) -> FastAPI:
+    application = FastAPI(
+        title=title,
+        debug=settings.debug,
+        version="1.0.0",
+        docs_url="/docs" if settings.docs_enable else None,
+        openapi_tags=openapi_tags,
+    )
+
+    # Setup exceptions
+    application.add_exception_handler(
+        APIError,
+        api_error_exception_handler,
+    )
+    application.add_exception_handler(
+        HTTPException,
+        http_exception_handler,
+    )
+    application.add_exception_handler(
+        RequestValidationError,
+        validation_exception_handler,
+    )
+
+    # Setup routes
+    application.include_router(healthcheck.router)
+
+    router_v1 = APIRouter(
+        prefix="/v1",
+        responses={
+            422: {
+                "model": ValidationError,
+                "description": "Validation Error",
+            }
+        },
+    )
+    for router in routers:
+        router_v1.include_router(router)
+
+    application.include_router(router_v1)
+
+    # Setup metrics
+    application.add_middleware(
+        ASGIMetricsMiddleware,
+        tier=1,
+        include_latency_histogram=True,
+        record_source_ip=True,
+        include_not_found_url_label=False,
+    )
+    application.include_router(metrics.router)
+
+    # Setup sentry
+    init_sentry()
+
+    # Setup the workflow config reloading
+    application.add_event_handler("startup", watch_workflow_config)
+
+    return application
+
+
+def bootstrap_webhook() -> FastAPI:
+    """Bootstrap the webhook application of the GitLab events."""
+    configure_logging()
+    return init_app(
+        title=settings.app_name,
+        routers=[
+            gitlab.router,
+        ],
+        openapi_tags=[
+            {"name": "common"},
+            {
+                "name": "gitlab",
+                "externalDocs": {
+                    "description": "Gitlab webhook events",
+                    "url": "https://docs.gitlab.com/ee/user/project/integrations/webhook_events.html",
+                },
+            },
+        ],
+    )
+
+
+def bootstrap_security_gateway() -> FastAPI:
+    """Bootstrap the security gateway application of the check results."""
+    configure_logging()
+    return init_app(
+        title="Security Gateway",
+        routers=[security.router],
+        openapi_tags=[{"name": "common"}, {"name": "security"}],
+    )
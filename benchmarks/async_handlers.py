@@ -0,0 +1,108 @@
+"""Benchmark of the async mode of the worker for the I/O-bound handlers.
+
+It compares the number of tasks per second of the I/O-bound handler (the task
+waits for the external service, e.g. DefectDojo, for the latency seconds),
+and the memory (RSS) per task in flight, run by the prefork worker process
+(one task at a time, so the memory of the whole process is held by a task)
+and by the async worker (the threads of the pool submit the handler
+coroutines to the shared event loop, up to the handler concurrency).
+
+Usage:
+    python -m benchmarks.async_handlers [--tasks 400] [--latency 0.1]
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+load_dotenv(".env.dev")
+
+from app.secbot.runtime import WorkerRuntime  # noqa: E402
+
+
+def get_rss() -> int:
+    """Resident memory of the process in bytes."""
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    raise RuntimeError("VmRSS is not available")
+
+
+class Handler:
+    """I/O-bound handler, tracking the peak of the tasks in flight and of RSS."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.peak_rss = 0
+
+    async def run(self, payload: bytes) -> int:
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        self.peak_rss = max(self.peak_rss, get_rss())
+        await asyncio.sleep(self.latency)
+        self.in_flight -= 1
+        return len(payload)
+
+
+def measure_prefork(tasks: int, latency: float):
+    handler = Handler(latency)
+    runtime = WorkerRuntime()
+    started = time.perf_counter()
+    try:
+        for _ in range(tasks):
+            runtime.run(handler.run(b"x" * 1024), limit_key="defectdojo")
+    finally:
+        runtime.close()
+    # Every task in flight holds the whole worker process
+    return tasks / (time.perf_counter() - started), handler.peak_rss, 1
+
+
+def measure_async(tasks: int, latency: float, concurrency: int, cap: int):
+    handler = Handler(latency)
+    runtime = WorkerRuntime(threaded=True, handler_concurrency=cap)
+    rss = get_rss()
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [
+                executor.submit(
+                    runtime.run, handler.run(b"x" * 1024), limit_key="defectdojo"
+                )
+                for _ in range(tasks)
+            ]
+            for future in futures:
+                future.result()
+    finally:
+        runtime.close()
+    rate = tasks / (time.perf_counter() - started)
+    return rate, handler.peak_rss - rss, handler.peak_in_flight
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=400)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--cap", type=int, default=100)
+    args = parser.parse_args()
+
+    prefork_tasks = max(1, min(args.tasks, int(2 / args.latency)))
+    results = {
+        "prefork, 1 process": measure_prefork(prefork_tasks, args.latency),
+        f"async, {args.concurrency} threads, cap {args.cap}": measure_async(
+            args.tasks, args.latency, args.concurrency, args.cap
+        ),
+    }
+
+    print(f"{'mode':<36}{'tasks/s':>10}{'in flight':>11}{'RSS/task, KiB':>16}")
+    for name, (rate, rss, in_flight) in results.items():
+        print(f"{name:<36}{rate:>10.1f}{in_flight:>11}{rss / in_flight / 1024:>16.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Benchmark of the cold start of the secbot processes per role.
+
+Every run starts a fresh interpreter, and measures the import of `app.main`,
+the bootstrap of the role (the access to its entry point, e.g.
+`app.main:app`), and the first request of the role: the startup of the
+application and the ping, along with the lookup of the handlers needed
+by the first dispatch of the webhook (or by the first check result of the
+security gateway), or the lookup of the first task by the worker.
+
+The eager mode imports all the plugins and loads the workflow config
+at the bootstrap, as all the processes did before the plugins manifest.
+
+Usage:
+    python -m benchmarks.cold_start [--runs 5] [--roles webhook gateway worker]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+from dotenv import load_dotenv
+
+ROLES = {
+    "webhook": "app",
+    "gateway": "security_gateway_app",
+    "worker": "celery_app",
+}
+
+
+def first_request(role: str, entry_point) -> None:
+    import app.main
+    from app.secbot.config import config
+
+    if role == "worker":
+        entry_point.tasks["secbot.handler.gitleaks"]
+        return
+
+    from starlette.testclient import TestClient
+
+    with TestClient(entry_point) as client:
+        client.get("/ping").raise_for_status()
+    gitlab_input = app.main.get_security_bot().get_input("gitlab")
+    if role == "webhook":
+        gitlab_input.build_workflows(config.jobs["gitlab"], {})
+    else:
+        for job in config.jobs["gitlab"]:
+            for output in job.outputs:
+                gitlab_input.outputs[output.handler_name]
+
+
+def measure_child(role: str, eager: bool) -> dict:
+    load_dotenv(".env.dev")
+
+    started = time.perf_counter()
+    import app.main
+
+    imported = time.perf_counter()
+    entry_point = getattr(app.main, ROLES[role])
+    if eager:
+        from app.secbot.config import config
+
+        app.main.get_security_bot().load_plugins()
+        config.load()
+    bootstrapped = time.perf_counter()
+    first_request(role, entry_point)
+    finished = time.perf_counter()
+    return {
+        "import": imported - started,
+        "bootstrap": bootstrapped - imported,
+        "first_request": finished - bootstrapped,
+        "modules": len(sys.modules),
+    }
+
+
+def measure(role: str, eager: bool, runs: int) -> dict:
+    command = [sys.executable, "-m", "benchmarks.cold_start", "--child", role]
+    if eager:
+        command.append("--eager")
+    samples = [
+        json.loads(
+            subprocess.run(command, check=True, capture_output=True, text=True)
+            .stdout.strip()
+            .splitlines()[-1]
+        )
+        for _ in range(runs)
+    ]
+    return {key: statistics.median(s[key] for s in samples) for key in samples[0]}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--roles", nargs="+", choices=ROLES, default=list(ROLES))
+    parser.add_argument("--child", choices=ROLES, help=argparse.SUPPRESS)
+    parser.add_argument("--eager", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure_child(args.child, args.eager)))
+        return
+
+    print(
+        f"{'role':<18}{'import, ms':>12}{'bootstrap, ms':>15}"
+        f"{'1st request, ms':>17}{'total, ms':>11}{'modules':>9}"
+    )
+    for role in args.roles:
+        for eager in (True, False):
+            result = measure(role, eager, args.runs)
+            total = result["import"] + result["bootstrap"] + result["first_request"]
+            name = f"{role} ({'eager' if eager else 'lazy'})"
+            print(
+                f"{name:<18}{result['import'] * 1000:>12.0f}"
+                f"{result['bootstrap'] * 1000:>15.0f}"
+                f"{result['first_request'] * 1000:>17.0f}"
+                f"{total * 1000:>11.0f}{result['modules']:>9.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
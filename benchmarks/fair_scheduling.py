@@ -0,0 +1,117 @@
+"""Benchmark of the fair scheduling of the workflows under a synthetic flood.
+
+One monorepo floods the scans queue with the push events, while the other
+projects open the merge requests at a steady rate. The workers start
+`workers` scans per tick. It compares the wait of the scans per project
+(in ticks, from the event to the start of the scan) when the workflows
+are published to the scans queue right away (first in, first out), and
+when they go through the fair scheduler (`app.secbot.scheduler`), which
+keeps the scans queue at its target depth.
+
+The fair scheduler runs its scripts on the secbot redis, under its own keys.
+
+Usage:
+    python -m benchmarks.fair_scheduling [--flood 2000] [--projects 20]
+"""
+import argparse
+import asyncio
+import collections
+import statistics
+from typing import Dict, List, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv(".env.dev")
+
+from celery import Celery  # noqa: E402
+
+from app.secbot.redis import get_redis  # noqa: E402
+from app.secbot.scheduler import FairScheduler, SchedulerPriority  # noqa: E402
+
+MONOREPO = "group/monorepo"
+
+
+class BenchmarkScheduler(FairScheduler):
+    key_prefix = "secbot:benchmark:scheduler"
+
+
+def generate_events(args) -> Dict[int, List[Tuple[str, SchedulerPriority]]]:
+    """The events by the tick they come in."""
+    events = collections.defaultdict(list)
+    events[0] = [(MONOREPO, SchedulerPriority.LOW)] * args.flood
+    for tick in range(args.ticks):
+        events[tick].append((MONOREPO, SchedulerPriority.LOW))
+        if tick % args.mr_interval == 0:
+            events[tick].extend(
+                (f"group/service-{i}", SchedulerPriority.HIGH)
+                for i in range(args.projects)
+            )
+    return events
+
+
+async def simulate(args, celery_app: Celery, fair: bool) -> Dict[str, List[int]]:
+    scheduler = BenchmarkScheduler(
+        get_redis(), broker_redis=None, queue_target=args.queue_target
+    )
+    await clear(scheduler)
+    events = generate_events(args)
+    scans_queue = collections.deque()
+    waits = collections.defaultdict(list)
+    for tick in range(args.ticks):
+        for project, priority in events.get(tick, []):
+            workflow = celery_app.signature("scan", kwargs={"tick": tick})
+            if fair:
+                await scheduler.submit(project, [workflow], priority=priority)
+            else:
+                scans_queue.append((project, workflow))
+
+        while fair and len(scans_queue) < args.queue_target:
+            taken = await scheduler.take()
+            if taken is None:
+                break
+            _, project, item = taken
+            scans_queue.append((project, item["workflow"]))
+
+        for _ in range(min(args.workers, len(scans_queue))):
+            project, workflow = scans_queue.popleft()
+            name = MONOREPO if project == MONOREPO else "other projects"
+            waits[name].append(tick - workflow["kwargs"]["tick"])
+    await clear(scheduler)
+    return waits
+
+
+async def clear(scheduler: FairScheduler) -> None:
+    keys = [
+        key async for key in scheduler.redis.scan_iter(f"{scheduler.key_prefix}:*")
+    ]
+    if keys:
+        await scheduler.redis.delete(*keys)
+
+
+def percentile(values: List[int], q: int) -> float:
+    return statistics.quantiles(values, n=100)[q - 1] if len(values) > 1 else values[0]
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--flood", type=int, default=2000)
+    parser.add_argument("--projects", type=int, default=20)
+    parser.add_argument("--mr-interval", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--queue-target", type=int, default=16)
+    parser.add_argument("--ticks", type=int, default=600)
+    args = parser.parse_args()
+
+    celery_app = Celery()
+    print(f"{'mode':<8}{'project':<18}{'scans':>8}{'p50 wait':>10}{'p95 wait':>10}")
+    for fair in (False, True):
+        waits = await simulate(args, celery_app, fair)
+        for name, values in sorted(waits.items()):
+            print(
+                f"{'fair' if fair else 'fifo':<8}{name:<18}{len(values):>8}"
+                f"{percentile(values, 50):>10.0f}{percentile(values, 95):>10.0f}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,152 @@
+"""Benchmark of the workflow rules matching.
+
+It compares the number of events per second matched against a config with
+a few hundred jobs by the legacy engine (every job of the input is checked,
+the JSONPaths are split and the regexes are looked up on every event) and by
+the compiled one (the rules are compiled at the config load time, and the
+candidate jobs are found in the index of the literal rules).
+
+It also compares the evaluation of the single JSONPaths of the rules:
+parsed on every event, and compiled once into the accessors.
+
+The events are the recorded GitLab webhooks of the test fixtures.
+
+Usage:
+    python -m benchmarks.rule_matching [--number 2000] [--jobs 300]
+"""
+import argparse
+import json
+import pathlib
+import re
+import time
+from typing import Callable, Dict, List
+
+from app.secbot.config import SecbotConfig, WorkflowJob, get_jsonpath_value
+from app.secbot.jsonpath import compile_jsonpath
+
+FIXTURES_PATH = pathlib.Path(__file__).parent.parent / "tests/fixtures/inputs/gitlab"
+
+RULE_PATHS = [
+    "project.path_with_namespace",
+    "object_attributes.last_commit.author.email",
+    "commits[-1].id",
+    "commits[*].author.email",
+    "labels[*].title",
+]
+
+
+def legacy_matching(jobs: List[WorkflowJob], data: dict) -> List[WorkflowJob]:
+    def is_job_valid_for_rules(job: WorkflowJob) -> bool:
+        for jsonpath, rule_regex in (job.rules or {}).items():
+            try:
+                value = get_jsonpath_value(data, jsonpath)
+            except (KeyError, TypeError):
+                return False
+            if isinstance(value, (int, float)):
+                value = str(value)
+            if not isinstance(value, str) or re.fullmatch(rule_regex, value) is None:
+                return False
+        return True
+
+    return [job for job in jobs if is_job_valid_for_rules(job)]
+
+
+def build_config(jobs_number: int) -> SecbotConfig:
+    """Build a config of the jobs per project for every event type."""
+    event_rules = [
+        {"event_type": "merge_request"},
+        {"event_name": "push", "ref": "refs/heads/(main|master)"},
+        {"event_name": "tag_push"},
+    ]
+    jobs = [
+        {
+            "name": f"job {number}",
+            "rules": {
+                "gitlab": {
+                    **event_rules[number % len(event_rules)],
+                    "project.path_with_namespace": f"group-{number}/.*",
+                }
+            },
+            "scans": ["gitleaks"],
+            "outputs": ["defectdojo"],
+            "notifications": ["slack"],
+        }
+        for number in range(jobs_number - 1)
+    ]
+    jobs.append(
+        {
+            "name": "merge requests of the test group",
+            "rules": {
+                "gitlab": {
+                    "event_type": "merge_request",
+                    "project.path_with_namespace": "secbot-test-group/.*",
+                }
+            },
+            "scans": ["gitleaks"],
+            "outputs": ["defectdojo"],
+            "notifications": ["slack"],
+        }
+    )
+    return SecbotConfig(
+        {
+            "version": "1.0",
+            "components": {
+                name: {"handler_name": name}
+                for name in ("gitleaks", "defectdojo", "slack")
+            },
+            "jobs": jobs,
+        }
+    )
+
+
+def measure(matching: Callable[[dict], List[WorkflowJob]], data: dict, number: int):
+    matching(data)  # warm up
+
+    started = time.perf_counter()
+    for _ in range(number):
+        matching(data)
+    return number / (time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=2000)
+    parser.add_argument("--jobs", type=int, default=300)
+    args = parser.parse_args()
+
+    config = build_config(args.jobs)
+    events: Dict[str, dict] = {
+        path.stem: json.loads(path.read_text())
+        for path in sorted(FIXTURES_PATH.glob("*.json"))
+    }
+
+    print(f"{'event':<30}{'before, ev/s':>16}{'after, ev/s':>16}{'speedup':>10}")
+    for name, data in events.items():
+        jobs = config.jobs["gitlab"]
+        assert legacy_matching(jobs, data) == config.jobs_index["gitlab"].matching(
+            data
+        )
+        before = measure(lambda event: legacy_matching(jobs, event), data, args.number)
+        after = measure(config.jobs_index["gitlab"].matching, data, args.number)
+        print(f"{name:<30}{before:>16.0f}{after:>16.0f}{after / before:>9.1f}x")
+
+    print()
+    print(f"{'rule path':<46}{'parsed, ev/s':>16}{'compiled, ev/s':>16}{'speedup':>10}")
+    for path in RULE_PATHS:
+        accessor = compile_jsonpath(path)
+
+        def evaluate_compiled(_: dict, accessor=accessor):
+            for data in events.values():
+                accessor(data)
+
+        def evaluate_parsed(_: dict, path=path):
+            for data in events.values():
+                compile_jsonpath(path)(data)
+
+        before = measure(evaluate_parsed, {}, args.number) * len(events)
+        after = measure(evaluate_compiled, {}, args.number) * len(events)
+        print(f"{path:<46}{before:>16.0f}{after:>16.0f}{after / before:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Benchmark of the encoding of the task arguments passed between the celery tasks.
+
+It compares the number of `GitlabOutputResult` payloads (a merge request event
+with an inline scan report and the findings of the output) per second
+that are encoded into a message body and decoded back with the legacy
+serializer/deserializer round-trips (the models are dumped to JSON and loaded
+back into dicts, and the class of every model is imported by its path) and
+with the typed codec of the `secbot` celery serializer. The size of the
+message bodies is printed as well, and the size of the codec bodies
+compressed with gzip (`SECBOT_TASK_COMPRESSION=gzip`).
+
+Usage:
+    python -m benchmarks.task_codec [--number 2000]
+"""
+import argparse
+import gzip
+import json
+import time
+from typing import Any, Callable, Dict, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv(".env.dev")
+
+from app.secbot import codec, utils  # noqa: E402
+from app.secbot.inputs.gitlab.dependencies import (  # noqa: E402
+    WEBHOOK_PAYLOAD_EXAMPLES,
+)
+from app.secbot.inputs.gitlab.schemas import (  # noqa: E402
+    GitlabEvent,
+    GitlabInputData,
+    GitlabOutputResult,
+    GitlabScanResult,
+    GitlabScanResultFile,
+    get_gitlab_model_for_event,
+)
+from app.secbot.inputs.gitlab.schemas.output_responses import (  # noqa: E402
+    OutputFinding,
+    OutputResponse,
+)
+from app.secbot.schemas import Severity  # noqa: E402
+
+
+def build_output_result(findings: int) -> GitlabOutputResult:
+    payload = WEBHOOK_PAYLOAD_EXAMPLES[GitlabEvent.MERGE_REQUEST.value]["value"]
+    input_data = GitlabInputData(
+        db_check_id=1,
+        event=GitlabEvent.MERGE_REQUEST,
+        data=get_gitlab_model_for_event(GitlabEvent.MERGE_REQUEST, payload),
+    )
+    report = [
+        {
+            "Description": "Generic API Key",
+            "StartLine": index,
+            "EndLine": index,
+            "Match": "REDACTED",
+            "Secret": "REDACTED",
+            "File": f"app/settings_{index}.py",
+            "Commit": "a" * 40,
+            "RuleID": "generic-api-key",
+            "Fingerprint": f"{'a' * 40}:app/settings_{index}.py:{index}",
+        }
+        for index in range(findings)
+    ]
+    scan_result = GitlabScanResult(
+        db_id=1,
+        handler_name="gitleaks",
+        component_name="gitleaks",
+        input=input_data,
+        file=GitlabScanResultFile(
+            commit_hash="a" * 40, scan_name="gitleaks", format="json", content=report
+        ),
+    )
+    return GitlabOutputResult(
+        handler_name="defectdojo",
+        component_name="defectdojo",
+        scan_result=scan_result,
+        response=OutputResponse(
+            project_name="secbot",
+            project_url="https://gitlab.example.com/security/secbot",
+            findings=[
+                OutputFinding(
+                    title=f"Generic API Key in app/settings_{index}.py",
+                    severity=Severity.HIGH,
+                    url=f"https://defectdojo.example.com/finding/{index}",
+                )
+                for index in range(findings)
+            ],
+        ),
+    )
+
+
+def legacy_round_trip(value: Any) -> Tuple[Any, int]:
+    # The caller deserialized the models, kombu encoded the message with json,
+    # and the task serialized the models back from the decoded message
+    body = json.dumps(utils.deserializer(value))
+    return utils.serializer(json.loads(body)), len(body)
+
+
+def codec_round_trip(value: Any) -> Tuple[Any, int]:
+    body = codec.dumps(value)
+    return codec.loads(body), len(body)
+
+
+def measure(round_trip: Callable[[Any], Tuple[Any, int]], value: Any, number: int):
+    _, size = round_trip(value)  # warm up
+
+    started = time.perf_counter()
+    for _ in range(number):
+        round_trip(value)
+    return number / (time.perf_counter() - started), size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    payloads: Dict[str, Any] = {
+        f"{findings} findings": ((build_output_result(findings),), {})
+        for findings in (0, 10, 100)
+    }
+
+    print(
+        f"{'payload':<16}{'before, op/s':>14}{'after, op/s':>14}{'speedup':>10}"
+        f"{'before, B':>12}{'after, B':>12}{'gzip, B':>10}"
+    )
+    for name, value in payloads.items():
+        before, before_size = measure(legacy_round_trip, value, args.number)
+        after, after_size = measure(codec_round_trip, value, args.number)
+        print(
+            f"{name:<16}{before:>14.0f}{after:>14.0f}{after / before:>9.1f}x"
+            f"{before_size:>12}{after_size:>12}"
+            f"{len(gzip.compress(codec.dumps(value))):>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,15 @@ UVICORN_LOG_LEVEL=${UVICORN_LOG_LEVEL:-"info"}
 CELERY_LOG_LEVEL=${CELERY_LOG_LEVEL:-"info"}
 CELERY_MIN_WORKERS=${CELERY_MIN_WORKERS:-"1"}
 CELERY_MAX_WORKERS=${CELERY_MAX_WORKERS:-"2"}
+CELERY_ASYNC_CONCURRENCY=${CELERY_ASYNC_CONCURRENCY:-"200"}
+
+### Celery stage queues, keep in sync with SECBOT_*_QUEUE settings ###
+CELERY_DEFAULT_QUEUE=${CELERY_DEFAULT_QUEUE:-"celery"}
+SECBOT_SCANS_QUEUE=${SECBOT_SCANS_QUEUE:-""}
+SECBOT_OUTPUTS_QUEUE=${SECBOT_OUTPUTS_QUEUE:-""}
+SECBOT_NOTIFICATIONS_QUEUE=${SECBOT_NOTIFICATIONS_QUEUE:-""}
+### The queues of the components in app/config.yml, comma separated ###
+CELERY_EXTRA_QUEUES=${CELERY_EXTRA_QUEUES:-""}
 
 if [ $UVICORN_RELOAD == "true" ]; then
   UVICORN_START_ARGS="${UVICORN_START_ARGS} --reload"
@@ -47,10 +56,78 @@ function run_security_gateway() {
   uvicorn app.main:security_gateway_app --host 0.0.0.0 --port ${UVICORN_SECURITY_GATEWAY_PORT} --log-level ${UVICORN_LOG_LEVEL} ${UVICORN_START_ARGS}
 }
 
+function join_queues() {
+  # Join the non-empty queue names with commas
+  local IFS=","
+  local queues=()
+  for queue in "$@"; do
+    [ -n "$queue" ] && queues+=("$queue")
+  done
+  echo "${queues[*]}"
+}
+
 function run_celery() {
   echo "Starting security bot celery worker"
   export_overriden_env
-  celery -A app.main:celery_app worker --autoscale=${CELERY_MAX_WORKERS},${CELERY_MIN_WORKERS} --loglevel ${CELERY_LOG_LEVEL}
+  QUEUES=$(join_queues "${CELERY_DEFAULT_QUEUE}" "${SECBOT_SCANS_QUEUE}" "${SECBOT_OUTPUTS_QUEUE}" "${SECBOT_NOTIFICATIONS_QUEUE}" "${CELERY_EXTRA_QUEUES}")
+  celery -A app.main:celery_app worker --autoscale=${CELERY_MAX_WORKERS},${CELERY_MIN_WORKERS} --queues ${QUEUES} --loglevel ${CELERY_LOG_LEVEL}
+}
+
+function run_celery_stage() {
+  # Run the worker pool of a single stage queue, e.g. "scans",
+  # autoscaled by CELERY_<STAGE>_MAX_WORKERS and CELERY_<STAGE>_MIN_WORKERS
+  export_overriden_env
+  local stage=${1^^}
+  local queue_var="SECBOT_${stage}_QUEUE"
+  local max_var="CELERY_${stage}_MAX_WORKERS"
+  local min_var="CELERY_${stage}_MIN_WORKERS"
+  if [ -z "${!queue_var}" ]; then
+    echo "${queue_var} is not set"
+    exit 1
+  fi
+  echo "Starting security bot celery worker of the ${!queue_var} queue"
+  celery -A app.main:celery_app worker --autoscale=${!max_var:-$CELERY_MAX_WORKERS},${!min_var:-$CELERY_MIN_WORKERS} --queues ${!queue_var} --hostname "${1}@%h" --loglevel ${CELERY_LOG_LEVEL}
+}
+
+function run_celery_queue() {
+  # Run the worker pool of a single queue, e.g. of a component of app/config.yml
+  export_overriden_env
+  if [ -z "$1" ]; then
+    echo "The queue is not set"
+    exit 1
+  fi
+  echo "Starting security bot celery worker of the $1 queue"
+  celery -A app.main:celery_app worker --autoscale=${CELERY_MAX_WORKERS},${CELERY_MIN_WORKERS} --queues "$1" --hostname "$1@%h" --loglevel ${CELERY_LOG_LEVEL}
+}
+
+function run_celery_async() {
+  echo "Starting security bot async celery worker"
+  export_overriden_env
+  if [ -z "${SECBOT_ASYNC_HANDLERS_QUEUE}" ]; then
+    echo "SECBOT_ASYNC_HANDLERS_QUEUE is not set"
+    exit 1
+  fi
+  export SECBOT_ASYNC_WORKER=true
+  celery -A app.main:celery_app worker --pool threads --concurrency ${CELERY_ASYNC_CONCURRENCY} --queues ${SECBOT_ASYNC_HANDLERS_QUEUE} --loglevel ${CELERY_LOG_LEVEL}
+}
+
+function run_celery_beat() {
+  # A single beat process releases the queued workflows periodically
+  echo "Starting security bot celery beat"
+  export_overriden_env
+  celery -A app.main:celery_app beat --loglevel ${CELERY_LOG_LEVEL}
+}
+
+function run_gitlab_backfill() {
+  echo "Starting security bot gitlab backfill"
+  export_overriden_env
+  python -m app.secbot.inputs.gitlab.backfill "$@"
+}
+
+function run_gitlab_dispatcher() {
+  echo "Starting security bot gitlab dispatcher"
+  export_overriden_env
+  python -m app.secbot.inputs.gitlab.dispatcher
 }
 
 case $1 in
@@ -66,6 +143,31 @@ case $1 in
   "start_celery")
     run_celery
   ;;
+  "start_celery_async")
+    run_celery_async
+  ;;
+  "start_celery_scans")
+    run_celery_stage scans
+  ;;
+  "start_celery_outputs")
+    run_celery_stage outputs
+  ;;
+  "start_celery_notifications")
+    run_celery_stage notifications
+  ;;
+  "start_celery_queue")
+    run_celery_queue "$2"
+  ;;
+  "start_celery_beat")
+    run_celery_beat
+  ;;
+  "start_gitlab_dispatcher")
+    run_gitlab_dispatcher
+  ;;
+  "gitlab_backfill")
+    shift
+    run_gitlab_backfill "$@"
+  ;;
   "migrate")
     run_migrations
   ;;
@@ -76,5 +178,13 @@ case $1 in
     echo "  migrate:   run migrations"
     echo "  start_app:     run app"
     echo "  start_celery:     run celery"
+    echo "  start_celery_async:     run celery for the output and notification handlers"
+    echo "  start_celery_scans:     run celery for the scans queue"
+    echo "  start_celery_outputs:     run celery for the outputs queue"
+    echo "  start_celery_notifications:     run celery for the notifications queue"
+    echo "  start_celery_queue <queue>:     run celery for the queue of a component"
+    echo "  start_celery_beat:     run celery beat releasing the queued workflows"
+    echo "  start_gitlab_dispatcher:     run gitlab dispatcher (webhook ingest mode)"
+    echo "  gitlab_backfill:     scan the existing gitlab repositories"
   ;;
 esac
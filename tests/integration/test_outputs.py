@@ -4,7 +4,9 @@ import pytest
 
 from app.secbot.inputs.gitlab.handlers.defectdojo.services import (
     OutputResultObject,
-    send_result,
+    get_test_findings,
+    is_test_processed,
+    upload_result,
 )
 from tests.units.factories import create_merge_request_webhook__security_bot
 
@@ -17,10 +19,7 @@ from tests.units.factories import create_merge_request_webhook__security_bot
 @mock.patch(
     "app.secbot.inputs.gitlab.handlers.defectdojo.services.dd_findings_by_test"
 )
-@mock.patch("app.secbot.inputs.gitlab.handlers.defectdojo.services.asyncio.sleep")
 async def test_defectdojo_output(
-    # TODO(ivan.zhirov): mock tests with time.sleep
-    sleep,
     dd_findings_by_test,
     dd_prepare,
     dd_get_test,
@@ -38,6 +37,7 @@ async def test_defectdojo_output(
             result=output_data.read(),
         )
 
+    dd_upload.return_value = mock.Mock(data={"test_id": 42})
     dd_get_test.return_value = {"percent_complete": 100}
 
     # TODO(ivan.zhirov): mock the response from the server
@@ -45,7 +45,9 @@ async def test_defectdojo_output(
 
     credentials = mock.Mock()
 
-    assert await send_result(credentials=credentials, output_result=result)
+    assert await upload_result(credentials=credentials, output_result=result) == 42
+    assert await is_test_processed(credentials, 42)
+    assert await get_test_findings(credentials, 42) == []
 
     dd_prepare.assert_called_once()
     dd_upload.assert_called_once()
@@ -1,4 +1,6 @@
-from app.main import sanitize_event_values
+from unittest import mock
+
+from app.main import before_send, init_sentry, sanitize_event_values
 from app.settings import flatten_settings_values
 
 
@@ -23,3 +25,22 @@ def test_sanitize_event_values(example_settings):
             "val": "Today in [Redacted] we rule the [Redacted]",
         }
     }
+
+
+def test_init_sentry():
+    dsn = "https://key@sentry.example.com/1"
+    with mock.patch("app.main.settings.sentry_dsn", dsn), mock.patch(
+        "app.main.sentry_sdk.init"
+    ) as init_mock:
+        init_sentry()
+
+    init_mock.assert_called_once_with(dsn=dsn, before_send=before_send)
+
+
+def test_init_sentry_without_dsn():
+    with mock.patch("app.main.settings.sentry_dsn", None), mock.patch(
+        "app.main.sentry_sdk.init"
+    ) as init_mock:
+        init_sentry()
+
+    init_mock.assert_not_called()
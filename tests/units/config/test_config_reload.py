@@ -0,0 +1,118 @@
+import os
+from unittest import mock
+
+import pytest
+import yaml
+
+from app.main import init_worker, watch_workflow_config
+from app.secbot.config import ReloadableSecbotConfig
+from app.secbot.exceptions import SecbotConfigError
+
+
+def config_obj(event_type: str) -> dict:
+    return {
+        "version": "1.0",
+        "components": {"gitleaks": {"handler_name": "gitleaks"}},
+        "jobs": [
+            {
+                "name": "job",
+                "rules": {"gitlab": {"event_type": event_type}},
+                "scans": ["gitleaks"],
+                "outputs": [],
+                "notifications": [],
+            }
+        ],
+    }
+
+
+@pytest.fixture
+def config_file(tmp_path):
+    path = tmp_path / "config.yml"
+
+    def write(content: str):
+        path.write_text(content)
+        # Make sure the mtime differs on file systems with the coarse mtime
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        return path
+
+    write(yaml.safe_dump(config_obj("merge_request")))
+    return write
+
+
+def test_config_reload(config_file):
+    path = config_file(yaml.safe_dump(config_obj("merge_request")))
+    config = ReloadableSecbotConfig(str(path))
+    version = config.version
+
+    assert config.reload() is False
+    assert config.matching_workflow_jobs("gitlab", {"event_type": "merge_request"})
+
+    config_file(yaml.safe_dump(config_obj("push")))
+
+    assert config.reload() is True
+    assert config.version != version
+    assert config.matching_workflow_jobs("gitlab", {"event_type": "push"})
+    assert not config.matching_workflow_jobs("gitlab", {"event_type": "merge_request"})
+
+
+def test_config_reload_keeps_valid_config(config_file):
+    config = ReloadableSecbotConfig(
+        str(config_file(yaml.safe_dump(config_obj("merge_request"))))
+    )
+    version = config.version
+
+    config_file("version: 1.0\ncomponents: {}\njobs: []\n")
+
+    with pytest.raises(SecbotConfigError):
+        config.reload()
+    assert config.version == version
+    assert config.matching_workflow_jobs("gitlab", {"event_type": "merge_request"})
+
+
+def test_config_reload_same_content(config_file):
+    content = yaml.safe_dump(config_obj("merge_request"))
+    config = ReloadableSecbotConfig(str(config_file(content)))
+
+    config_file(content)
+
+    assert config.reload() is False
+
+
+def test_config_is_loaded_on_first_use(config_file, tmp_path):
+    config = ReloadableSecbotConfig(str(tmp_path / "missing.yml"))
+
+    with pytest.raises(FileNotFoundError):
+        config.load()
+
+    config = ReloadableSecbotConfig(
+        str(config_file(yaml.safe_dump(config_obj("push"))))
+    )
+
+    assert config.matching_workflow_jobs("gitlab", {"event_type": "push"})
+
+
+def test_worker_processes_watch_config():
+    with mock.patch("app.main.celery_queues_instrument"), mock.patch(
+        "app.main.worker_runtime_instrument"
+    ), mock.patch("app.main.worker_init") as worker_init_mock, mock.patch(
+        "app.main.worker_process_init"
+    ) as worker_process_init_mock:
+        init_worker(mock.MagicMock())
+
+    # The forked processes of the prefork pool start their own watchers
+    worker_init_mock.connect.assert_called_once_with(watch_workflow_config, weak=False)
+    worker_process_init_mock.connect.assert_called_once_with(
+        watch_workflow_config, weak=False
+    )
+
+
+@mock.patch("app.main.secbot_settings")
+@mock.patch("app.secbot.config.config")
+def test_watch_workflow_config(config_mock, settings_mock):
+    settings_mock.config_reload_interval = 30
+
+    watch_workflow_config(sender=None)
+
+    config_mock.load.assert_called_once()
+    config_mock.watch.assert_called_once_with(30)
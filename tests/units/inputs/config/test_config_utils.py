@@ -1,7 +1,119 @@
-from app.secbot.config import get_jsonpath_value
+import pytest
 
+from app.secbot.config import (
+    JobRule,
+    WorkflowJob,
+    WorkflowJobsIndex,
+    is_job_valid_for_rules,
+)
+from app.secbot.exceptions import SecbotConfigError
+from app.secbot.jsonpath import compile_jsonpath
 
-def test_config_get_jsonpath_value():
-    meaning_of_the_universe = 42
-    data = {"base": {"deep": {"deeper": {"here": meaning_of_the_universe}}}}
-    assert get_jsonpath_value(data, "base.deep.deeper.here") == meaning_of_the_universe
+
+def make_job(name: str, rules: dict) -> WorkflowJob:
+    return WorkflowJob(
+        name=name,
+        input_name="gitlab",
+        rules=rules,
+        scans=[],
+        outputs=[],
+    )
+
+
+def test_job_rule_literal():
+    assert JobRule("event_type", "merge_request").literal == "merge_request"
+    assert JobRule("project.path", "group/.*").literal is None
+
+
+def test_job_rule_invalid_regex():
+    with pytest.raises(SecbotConfigError):
+        JobRule("project.path", "group/(")
+
+
+@pytest.mark.parametrize(
+    "data, is_valid",
+    [
+        ({"project": {"id": 42}}, True),
+        ({"project": {"id": 43}}, False),
+        ({"project": "42"}, False),
+        ({}, False),
+    ],
+)
+def test_is_job_valid_for_rules(data, is_valid):
+    job = make_job("job", {"project.id": "42"})
+    assert is_job_valid_for_rules(job, data) is is_valid
+
+
+def test_workflow_jobs_index_candidates():
+    merge_request = make_job("merge request", {"event_type": "merge_request"})
+    push = make_job("push", {"event_name": "push", "ref": "refs/heads/.*"})
+    any_project = make_job("any project", {"project.path": "group/.*"})
+    index = WorkflowJobsIndex([merge_request, push, any_project])
+
+    assert index.candidates({"event_type": "merge_request"}) == [
+        merge_request,
+        any_project,
+    ]
+    assert index.candidates({"event_name": "push"}) == [push, any_project]
+    assert index.matching({"event_name": "push", "ref": "refs/heads/main"}) == [push]
+
+
+@pytest.mark.parametrize(
+    "path, values",
+    [
+        ("project.name", ["secbot"]),
+        ("$.project.name", ["secbot"]),
+        ("commits[0].id", [1]),
+        ("commits[-1].id", [2]),
+        ("commits[*].id", [1, 2]),
+        ("labels[*].title", ["security", "bug"]),
+        ("['key.with.dots']", ["value"]),
+        ("commits[*].missing", []),
+        ("commits[2].id", []),
+        ("project[0]", []),
+    ],
+)
+def test_compile_jsonpath(path, values):
+    data = {
+        "project": {"name": "secbot"},
+        "commits": [{"id": 1}, {"id": 2}],
+        "labels": [{"title": "security"}, {"title": "bug"}],
+        "key.with.dots": "value",
+    }
+    assert compile_jsonpath(path)(data) == values
+
+
+@pytest.mark.parametrize("path", ["", "$.", "a..b", "a.", "a.[0]", "a[x]"])
+def test_compile_jsonpath_invalid(path):
+    with pytest.raises(ValueError):
+        compile_jsonpath(path)
+
+
+def test_job_rule_invalid_path():
+    with pytest.raises(SecbotConfigError):
+        JobRule("labels[x]", "security")
+
+
+@pytest.mark.parametrize(
+    "path, emails, is_matched",
+    [
+        ("commits[*].author.email", ["a@example.com", "b@other.com"], True),
+        ("any:commits[*].author.email", ["b@other.com"], False),
+        ("all:commits[*].author.email", ["a@example.com", "b@other.com"], False),
+        ("all:commits[*].author.email", ["a@example.com", "b@example.com"], True),
+        ("all:commits[*].author.email", [], False),
+    ],
+)
+def test_job_rule_quantifiers(path, emails, is_matched):
+    data = {"commits": [{"author": {"email": email}} for email in emails]}
+    assert JobRule(path, r".*@example\.com").matches(data) is is_matched
+
+
+def test_workflow_jobs_index_wildcard_candidates():
+    security = make_job("security", {"labels[*].title": "security"})
+    bug = make_job("bug", {"labels[*].title": "bug"})
+    index = WorkflowJobsIndex([security, bug])
+
+    data = {"labels": [{"title": "bug"}, {"title": "security"}]}
+    assert index.candidates(data) == [security, bug]
+    assert index.matching({"labels": [{"title": "feature"}]}) == []
@@ -1,8 +1,6 @@
-import pytest
 import yaml
 
 from app.secbot.config import SecbotConfig
-from app.secbot.exceptions import SecbotConfigError
 from app.secbot.inputs.gitlab.schemas import GitlabEvent
 
 
@@ -57,10 +55,11 @@ def test_parse_yaml_with_repo_regex_exclude(get_event_data):
         GitlabEvent.MERGE_REQUEST,
         {"project": {"path_with_namespace": "secbot-test-group/example-project"}},
     )
-    assert yaml_config.matching_workflow_job("gitlab", data=data)
+    jobs = yaml_config.matching_workflow_jobs("gitlab", data=data)
+    assert [job.name for job in jobs] == ["Another merge request"]
 
 
-def test_parse_yaml_with_repo_regex(get_event_data):
+def test_parse_yaml_with_multiple_matching_jobs(get_event_data):
     yaml_string = """
         version: "1.0" 
         components:
@@ -111,5 +110,5 @@ def test_parse_yaml_with_repo_regex(get_event_data):
         GitlabEvent.MERGE_REQUEST,
         {"project": {"path_with_namespace": "secbot-test-group/example-project"}},
     )
-    with pytest.raises(SecbotConfigError):
-        secbot_config.matching_workflow_job("gitlab", data=data)
+    jobs = secbot_config.matching_workflow_jobs("gitlab", data=data)
+    assert [job.name for job in jobs] == ["Exclude gitlab", "Another merge request"]
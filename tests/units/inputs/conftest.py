@@ -2,6 +2,7 @@ import json
 import pathlib
 from typing import Dict, Optional
 
+import git
 import pytest
 from pydantic.utils import deep_update
 
@@ -44,3 +45,24 @@ def generate_commit_data(faker):
         return deep_update(data, overrides or {})
 
     return handler
+
+
+def commit_file(repo: git.Repo, name: str, content: str) -> str:
+    path = pathlib.Path(repo.working_dir, name)
+    path.write_text(content)
+    repo.index.add([name])
+    return repo.index.commit(f"Update {name}").hexsha
+
+
+@pytest.fixture
+def git_origin(tmp_path):
+    """The origin repository of five commits, served over the file protocol."""
+    repo = git.Repo.init(tmp_path / "origin")
+    with repo.config_writer() as writer:
+        writer.set_value("uploadpack", "allowFilter", True)
+        writer.set_value("uploadpack", "allowAnySHA1InWant", True)
+        writer.set_value("user", "name", "secbot")
+        writer.set_value("user", "email", "secbot@example.com")
+    for index in range(5):
+        commit_file(repo, f"file-{index}", f"content {index}")
+    return repo
@@ -0,0 +1,154 @@
+from unittest import mock
+
+import pytest
+from celery import Celery
+from polyfactory.factories.pydantic_factory import ModelFactory
+
+import app.secbot.inputs.gitlab.handlers.defectdojo as defectdojo
+from app.secbot.inputs.gitlab.handlers.defectdojo import (
+    DefectDojoCredentials,
+    DefectDojoHandler,
+)
+from app.secbot.inputs.gitlab.handlers.defectdojo.services import (
+    DEDUPLICATION_DELAY,
+    TEST_POLL_ATTEMPTS,
+    TEST_POLL_INTERVAL,
+)
+from app.secbot.inputs.gitlab.schemas import (
+    GitlabOutputResult,
+    GitlabScanResult,
+    GitlabScanResultFile,
+)
+from app.secbot.inputs.gitlab.schemas.output_responses import OutputFinding
+from app.secbot.schemas import SecbotContinuation
+
+
+class GitlabScanResultFileFactory(ModelFactory[GitlabScanResultFile]):
+    __model__ = GitlabScanResultFile
+
+    content = {}
+    artifact = None
+
+
+class GitlabScanResultFactory(ModelFactory[GitlabScanResult]):
+    __model__ = GitlabScanResult
+
+    file = GitlabScanResultFileFactory.build()
+
+
+class FindingFactory(ModelFactory[OutputFinding]):
+    __model__ = OutputFinding
+
+
+@pytest.fixture
+def handler():
+    return DefectDojoHandler(celery_app=Celery(), config_name="defectdojo")
+
+
+@pytest.fixture
+def scan_result():
+    return GitlabScanResultFactory.build(db_id=1)
+
+
+@pytest.fixture
+def env():
+    return DefectDojoCredentials(
+        url="https://defectdojo.example.com", secret_key="key", user="user", lead_id=1
+    )
+
+
+@pytest.fixture
+def services(monkeypatch):
+    services = mock.Mock(
+        get_output_progress=mock.AsyncMock(return_value={}),
+        save_output_progress=mock.AsyncMock(),
+        raise_if_superseded=mock.AsyncMock(),
+        upload_result=mock.AsyncMock(return_value=42),
+        is_test_processed=mock.AsyncMock(return_value=False),
+        get_test_findings=mock.AsyncMock(return_value=FindingFactory.batch(size=2)),
+        complete_scan=mock.AsyncMock(),
+    )
+    for name in services._mock_children:
+        monkeypatch.setattr(defectdojo, name, getattr(services, name))
+    return services
+
+
+@pytest.mark.asyncio
+async def test_run_uploads_and_continues_with_polling(
+    handler, scan_result, env, services
+):
+    continuation = await handler.run(scan_result, "defectdojo", env)
+
+    services.upload_result.assert_awaited_once()
+    services.save_output_progress.assert_awaited_once_with(
+        scan_id=1,
+        output_component_name="defectdojo",
+        progress={"step": "poll_test", "test_id": 42, "attempt": 1},
+    )
+    assert continuation == SecbotContinuation(
+        step="poll_test",
+        countdown=TEST_POLL_INTERVAL,
+        state={"test_id": 42, "attempt": 1},
+    )
+
+
+@pytest.mark.asyncio
+async def test_redelivered_run_continues_from_progress(
+    handler, scan_result, env, services
+):
+    services.get_output_progress.return_value = {
+        "step": "poll_test",
+        "test_id": 42,
+        "attempt": 3,
+    }
+
+    continuation = await handler.run(scan_result, "defectdojo", env)
+
+    services.upload_result.assert_not_awaited()
+    assert continuation.step == "poll_test"
+    assert continuation.state == {"test_id": 42, "attempt": 3}
+
+
+@pytest.mark.asyncio
+async def test_poll_test_polls_again(handler, scan_result, env, services):
+    continuation = await handler.poll_test(
+        scan_result, "defectdojo", env, test_id=42, attempt=1
+    )
+
+    assert continuation.step == "poll_test"
+    assert continuation.countdown == TEST_POLL_INTERVAL
+    assert continuation.state == {"test_id": 42, "attempt": 2}
+
+
+@pytest.mark.asyncio
+async def test_poll_test_waits_for_deduplication(handler, scan_result, env, services):
+    services.is_test_processed.return_value = True
+
+    continuation = await handler.poll_test(
+        scan_result, "defectdojo", env, test_id=42, attempt=1
+    )
+
+    assert continuation.step == "collect_findings"
+    assert continuation.countdown == DEDUPLICATION_DELAY
+    assert continuation.state == {"test_id": 42}
+
+
+@pytest.mark.asyncio
+async def test_poll_test_gives_up(handler, scan_result, env, services):
+    with pytest.raises(RuntimeError, match="test_id=42"):
+        await handler.poll_test(
+            scan_result, "defectdojo", env, test_id=42, attempt=TEST_POLL_ATTEMPTS
+        )
+
+    services.save_output_progress.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_collect_findings_completes_scan(handler, scan_result, env, services):
+    result = await handler.collect_findings(scan_result, "defectdojo", env, test_id=42)
+
+    services.complete_scan.assert_awaited_once_with(
+        scan_id=1, output_component_name="defectdojo", output_external_test_id=42
+    )
+    assert isinstance(result, GitlabOutputResult)
+    assert result.response.findings == services.get_test_findings.return_value
@@ -3,8 +3,13 @@ from typing import Optional
 import pytest
 from polyfactory.factories.pydantic_factory import ModelFactory
 
-from app.secbot.inputs.gitlab.handlers.slack import generate_message_blocks
+from app.secbot.inputs.gitlab.handlers.slack import (
+    generate_check_message_blocks,
+    generate_message_blocks,
+)
 from app.secbot.inputs.gitlab.schemas import (
+    GitlabCheckResult,
+    GitlabInputData,
     GitlabOutputResult,
     GitlabScanResult,
     GitlabScanResultFile,
@@ -13,6 +18,7 @@ from app.secbot.inputs.gitlab.schemas.output_responses import (
     OutputFinding,
     OutputResponse,
 )
+from app.secbot.schemas import SecbotFailedResult, SecurityCheckStatus
 
 
 class GitlabScanResultFileFactory(ModelFactory[GitlabScanResultFile]):
@@ -68,7 +74,8 @@ def generate_slack_message_block(msg: str) -> dict:
 def test_slack_message_generation_with_correct_worker_name(
     output_result_factory, faker
 ):
-    findings_size = faker.pyint(max_value=25)
+    # The message is not generated without findings
+    findings_size = faker.pyint(min_value=1, max_value=25)
     project_name = faker.pystr()
     project_url = faker.uri()
 
@@ -108,3 +115,43 @@ def test_slack_message_generation_with_extra_limit(output_result_factory):
     assert message_blocks[-1] == generate_slack_message_block(
         f":no_bell: *{findings_size - render_limit}* were *stripped* from notification :no_bell:"
     )
+
+
+def test_slack_check_message_generation(output_result_factory):
+    outputs = [
+        output_result_factory(findings_size=2),
+        output_result_factory(findings_size=0),
+        output_result_factory(findings_size=3),
+    ]
+    check_result = GitlabCheckResult(
+        input=ModelFactory.create_factory(GitlabInputData).build(),
+        status=SecurityCheckStatus.FAIL,
+        outputs=outputs,
+        failed=[
+            SecbotFailedResult(
+                handler_name="gitleaks", component_name="gitleaks", error="Error"
+            )
+        ],
+    )
+
+    message_blocks = generate_check_message_blocks(check_result, render_limit=10)
+    assert message_blocks is not None
+
+    # The status, the findings of two outputs with headers, and the failed workers
+    assert len(message_blocks) == 1 + (1 + 2) + (1 + 3) + 1
+    assert message_blocks[0] == generate_slack_message_block(
+        "Security check status: *fail*"
+    )
+    assert message_blocks[-1] == generate_slack_message_block(
+        ":warning: *gitleaks* failed, the findings may be incomplete"
+    )
+
+
+def test_slack_check_message_generation_without_findings(output_result_factory):
+    check_result = GitlabCheckResult(
+        input=ModelFactory.create_factory(GitlabInputData).build(),
+        status=SecurityCheckStatus.SUCCESS,
+        outputs=[output_result_factory(findings_size=0)],
+        failed=[],
+    )
+    assert generate_check_message_blocks(check_result, render_limit=10) is None
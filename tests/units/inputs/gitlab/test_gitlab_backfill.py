@@ -0,0 +1,123 @@
+from unittest import mock
+
+import pytest
+
+from app.secbot.inputs.gitlab.backfill import (
+    BackfillTarget,
+    GitlabBackfill,
+    build_push_event,
+    iter_targets,
+)
+from app.secbot.inputs.gitlab.schemas import (
+    GitlabEvent,
+    PushWebhookModel,
+    get_gitlab_model_for_event,
+)
+
+PROJECT = {
+    "id": 6617,
+    "name": "Example Project",
+    "web_url": "https://git.env.local/secbot-test-group/example-project",
+    "ssh_url_to_repo": "git@git.env.local:secbot-test-group/example-project.git",
+    "http_url_to_repo": "https://git.env.local/secbot-test-group/example-project.git",
+    "namespace": {"name": "secbot-test-group"},
+    "path_with_namespace": "secbot-test-group/example-project",
+    "default_branch": "main",
+}
+COMMIT = {
+    "id": "23d5e3ab8e4dcda32a7acfb8343bfcfd12471e0a",
+    "parent_ids": ["5823620546f7624a111148d1bf60833f9e02c475"],
+    "message": "Added python file",
+    "title": "Added python file",
+    "committed_date": "2022-12-07T10:20:12+00:00",
+    "web_url": "https://git.env.local/secbot-test-group/example-project/-/commit/"
+    "23d5e3ab8e4dcda32a7acfb8343bfcfd12471e0a",
+    "author_name": "Valerio Rico",
+    "author_email": "valerio.rico@mail.env.local",
+}
+
+
+async def as_async_iter(items):
+    for item in items:
+        yield item
+
+
+@pytest.fixture
+def backfill():
+    def _factory(run_result=None, done=()):
+        security_bot = mock.Mock(run=mock.AsyncMock(return_value=run_result))
+        client = mock.Mock(
+            get_project=mock.AsyncMock(return_value=PROJECT),
+            get_commit=mock.AsyncMock(return_value=COMMIT),
+        )
+        checkpoint = mock.Mock(
+            is_done=mock.AsyncMock(side_effect=lambda target: target.key in done),
+            mark_done=mock.AsyncMock(),
+        )
+        return GitlabBackfill(
+            security_bot, client=client, checkpoint=checkpoint, concurrency=2
+        )
+
+    return _factory
+
+
+def test_build_push_event():
+    payload = build_push_event(PROJECT, COMMIT, "main")
+    data = get_gitlab_model_for_event(GitlabEvent.PUSH, payload)
+
+    assert isinstance(data, PushWebhookModel)
+    assert data.commit.id == COMMIT["id"]
+    assert data.target_branch == "main"
+    assert data.repository.homepage.host == "git.env.local"
+    assert payload["secbot_backfill"] == "true"
+
+
+@pytest.mark.asyncio
+async def test_iter_targets():
+    lines = ["# comment", "", "42", "group/project  abc123"]
+
+    targets = [target async for target in iter_targets(lines)]
+
+    assert targets == [
+        BackfillTarget(project="42"),
+        BackfillTarget(project="group/project", commit="abc123"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_backfill_dispatches_targets(backfill):
+    instance = backfill(run_result=[mock.Mock()])
+    targets = [BackfillTarget(project=str(i)) for i in range(5)]
+
+    stats = await instance.run(as_async_iter(targets))
+
+    assert stats.dispatched == 5
+    assert instance.security_bot.run.call_count == 5
+    assert instance.checkpoint.mark_done.call_count == 5
+    data = instance.security_bot.run.call_args.kwargs["data"]
+    assert data.commit.id == COMMIT["id"]
+
+
+@pytest.mark.asyncio
+async def test_backfill_resumes_from_checkpoint(backfill):
+    done = BackfillTarget(project="1")
+    instance = backfill(run_result=None, done={done.key})
+
+    stats = await instance.run(
+        as_async_iter([done, BackfillTarget(project="2", commit=COMMIT["id"])])
+    )
+
+    assert stats.resumed == 1
+    assert stats.suppressed == 1
+    instance.client.get_commit.assert_called_once_with(PROJECT["id"], COMMIT["id"])
+
+
+@pytest.mark.asyncio
+async def test_backfill_doesnt_checkpoint_failed_targets(backfill):
+    instance = backfill()
+    instance.security_bot.run.side_effect = RuntimeError()
+
+    stats = await instance.run(as_async_iter([BackfillTarget(project="1")]))
+
+    assert stats.failed == 1
+    instance.checkpoint.mark_done.assert_not_called()
@@ -1,3 +1,5 @@
+import json
+from types import SimpleNamespace
 from unittest import mock
 
 import pytest
@@ -6,10 +8,18 @@ from fastapi import HTTPException
 from app.secbot.inputs.gitlab.dependencies import (
     get_gitlab_webhook_token_header,
     gitlab_event,
+    webhook_payload,
 )
 from app.secbot.inputs.gitlab.schemas import GitlabEvent
 
 
+def create_request_mock(payload: dict) -> mock.Mock:
+    return mock.Mock(
+        body=mock.AsyncMock(return_value=json.dumps(payload, default=str).encode()),
+        state=SimpleNamespace(),
+    )
+
+
 @mock.patch("app.secbot.inputs.gitlab.dependencies.settings")
 def test_gitlab_webhook_token_header(settings_mock, faker):
     token = faker.pystr()
@@ -70,7 +80,7 @@ def test_gitlab_webhook_token_header_invalid(settings_mock):
     ],
 )
 async def test_gitlab_event_event_detection(event_name, payload, expected_event):
-    request_mock = mock.Mock(json=mock.AsyncMock(return_value=payload))
+    request_mock = create_request_mock(payload)
     event = await gitlab_event(request_mock, x_gitlab_event=event_name)
     assert event == expected_event
 
@@ -85,6 +95,32 @@ async def test_gitlab_event_event_detection(event_name, payload, expected_event)
 )
 async def test_gitlab_not_supported_event(event_name, faker):
     random_event_payload = faker.pydict()
-    request_mock = mock.Mock(json=mock.AsyncMock(return_value=random_event_payload))
+    request_mock = create_request_mock(random_event_payload)
     event = await gitlab_event(request_mock, x_gitlab_event=event_name)
     assert event is None
+
+
+def test_gitlab_webhook_token_header_missing():
+    with pytest.raises(HTTPException):
+        get_gitlab_webhook_token_header(x_gitlab_token=None)
+
+
+@pytest.mark.asyncio
+async def test_webhook_payload_decoded_once(faker):
+    payload = faker.pydict(allowed_types=["str", "int"])
+    request_mock = create_request_mock(payload)
+
+    assert await webhook_payload(request_mock) == payload
+    assert await webhook_payload(request_mock) == payload
+    request_mock.body.assert_called_once()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("body", [b"{", b"[1, 2]"])
+async def test_webhook_payload_invalid_body(body):
+    request_mock = mock.Mock(
+        body=mock.AsyncMock(return_value=body),
+        state=SimpleNamespace(),
+    )
+    with pytest.raises(HTTPException):
+        await webhook_payload(request_mock)
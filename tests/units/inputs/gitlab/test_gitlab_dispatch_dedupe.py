@@ -0,0 +1,278 @@
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from app.secbot.config import SecbotConfigComponent
+from app.secbot.dedupe import DispatchDeduplicator
+from app.secbot.inputs.gitlab import GitlabInput
+from app.secbot.inputs.gitlab.schemas import GitlabEvent, get_gitlab_model_for_event
+from app.secbot.inputs.gitlab.services import (
+    add_security_check_scan_names,
+    is_security_check_scanned,
+)
+from app.secbot.schemas import ScanStatus, SecurityCheckStatus
+
+
+@pytest.fixture
+def gitlab_input():
+    return GitlabInput(config_name="gitlab", celery_app=mock.MagicMock())
+
+
+@pytest.fixture
+def deduplicator():
+    return mock.Mock(
+        acquire=mock.AsyncMock(return_value=True),
+        release=mock.AsyncMock(),
+    )
+
+
+@pytest.fixture
+def add_scan_names():
+    return mock.AsyncMock()
+
+
+@pytest.fixture
+def run_gitlab_input(gitlab_input, deduplicator, add_scan_names, get_event_data):
+    """Run the gitlab input with mocked database, redis and celery."""
+
+    async def handler(is_scanned: bool = False, run_side_effect=None, jobs_number=1):
+        payload = get_event_data(GitlabEvent.MERGE_REQUEST)
+        del payload["raw"]
+        data = get_gitlab_model_for_event(GitlabEvent.MERGE_REQUEST, payload)
+        jobs = [
+            SimpleNamespace(scans=[SimpleNamespace(name="gitleaks")])
+            for _ in range(jobs_number)
+        ]
+        with mock.patch.multiple(
+            "app.secbot.inputs.gitlab",
+            config=mock.Mock(matching_workflow_jobs=mock.Mock(return_value=jobs)),
+            get_config_from_host=mock.Mock(return_value=mock.Mock(prefix="GIT")),
+            get_dispatch_deduplicator=mock.Mock(return_value=deduplicator),
+            db_session=mock.MagicMock(),
+            get_or_create_security_check=mock.AsyncMock(
+                return_value=mock.Mock(id=1, event_type=GitlabEvent.MERGE_REQUEST)
+            ),
+            is_security_check_scanned=mock.AsyncMock(return_value=is_scanned),
+            add_security_check_scan_names=add_scan_names,
+            supersede_merge_request=mock.AsyncMock(),
+        ), mock.patch(
+            "app.secbot.inputs.SecbotInput.run",
+            mock.AsyncMock(return_value=[], side_effect=run_side_effect),
+        ) as run_mock:
+            await gitlab_input.run(data=data, event=GitlabEvent.MERGE_REQUEST)
+        return run_mock
+
+    return handler
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("is_set, expected", [(True, True), (None, False)])
+async def test_deduplicator_acquire(is_set, expected):
+    redis = mock.Mock(set=mock.AsyncMock(return_value=is_set))
+    deduplicator = DispatchDeduplicator(redis, ttl=60)
+
+    assert await deduplicator.acquire("GIT_123") is expected
+    redis.set.assert_called_once_with("secbot:dispatch:GIT_123", "1", nx=True, ex=60)
+
+
+@pytest.mark.asyncio
+async def test_deduplicator_disabled():
+    redis = mock.Mock()
+    deduplicator = DispatchDeduplicator(redis, ttl=0)
+
+    assert await deduplicator.acquire("GIT_123") is True
+    await deduplicator.release("GIT_123")
+    redis.set.assert_not_called()
+    redis.delete.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_gitlab_input_dispatches_new_check(
+    run_gitlab_input, deduplicator, add_scan_names
+):
+    run_mock = await run_gitlab_input()
+
+    run_mock.assert_called_once()
+    deduplicator.release.assert_not_called()
+    assert add_scan_names.call_args.kwargs["scan_names"] == ["gitleaks"]
+
+
+@pytest.mark.asyncio
+async def test_gitlab_input_suppresses_in_flight_check(run_gitlab_input, deduplicator):
+    deduplicator.acquire.return_value = False
+
+    run_mock = await run_gitlab_input()
+
+    run_mock.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_gitlab_input_suppresses_scanned_check(run_gitlab_input, add_scan_names):
+    run_mock = await run_gitlab_input(is_scanned=True)
+
+    run_mock.assert_not_called()
+    add_scan_names.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_gitlab_input_releases_check_on_error(run_gitlab_input, deduplicator):
+    with pytest.raises(RuntimeError):
+        await run_gitlab_input(run_side_effect=RuntimeError)
+
+    deduplicator.release.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_gitlab_input_dispatches_every_matching_job(
+    run_gitlab_input, deduplicator
+):
+    run_mock = await run_gitlab_input(jobs_number=2)
+
+    run_mock.assert_called_once()
+    assert len(run_mock.call_args.kwargs["jobs"]) == 2
+    deduplicator.acquire.assert_called_once()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "statuses, expected",
+    [
+        ({"gitleaks": ScanStatus.NEW}, True),
+        ({"gitleaks": ScanStatus.IN_PROGRESS}, True),
+        ({"gitleaks": ScanStatus.DONE}, True),
+        ({"gitleaks": ScanStatus.ERROR}, False),
+        # E.g. of the unsupported language, it would be skipped again
+        ({"gitleaks": ScanStatus.SKIP}, True),
+        # E.g. the force push back to the superseded commit
+        ({"gitleaks": ScanStatus.SUPERSEDED}, False),
+        ({}, False),
+    ],
+)
+async def test_is_security_check_scanned(statuses, expected):
+    session = mock.Mock(
+        execute=mock.AsyncMock(
+            return_value=mock.Mock(all=mock.Mock(return_value=statuses.items()))
+        )
+    )
+
+    assert await is_security_check_scanned(session, 1, ["gitleaks"]) is expected
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "stored, expected",
+    [
+        (None, ["gitleaks"]),
+        (["gitleaks"], ["gitleaks"]),
+        (["semgrep"], ["semgrep", "gitleaks"]),
+    ],
+)
+async def test_add_security_check_scan_names(stored, expected):
+    session = mock.Mock(commit=mock.AsyncMock())
+    check = SimpleNamespace(scan_names=stored)
+
+    await add_security_check_scan_names(session, check, ["gitleaks"])
+
+    assert check.scan_names == expected
+    assert session.commit.called is (stored != expected)
+
+
+def build_component(name: str) -> SecbotConfigComponent:
+    return SecbotConfigComponent(name=name, handler_name=name)
+
+
+@pytest.fixture
+def fetch_check_status(gitlab_input):
+    """Fetch the status of the check dispatched with the gitleaks scan."""
+
+    async def handler(scan_names, scans):
+        check = SimpleNamespace(
+            id=1, event_json={}, commit_hash="a" * 40, scan_names=scan_names
+        )
+        session = mock.Mock(
+            execute=mock.AsyncMock(
+                side_effect=[
+                    mock.Mock(scalar=mock.Mock(return_value=check)),
+                    mock.Mock(all=mock.Mock(return_value=scans)),
+                ]
+            )
+        )
+        # The semgrep scan has been added to the job since the check is dispatched
+        job = SimpleNamespace(
+            scans=[build_component("gitleaks"), build_component("semgrep")],
+            outputs=[build_component("defectdojo")],
+        )
+        with mock.patch(
+            "app.secbot.inputs.gitlab.db_session",
+            mock.MagicMock(
+                return_value=mock.MagicMock(
+                    __aenter__=mock.AsyncMock(return_value=session)
+                )
+            ),
+        ), mock.patch(
+            "app.secbot.inputs.gitlab.config",
+            mock.Mock(
+                jobs={"gitlab": [job]},
+                matching_workflow_jobs=mock.Mock(return_value=[job]),
+            ),
+        ), mock.patch(
+            "app.secbot.inputs.SecbotInput.fetch_status",
+            mock.AsyncMock(return_value=SecurityCheckStatus.SUCCESS),
+        ) as fetch_status_mock:
+            status = await gitlab_input.fetch_status("GIT_123")
+        return status, fetch_status_mock
+
+    return handler
+
+
+@pytest.mark.asyncio
+async def test_gitlab_check_status_of_dispatched_scans(fetch_check_status):
+    scans = [
+        SimpleNamespace(
+            status=ScanStatus.DONE,
+            scan_name="gitleaks",
+            outputs_test_id={"defectdojo": 1},
+        )
+    ]
+
+    status, fetch_status_mock = await fetch_check_status(["gitleaks"], scans)
+
+    assert status is SecurityCheckStatus.SUCCESS
+    (outputs,) = fetch_status_mock.call_args.args
+    assert [output.name for output in outputs] == ["defectdojo"]
+    assert [
+        scan.name for scan in fetch_status_mock.call_args.kwargs["eligible_scans"]
+    ] == ["gitleaks"]
+
+
+@pytest.mark.asyncio
+async def test_gitlab_check_status_of_superseded_check(fetch_check_status):
+    scans = [
+        SimpleNamespace(
+            status=ScanStatus.SUPERSEDED, scan_name="gitleaks", outputs_test_id={}
+        )
+    ]
+
+    # The superseded scans are not a result of the check
+    status, fetch_status_mock = await fetch_check_status(["gitleaks"], scans)
+
+    assert status is SecurityCheckStatus.IN_PROGRESS
+    fetch_status_mock.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_gitlab_check_status_of_legacy_check(fetch_check_status):
+    scans = [
+        SimpleNamespace(
+            status=ScanStatus.DONE,
+            scan_name="gitleaks",
+            outputs_test_id={"defectdojo": 1},
+        )
+    ]
+
+    # The checks without the stored scans wait for the currently matching ones
+    status, fetch_status_mock = await fetch_check_status(None, scans)
+
+    assert status is SecurityCheckStatus.IN_PROGRESS
+    fetch_status_mock.assert_not_called()
@@ -0,0 +1,73 @@
+from unittest import mock
+
+import pytest
+
+from app.secbot.inputs.gitlab.handlers.gitleaks import GitleaksConfig, GitleaksHandler
+from app.secbot.inputs.gitlab.schemas import GitlabEvent, get_gitlab_model_for_event
+from app.secbot.inputs.gitlab.services import get_incremental_base
+
+NULL_COMMIT = "0" * 40
+BRANCH_HEAD = "5823620546f7624a111148d1bf60833f9e02c475"
+
+
+@pytest.fixture
+def get_model(get_event_data):
+    def handler(event: GitlabEvent, overrides=None):
+        payload = get_event_data(event, overrides)
+        del payload["raw"]
+        return get_gitlab_model_for_event(event, payload)
+
+    return handler
+
+
+@pytest.mark.parametrize(
+    "event, overrides, base",
+    [
+        # The push to the existing branch: since the previous head of the branch
+        (GitlabEvent.PUSH, None, "5823620546f7624a111148d1bf60833f9e02c475"),
+        # The new branch: since the head of the default branch
+        (GitlabEvent.PUSH, {"before": NULL_COMMIT}, BRANCH_HEAD),
+        # The merge request: since the head of the target branch
+        (GitlabEvent.MERGE_REQUEST, None, BRANCH_HEAD),
+        # The tag push: no new commits
+        (GitlabEvent.TAG_PUSH, None, None),
+    ],
+)
+@mock.patch("app.secbot.inputs.gitlab.services.get_branch_head")
+def test_get_incremental_base(get_branch_head_mock, get_model, event, overrides, base):
+    get_branch_head_mock.return_value = BRANCH_HEAD
+    data = get_model(event, overrides)
+
+    assert get_incremental_base(data) == base
+
+
+@mock.patch("app.secbot.inputs.gitlab.services.get_branch_head")
+def test_get_incremental_base_without_new_commits(get_branch_head_mock, get_model):
+    data = get_model(GitlabEvent.PUSH, {"before": NULL_COMMIT})
+    get_branch_head_mock.return_value = data.commit.id
+
+    assert get_incremental_base(data) is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "config, full_scan_due, base",
+    [
+        (GitleaksConfig(), False, None),
+        (GitleaksConfig(incremental=True), True, None),
+        (GitleaksConfig(incremental=True), False, BRANCH_HEAD),
+    ],
+)
+@mock.patch("app.secbot.inputs.gitlab.handlers.gitleaks.get_incremental_base")
+@mock.patch("app.secbot.inputs.gitlab.handlers.gitleaks.is_full_scan_due")
+async def test_gitleaks_incremental_base(
+    is_full_scan_due_mock, get_incremental_base_mock, config, full_scan_due, base
+):
+    is_full_scan_due_mock.return_value = full_scan_due
+    get_incremental_base_mock.return_value = BRANCH_HEAD
+    handler = GitleaksHandler(config_name="gitleaks", celery_app=mock.MagicMock())
+
+    assert (
+        await handler.get_incremental_base(mock.MagicMock(), 1, "gitleaks", config)
+        == base
+    )
@@ -0,0 +1,153 @@
+import json
+import time
+from unittest import mock
+
+import pytest
+from starlette.testclient import TestClient
+
+from app.main import app
+from app.secbot.exceptions import DispatchShed
+from app.secbot.inputs.gitlab.dependencies import get_gitlab_webhook_token_header
+from app.secbot.inputs.gitlab.dispatcher import dispatch_batch
+from app.secbot.inputs.gitlab.ingest import GitlabIngestEnvelope, GitlabIngestQueue
+from app.secbot.inputs.gitlab.schemas import GitlabEvent, MergeRequestWebhookModel
+
+client = TestClient(app)
+app.dependency_overrides[get_gitlab_webhook_token_header] = lambda: "token"
+
+
+@pytest.mark.asyncio
+async def test_ingest_queue_put(faker):
+    redis = mock.Mock(lpush=mock.AsyncMock())
+    payload = faker.pydict(allowed_types=["str", "int"])
+
+    await GitlabIngestQueue(redis).put(GitlabEvent.PUSH, payload)
+
+    key, item = redis.lpush.call_args.args
+    envelope = GitlabIngestEnvelope(**json.loads(item))
+    assert key == GitlabIngestQueue.queue_key
+    assert envelope.event == GitlabEvent.PUSH
+    assert envelope.payload == payload
+
+
+@pytest.mark.asyncio
+async def test_ingest_queue_take_empty_batch():
+    redis = mock.Mock(blmove=mock.AsyncMock(return_value=None))
+    assert await GitlabIngestQueue(redis).take_batch(size=10, timeout=1) == []
+
+
+@mock.patch("app.routers.gitlab.secbot_settings")
+@mock.patch("app.routers.gitlab.get_ingest_queue")
+def test_gitlab_route_ingest_mode(get_ingest_queue_mock, settings_mock, faker):
+    settings_mock.gitlab_ingest_enabled = True
+    queue = mock.Mock(put=mock.AsyncMock())
+    get_ingest_queue_mock.return_value = queue
+    payload = {"event_type": "merge_request", **faker.pydict(allowed_types=["str"])}
+
+    response = client.post(
+        "/v1/gitlab/webhook",
+        headers={"X-Gitlab-Event": "Merge Request Hook"},
+        json=payload,
+    )
+
+    assert response.status_code == 202
+    assert response.json() == {"status": "accepted"}
+    queue.put.assert_called_once_with(GitlabEvent.MERGE_REQUEST, payload)
+
+
+@pytest.mark.asyncio
+async def test_dispatch_batch(get_event_data):
+    payload = get_event_data(GitlabEvent.MERGE_REQUEST)
+    del payload["raw"]
+    envelope = GitlabIngestEnvelope(
+        event=GitlabEvent.MERGE_REQUEST,
+        payload=payload,
+        received_at=time.time(),
+    )
+    queue = mock.Mock(
+        take_batch=mock.AsyncMock(return_value=[("item", envelope)]),
+        ack=mock.AsyncMock(),
+    )
+    security_bot = mock.Mock(run=mock.AsyncMock())
+
+    assert await dispatch_batch(security_bot, queue) == 1
+
+    security_bot.run.assert_called_once()
+    assert isinstance(
+        security_bot.run.call_args.kwargs["data"], MergeRequestWebhookModel
+    )
+    queue.ack.assert_called_once_with(["item"])
+
+
+@pytest.mark.asyncio
+async def test_dispatch_batch_acks_invalid_events(faker):
+    envelope = GitlabIngestEnvelope(
+        event=GitlabEvent.PUSH,
+        payload=faker.pydict(allowed_types=["str"]),
+        received_at=time.time(),
+    )
+    queue = mock.Mock(
+        take_batch=mock.AsyncMock(return_value=[("item", envelope)]),
+        ack=mock.AsyncMock(),
+    )
+    security_bot = mock.Mock(run=mock.AsyncMock())
+
+    await dispatch_batch(security_bot, queue)
+
+    security_bot.run.assert_not_called()
+    queue.ack.assert_called_once_with(["item"])
+
+
+@pytest.mark.asyncio
+async def test_ingest_queue_requeue():
+    pipe = mock.MagicMock(execute=mock.AsyncMock())
+    redis = mock.Mock(
+        pipeline=mock.Mock(
+            return_value=mock.MagicMock(__aenter__=mock.AsyncMock(return_value=pipe))
+        )
+    )
+
+    await GitlabIngestQueue(redis).requeue(["item"])
+
+    redis.pipeline.assert_called_once_with(transaction=True)
+    pipe.lrem.assert_called_once_with(GitlabIngestQueue.processing_key, 1, "item")
+    pipe.lpush.assert_called_once_with(GitlabIngestQueue.queue_key, "item")
+    pipe.execute.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_dispatch_batch_keeps_not_dispatched_events(get_event_data):
+    payload = get_event_data(GitlabEvent.MERGE_REQUEST)
+    del payload["raw"]
+    envelope = GitlabIngestEnvelope(
+        event=GitlabEvent.MERGE_REQUEST,
+        payload=payload,
+        received_at=time.time(),
+    )
+    queue = mock.Mock(
+        take_batch=mock.AsyncMock(
+            return_value=[
+                ("dispatched", envelope),
+                ("shed", envelope),
+                ("failed", envelope),
+            ]
+        ),
+        ack=mock.AsyncMock(),
+        requeue=mock.AsyncMock(),
+    )
+    security_bot = mock.Mock(
+        run=mock.AsyncMock(side_effect=[None, DispatchShed(), RuntimeError()])
+    )
+
+    with mock.patch(
+        "app.secbot.inputs.gitlab.dispatcher.sentry_sdk"
+    ) as sentry_mock, mock.patch(
+        "app.secbot.inputs.gitlab.dispatcher.settings.gitlab_ingest_poll_timeout", 0
+    ):
+        assert await dispatch_batch(security_bot, queue) == 1
+
+    # The failed event is left unacknowledged till the dispatcher restart
+    queue.ack.assert_called_once_with(["dispatched"])
+    queue.requeue.assert_called_once_with(["shed"])
+    sentry_mock.capture_exception.assert_called_once()
+    assert isinstance(sentry_mock.capture_exception.call_args.args[0], RuntimeError)
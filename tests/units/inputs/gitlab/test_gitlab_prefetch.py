@@ -0,0 +1,100 @@
+from unittest import mock
+
+import pytest
+
+from app.secbot.config import SecbotConfigComponent, WorkflowJob
+from app.secbot.inputs.gitlab import PREFETCH_PRIORITY, GitlabInput
+from app.secbot.inputs.gitlab.schemas import GitlabEvent, get_gitlab_model_for_event
+from app.secbot.settings import settings
+
+MIRROR_CONFIG = {"fetch": {"strategy": "mirror"}}
+
+
+def make_job(rules, scans):
+    return WorkflowJob(
+        name="job",
+        input_name="gitlab",
+        rules=rules,
+        scans=[
+            SecbotConfigComponent(
+                name=name, handler_name="gitleaks", config=config, queue=queue
+            )
+            for name, config, queue in scans
+        ],
+        outputs=[],
+    )
+
+
+@pytest.fixture
+def push_data(get_event_data):
+    payload = get_event_data(GitlabEvent.PUSH)
+    del payload["raw"]
+    return get_gitlab_model_for_event(GitlabEvent.PUSH, payload)
+
+
+@pytest.mark.parametrize(
+    "jobs, queues",
+    [
+        # The mirror scans of the merge request jobs of the project
+        (
+            [
+                make_job(
+                    {
+                        "event_type": "merge_request",
+                        "project.path_with_namespace": "secbot-test-group/.*",
+                        "object_attributes.target_branch": "main",
+                    },
+                    [
+                        ("gitleaks", MIRROR_CONFIG, None),
+                        ("gitleaks-heavy", MIRROR_CONFIG, "secbot.heavy"),
+                        ("gitleaks-clone", None, "secbot.clone"),
+                    ],
+                )
+            ],
+            ["secbot.heavy", "secbot.scans"],
+        ),
+        # The merge request jobs of the other projects
+        (
+            [
+                make_job(
+                    {
+                        "event_type": "merge_request",
+                        "project.path_with_namespace": "other-group/.*",
+                    },
+                    [("gitleaks", MIRROR_CONFIG, None)],
+                )
+            ],
+            [],
+        ),
+        # The jobs of the other events
+        (
+            [
+                make_job(
+                    {"object_kind": "tag_push"},
+                    [("gitleaks", MIRROR_CONFIG, None)],
+                )
+            ],
+            [],
+        ),
+    ],
+)
+def test_gitlab_prefetch_queues(push_data, jobs, queues, monkeypatch):
+    monkeypatch.setattr(settings, "scans_queue", "secbot.scans")
+    gitlab_input = GitlabInput(config_name="gitlab", celery_app=mock.MagicMock())
+    gitlab_input.prefetch_task = mock.Mock()
+
+    with mock.patch(
+        "app.secbot.inputs.gitlab.config", mock.Mock(jobs={"gitlab": jobs})
+    ):
+        gitlab_input.prefetch(push_data)
+
+    assert [
+        call.kwargs["queue"]
+        for call in gitlab_input.prefetch_task.apply_async.call_args_list
+    ] == queues
+    for call in gitlab_input.prefetch_task.apply_async.call_args_list:
+        assert call.kwargs["args"] == (
+            "https://git.env.local/secbot-test-group/example-project.git",
+            push_data.after,
+        )
+        assert call.kwargs["priority"] == PREFETCH_PRIORITY
@@ -1,8 +1,11 @@
+from unittest import mock
+
 import pytest
 from starlette.testclient import TestClient
 
 from app.main import app
 from app.secbot.inputs.gitlab.dependencies import get_gitlab_webhook_token_header
+from app.secbot.inputs.gitlab.schemas import GitlabEvent, PushWebhookModel
 
 client = TestClient(app)
 app.dependency_overrides[get_gitlab_webhook_token_header] = lambda: "token"
@@ -21,3 +24,41 @@ async def test_gitlab_route_not_failed_with_invalid_data_event(faker):
     )
     assert response.status_code == 200
     assert response.json() == {"status": "ok"}
+
+
+@mock.patch("app.routers.gitlab.webhook_model")
+def test_gitlab_route_rejects_not_matching_event_before_validation(
+    webhook_model_mock, faker
+):
+    response = client.post(
+        "/v1/gitlab/webhook",
+        headers={"X-Gitlab-Event": "Push Hook"},
+        json={"event_name": "push", **faker.pydict(allowed_types=["str"])},
+    )
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok"}
+    webhook_model_mock.assert_not_called()
+
+
+@mock.patch("app.routers.gitlab.secbot_settings")
+@mock.patch("app.main.security_bot")
+def test_gitlab_route_prefetches_not_matching_push(
+    security_bot_mock, settings_mock, get_event_data
+):
+    settings_mock.repository_prefetch_enabled = True
+    payload = get_event_data(GitlabEvent.PUSH)
+    del payload["raw"]
+
+    with mock.patch("app.routers.gitlab.webhook_jobs", return_value=[]):
+        response = client.post(
+            "/v1/gitlab/webhook",
+            headers={"X-Gitlab-Event": "Push Hook"},
+            json=payload,
+        )
+
+    assert response.status_code == 200
+    security_bot_mock.get_input.assert_called_once_with("gitlab")
+    (data,) = security_bot_mock.get_input.return_value.prefetch.call_args.args
+    assert isinstance(data, PushWebhookModel)
+    assert data.after == payload["after"]
+    security_bot_mock.run.assert_not_called()
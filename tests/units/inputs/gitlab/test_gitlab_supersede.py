@@ -0,0 +1,346 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+from celery.result import AsyncResult, GroupResult
+
+from app.secbot.dedupe import DispatchDeduplicator
+from app.secbot.exceptions import ScanExecutionSkipped, ScanExecutionSuperseded
+from app.secbot.inputs.gitlab.schemas import GitlabEvent, get_gitlab_model_for_event
+from app.secbot.inputs.gitlab.services import (
+    handle_exception,
+    supersede_security_check_scans,
+)
+from app.secbot.inputs.gitlab.supersede import (
+    MergeRequestRevision,
+    MergeRequestRevisions,
+    get_chain_root_ids,
+    get_revision_timestamp,
+    raise_if_superseded,
+    supersede_merge_request,
+)
+from app.secbot.schemas import ScanStatus
+
+
+@pytest.fixture
+def merge_request_data(get_event_data):
+    def handler(commit_hash: str, updated_at: str = "2022-01-11 11:49:13 UTC"):
+        payload = get_event_data(
+            GitlabEvent.MERGE_REQUEST,
+            {
+                "object_attributes": {
+                    "last_commit": {"id": commit_hash},
+                    "updated_at": updated_at,
+                }
+            },
+        )
+        del payload["raw"]
+        return get_gitlab_model_for_event(GitlabEvent.MERGE_REQUEST, payload)
+
+    return handler
+
+
+def revisions_mock(replaced: bool, previous=None, latest=None):
+    return mock.Mock(
+        replace=mock.AsyncMock(return_value=(replaced, previous)),
+        latest=mock.AsyncMock(return_value=latest),
+    )
+
+
+@pytest.fixture
+def deduplicator_mock():
+    deduplicator = mock.Mock(release=mock.AsyncMock())
+    with mock.patch(
+        "app.secbot.inputs.gitlab.supersede.get_dispatch_deduplicator",
+        return_value=deduplicator,
+    ):
+        yield deduplicator
+
+
+@pytest.fixture
+def skip_scans_mock(deduplicator_mock):
+    with mock.patch(
+        "app.secbot.inputs.gitlab.supersede.db_session", mock.MagicMock()
+    ), mock.patch(
+        "app.secbot.inputs.gitlab.supersede.supersede_security_check_scans"
+    ) as skip_scans:
+        yield skip_scans
+
+
+def test_get_revision_timestamp(merge_request_data):
+    # A force-push brings the older commit with the newer update
+    data = merge_request_data("a" * 40, updated_at="2024-03-01 10:00:00 UTC")
+
+    assert get_revision_timestamp(data) == (
+        datetime(2024, 3, 1, 10, tzinfo=timezone.utc).timestamp()
+    )
+    assert get_revision_timestamp(data) > data.commit.timestamp.timestamp()
+
+
+def test_get_chain_root_ids():
+    root = SimpleNamespace(id="scan", parent=None)
+    output = SimpleNamespace(id="output", parent=root)
+    notifications = SimpleNamespace(id="notifications", parent=output)
+
+    assert get_chain_root_ids(notifications) == ["scan"]
+
+
+def test_get_chord_root_ids():
+    app = mock.Mock()
+
+    def result(task_id, parent=None):
+        return AsyncResult(task_id, parent=parent, app=app, backend=app.backend)
+
+    header = GroupResult(
+        "header",
+        [
+            result("output", parent=result("gitleaks")),
+            result("output", parent=result("semgrep")),
+        ],
+        app=app,
+    )
+    fan_in = result("fan_in", parent=header)
+
+    assert get_chain_root_ids(fan_in) == ["gitleaks", "semgrep"]
+
+
+@pytest.mark.asyncio
+async def test_revisions_key(merge_request_data):
+    data = merge_request_data("a" * 40)
+    revisions = MergeRequestRevisions(mock.Mock(), ttl=60)
+
+    key = f"secbot:gitlab:mr:{data.project.id}:{data.object_attributes.iid}"
+    assert revisions.key(data) == key
+
+
+@pytest.mark.asyncio
+async def test_revisions_replace_first_revision(merge_request_data):
+    redis = mock.Mock(eval=mock.AsyncMock(return_value=[1, ""]))
+    revision = MergeRequestRevision(commit="a" * 40, timestamp=1)
+
+    replaced, previous = await MergeRequestRevisions(redis, ttl=60).replace(
+        merge_request_data(revision.commit), revision
+    )
+
+    assert replaced is True
+    assert previous is None
+
+
+@pytest.mark.asyncio
+async def test_supersede_revokes_previous_commit(
+    merge_request_data, skip_scans_mock, deduplicator_mock
+):
+    celery_app = mock.Mock()
+    previous = MergeRequestRevision(
+        commit="a" * 40,
+        timestamp=1,
+        check_id=1,
+        security_id="GIT_A",
+        scan_names=["gitleaks"],
+        task_ids=["old"],
+    )
+    results = [SimpleNamespace(id="new", parent=None)]
+
+    with mock.patch(
+        "app.secbot.inputs.gitlab.supersede.get_merge_request_revisions",
+        return_value=revisions_mock(replaced=True, previous=previous),
+    ):
+        await supersede_merge_request(
+            celery_app,
+            merge_request_data("b" * 40),
+            check_id=2,
+            security_id="GIT_B",
+            scan_names=["gitleaks"],
+            results=results,
+        )
+
+    celery_app.control.revoke.assert_called_once_with(["old"])
+    skip_scans_mock.assert_awaited_once_with(
+        db_session=mock.ANY, check_id=1, scan_names=["gitleaks"]
+    )
+    deduplicator_mock.release.assert_awaited_once_with("GIT_A")
+
+
+@pytest.mark.asyncio
+async def test_supersede_revokes_out_of_order_commit(
+    merge_request_data, skip_scans_mock, deduplicator_mock
+):
+    celery_app = mock.Mock()
+    latest = MergeRequestRevision(commit="b" * 40, timestamp=2, task_ids=["new"])
+    results = [SimpleNamespace(id="old", parent=None)]
+
+    with mock.patch(
+        "app.secbot.inputs.gitlab.supersede.get_merge_request_revisions",
+        return_value=revisions_mock(replaced=False, previous=latest),
+    ):
+        await supersede_merge_request(
+            celery_app,
+            merge_request_data("a" * 40),
+            check_id=1,
+            security_id="GIT_A",
+            scan_names=["gitleaks"],
+            results=results,
+        )
+
+    celery_app.control.revoke.assert_called_once_with(["old"])
+    skip_scans_mock.assert_awaited_once_with(
+        db_session=mock.ANY, check_id=1, scan_names=["gitleaks"]
+    )
+    deduplicator_mock.release.assert_awaited_once_with("GIT_A")
+
+
+@pytest.mark.asyncio
+async def test_supersede_keeps_same_commit(
+    merge_request_data, skip_scans_mock, deduplicator_mock
+):
+    celery_app = mock.Mock()
+    previous = MergeRequestRevision(
+        commit="a" * 40, timestamp=1, check_id=1, task_ids=["old"]
+    )
+
+    with mock.patch(
+        "app.secbot.inputs.gitlab.supersede.get_merge_request_revisions",
+        return_value=revisions_mock(replaced=True, previous=previous),
+    ):
+        await supersede_merge_request(
+            celery_app,
+            merge_request_data("a" * 40),
+            check_id=1,
+            security_id="GIT_A",
+            scan_names=["gitleaks"],
+            results=[],
+        )
+
+    celery_app.control.revoke.assert_not_called()
+    skip_scans_mock.assert_not_called()
+    deduplicator_mock.release.assert_not_called()
+
+
+class FakeRedis:
+    """The keys of the dispatch deduplicator in memory."""
+
+    def __init__(self):
+        self.values = {}
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    async def delete(self, key):
+        self.values.pop(key, None)
+
+
+@pytest.mark.asyncio
+async def test_supersede_force_push_back(merge_request_data):
+    deduplicator = DispatchDeduplicator(FakeRedis(), ttl=60)
+    revisions = {
+        commit: MergeRequestRevision(
+            commit=commit * 40, timestamp=timestamp, security_id=f"GIT_{commit}"
+        )
+        for commit, timestamp in (("a", 1), ("b", 2))
+    }
+
+    async def dispatch(commit, previous):
+        if not await deduplicator.acquire(f"GIT_{commit}"):
+            return False
+        with mock.patch(
+            "app.secbot.inputs.gitlab.supersede.get_merge_request_revisions",
+            return_value=revisions_mock(replaced=True, previous=previous),
+        ), mock.patch(
+            "app.secbot.inputs.gitlab.supersede.get_dispatch_deduplicator",
+            return_value=deduplicator,
+        ):
+            await supersede_merge_request(
+                mock.Mock(),
+                merge_request_data(commit * 40),
+                check_id=1,
+                security_id=f"GIT_{commit}",
+                scan_names=["gitleaks"],
+                results=[],
+            )
+        return True
+
+    # A is pushed, B supersedes it, and A is force-pushed back
+    assert await dispatch("a", previous=None) is True
+    assert await dispatch("b", previous=revisions["a"]) is True
+    assert await dispatch("a", previous=revisions["b"]) is True
+    # The re-delivered event of A is still suppressed
+    assert await dispatch("a", previous=revisions["a"]) is False
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("latest_commit, is_superseded", [("a", False), ("b", True)])
+async def test_raise_if_superseded(merge_request_data, latest_commit, is_superseded):
+    latest = MergeRequestRevision(commit=latest_commit * 40, timestamp=1)
+    redis = mock.Mock(get=mock.AsyncMock(return_value=latest.json()))
+
+    with mock.patch(
+        "app.secbot.inputs.gitlab.supersede.get_merge_request_revisions",
+        return_value=MergeRequestRevisions(redis, ttl=60),
+    ):
+        if is_superseded:
+            with pytest.raises(ScanExecutionSuperseded):
+                await raise_if_superseded(merge_request_data("a" * 40))
+        else:
+            await raise_if_superseded(merge_request_data("a" * 40))
+
+
+@pytest.mark.asyncio
+async def test_supersede_security_check_scans():
+    scans = {
+        "gitleaks": SimpleNamespace(status=ScanStatus.NEW),
+        "semgrep": SimpleNamespace(status=ScanStatus.IN_PROGRESS),
+        "trivy": SimpleNamespace(status=ScanStatus.DONE),
+    }
+    session = mock.Mock(commit=mock.AsyncMock())
+
+    with mock.patch(
+        "app.secbot.inputs.gitlab.services.get_or_create_security_scan",
+        side_effect=lambda db_session, check_id, scan_name: scans[scan_name],
+    ):
+        await supersede_security_check_scans(
+            db_session=session, check_id=1, scan_names=list(scans)
+        )
+
+    # The running scans are skipped at their checkpoints
+    assert {name: scan.status for name, scan in scans.items()} == {
+        "gitleaks": ScanStatus.SUPERSEDED,
+        "semgrep": ScanStatus.IN_PROGRESS,
+        "trivy": ScanStatus.DONE,
+    }
+    session.commit.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "exception, status",
+    [
+        (ScanExecutionSkipped("Unsupported language"), ScanStatus.SKIP),
+        (ScanExecutionSuperseded("Commit is superseded"), ScanStatus.SUPERSEDED),
+    ],
+)
+async def test_handle_skipped_scan(exception, status):
+    scan = SimpleNamespace(status=ScanStatus.IN_PROGRESS)
+    session = mock.Mock(
+        execute=mock.AsyncMock(
+            return_value=mock.Mock(scalar=mock.Mock(return_value=scan))
+        ),
+        commit=mock.AsyncMock(),
+    )
+
+    with mock.patch(
+        "app.secbot.inputs.gitlab.services.async_db_session",
+        mock.MagicMock(
+            return_value=mock.MagicMock(
+                __aenter__=mock.AsyncMock(return_value=session)
+            )
+        ),
+    ):
+        await handle_exception(
+            check_id=1, scan_component_name="gitleaks", exception=exception
+        )
+
+    assert scan.status is status
@@ -0,0 +1,80 @@
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+import redis
+
+from app.metrics import celery as celery_metrics
+from app.secbot.redis import get_broker_queue_names
+
+
+def make_task(published_at=None, eta=None, queue="secbot.scans"):
+    request = SimpleNamespace(
+        delivery_info={"routing_key": queue},
+        eta=eta,
+    )
+    if published_at is not None:
+        setattr(request, celery_metrics.PUBLISHED_AT_HEADER, published_at)
+    return SimpleNamespace(request=request)
+
+
+def test_before_publish_sets_header():
+    headers = {}
+    celery_metrics.before_publish(headers=headers)
+
+    assert headers[celery_metrics.PUBLISHED_AT_HEADER] <= time.time()
+
+
+@mock.patch.object(celery_metrics, "SRE_QUEUE_LATENCY")
+def test_prerun_observes_queue_latency(latency):
+    celery_metrics.prerun(make_task(published_at=time.time() - 5))
+
+    assert latency.labels.call_args.kwargs["queue"] == "secbot.scans"
+    observed = latency.labels.return_value.observe.call_args.args[0]
+    assert 5 <= observed < 6
+
+
+@mock.patch.object(celery_metrics, "SRE_QUEUE_LATENCY")
+def test_prerun_measures_delayed_task_from_eta(latency):
+    eta = time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime(time.time() - 1))
+    celery_metrics.prerun(make_task(published_at=time.time() - 60, eta=eta))
+
+    observed = latency.labels.return_value.observe.call_args.args[0]
+    assert observed < 5
+
+
+@mock.patch.object(celery_metrics, "SRE_QUEUE_LATENCY")
+def test_prerun_without_header(latency):
+    celery_metrics.prerun(make_task())
+
+    latency.labels.assert_not_called()
+
+
+def test_queue_depth_collector():
+    collector = celery_metrics.QueueDepthCollector(
+        "redis://localhost", ["secbot.scans", "secbot.outputs", "secbot.scans"]
+    )
+    depths = {
+        "secbot.scans": 2,
+        # The messages of the priority 9, e.g. of the prefetch tasks
+        get_broker_queue_names("secbot.scans")[-1]: 1,
+    }
+    collector._redis = mock.Mock(
+        llen=mock.Mock(side_effect=lambda name: depths.get(name, 0))
+    )
+
+    [metric] = collector.collect()
+
+    assert [(sample.labels["queue"], sample.value) for sample in metric.samples] == [
+        ("secbot.scans", 3),
+        ("secbot.outputs", 0),
+    ]
+
+
+def test_queue_depth_collector_broker_is_down():
+    collector = celery_metrics.QueueDepthCollector("redis://localhost", ["celery"])
+    collector._redis = mock.Mock(llen=mock.Mock(side_effect=redis.ConnectionError))
+
+    [metric] = collector.collect()
+
+    assert metric.samples == []
@@ -0,0 +1,124 @@
+from unittest import mock
+
+import pytest
+from celery import Celery
+from celery.canvas import chain
+
+from app.secbot.admission import (
+    DEFER_SCRIPT,
+    AdmissionController,
+    AdmissionDecision,
+    AdmissionLimits,
+    AdmissionLoad,
+)
+
+LIMITS = AdmissionLimits(
+    queue_soft_limit=10,
+    queue_hard_limit=100,
+    scans_soft_limit=5,
+    scans_hard_limit=50,
+)
+
+
+@pytest.fixture
+def controller():
+    return AdmissionController(mock.Mock(), mock.Mock(), limits=LIMITS)
+
+
+@pytest.mark.parametrize(
+    "load, low_priority, decision",
+    [
+        (AdmissionLoad(queue_depth=0, in_progress_scans=0), True, "admit"),
+        (AdmissionLoad(queue_depth=10, in_progress_scans=0), True, "defer"),
+        (AdmissionLoad(queue_depth=0, in_progress_scans=5), True, "defer"),
+        (AdmissionLoad(queue_depth=100, in_progress_scans=0), True, "shed"),
+        (AdmissionLoad(queue_depth=0, in_progress_scans=50), True, "shed"),
+        (AdmissionLoad(queue_depth=100, in_progress_scans=50), False, "admit"),
+    ],
+)
+def test_admission_decision(controller, load, low_priority, decision):
+    assert controller.decide(load, low_priority=low_priority) is AdmissionDecision(
+        decision
+    )
+
+
+def test_admission_without_limits():
+    controller = AdmissionController(mock.Mock(), mock.Mock(), AdmissionLimits())
+    load = AdmissionLoad(queue_depth=10**6, in_progress_scans=10**6)
+
+    assert controller.decide(load, low_priority=True) is AdmissionDecision.ADMIT
+
+
+@pytest.mark.asyncio
+async def test_admission_measure_skips_unlimited_scans():
+    # The prefetch tasks of the lowest priority are kept in their own list
+    depths = {"celery": 7, "celery\x06\x169": 2}
+    broker_redis = mock.Mock(
+        llen=mock.AsyncMock(side_effect=lambda name: depths.get(name, 0))
+    )
+    controller = AdmissionController(
+        mock.Mock(), broker_redis, AdmissionLimits(queue_soft_limit=10)
+    )
+    count_in_progress_scans = mock.AsyncMock()
+
+    load = await controller.measure("celery", count_in_progress_scans)
+
+    assert load == AdmissionLoad(queue_depth=9, in_progress_scans=0)
+    count_in_progress_scans.assert_not_called()
+
+
+class FakeHoldingRedis:
+    """The holding queue over an in-memory list."""
+
+    def __init__(self):
+        self.holding = []
+
+    async def eval(self, script, nkeys, key, limit, entry):
+        assert script == DEFER_SCRIPT
+        if 0 < int(limit) <= len(self.holding):
+            return 0
+        self.holding.insert(0, entry)
+        return 1
+
+    async def rpop(self, key):
+        return self.holding.pop() if self.holding else None
+
+
+@pytest.mark.asyncio
+async def test_admission_defer_and_release():
+    celery_app = Celery()
+    workflow = chain(
+        celery_app.signature("secbot.handler.scan", args=({"key": "value"},)),
+        celery_app.signature("secbot.handler.output"),
+    )
+    controller = AdmissionController(FakeHoldingRedis(), mock.Mock(), LIMITS)
+    publish = mock.AsyncMock()
+
+    assert await controller.defer(
+        "gitlab", [workflow], low_priority=True, fair_share_key="group/project"
+    )
+    assert (
+        await controller.release(celery_app, "gitlab", count=10, publish=publish) == 1
+    )
+
+    # The released workflows are published with the options of the dispatch
+    (released,), options = publish.call_args
+    assert [item.tasks[0].task for item in released] == ["secbot.handler.scan"]
+    assert options == {
+        "countdown": None,
+        "low_priority": True,
+        "fair_share_key": "group/project",
+    }
+    assert controller.redis.holding == []
+
+
+@pytest.mark.asyncio
+async def test_admission_holding_limit():
+    celery_app = Celery()
+    controller = AdmissionController(
+        FakeHoldingRedis(), mock.Mock(), AdmissionLimits(holding_limit=1)
+    )
+
+    assert await controller.defer("gitlab", [celery_app.signature("first")])
+    assert not await controller.defer("gitlab", [celery_app.signature("second")])
+    assert len(controller.redis.holding) == 1
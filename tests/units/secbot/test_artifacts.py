@@ -0,0 +1,193 @@
+import gzip
+import json
+import os
+import time
+from unittest import mock
+
+import boto3
+import pytest
+from moto import mock_s3
+from pydantic import ValidationError
+
+from app.secbot.artifacts import (
+    ArtifactRef,
+    LocalArtifactStore,
+    S3ArtifactStore,
+    cleanup_artifacts,
+)
+from app.secbot.exceptions import ArtifactStoreDisabled
+from app.secbot.inputs.gitlab.schemas import GitlabScanResultFile
+from app.secbot.settings import SecbotSettings
+
+REPORT = json.dumps(
+    [{"RuleID": "generic-api-key", "File": "settings.py", "Secret": "REDACTED"}]
+).encode()
+
+
+@pytest.fixture
+def s3_client():
+    with mock_s3():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="secbot")
+        yield client
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("compression", [True, False])
+async def test_local_store_round_trip(tmp_path, compression):
+    store = LocalArtifactStore(str(tmp_path), compression=compression)
+
+    ref = await store.put(REPORT)
+
+    assert ref.size == len(REPORT)
+    assert ref.compressed is compression
+    assert ref.key.endswith(".gz") is compression
+    assert await store.get(ref) == REPORT
+
+    stored = (tmp_path / ref.key).read_bytes()
+    assert (gzip.decompress(stored) if compression else stored) == REPORT
+
+
+@pytest.mark.asyncio
+async def test_local_store_is_content_addressed(tmp_path):
+    store = LocalArtifactStore(str(tmp_path))
+
+    with mock.patch.object(store, "_write", wraps=store._write) as write:
+        first = await store.put(REPORT)
+        second = await store.put(REPORT)
+        other = await store.put(b"[]")
+
+    assert first == second
+    assert first.key != other.key
+    assert write.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_local_store_missing_artifact(tmp_path):
+    store = LocalArtifactStore(str(tmp_path))
+
+    with pytest.raises(KeyError):
+        await store.get(ArtifactRef(key="00/missing", size=0))
+
+
+@pytest.mark.asyncio
+async def test_local_store_cleanup(tmp_path):
+    store = LocalArtifactStore(str(tmp_path))
+    expired = await store.put(REPORT)
+    kept = await store.put(b"[]")
+    stored_before = time.time() - 3600
+    os.utime(tmp_path / expired.key, (stored_before, stored_before))
+    os.utime(tmp_path / kept.key, (stored_before, stored_before))
+
+    # The artifact stored again is kept for the TTL since then
+    await store.put(b"[]")
+
+    assert store.cleanup(time.time() - 60) == 1
+    assert not (tmp_path / expired.key).exists()
+    assert await store.get(kept) == b"[]"
+
+
+@pytest.mark.asyncio
+async def test_s3_store_round_trip(s3_client):
+    store = S3ArtifactStore(s3_client, bucket="secbot", prefix="secbot/artifacts/")
+
+    ref = await store.put(REPORT)
+    assert await store.put(REPORT) == ref
+    assert await store.get(ref) == REPORT
+
+    keys = [
+        item["Key"] for item in s3_client.list_objects_v2(Bucket="secbot")["Contents"]
+    ]
+    assert keys == [f"secbot/artifacts/{ref.key}"]
+
+    with pytest.raises(KeyError):
+        await store.get(ArtifactRef(key="00/missing", size=0))
+
+
+@pytest.mark.asyncio
+async def test_s3_store_cleanup(s3_client):
+    store = S3ArtifactStore(s3_client, bucket="secbot", prefix="secbot/artifacts")
+    s3_client.put_object(Bucket="secbot", Key="other/report", Body=b"[]")
+    ref = await store.put(REPORT)
+
+    assert store.cleanup(time.time() - 60) == 0
+    assert await store.put(REPORT) == ref
+    assert store.cleanup(time.time() + 60) == 1
+
+    keys = [
+        item["Key"] for item in s3_client.list_objects_v2(Bucket="secbot")["Contents"]
+    ]
+    assert keys == ["other/report"]
+
+
+def test_cleanup_artifacts(tmp_path):
+    store = mock.Mock()
+    store.cleanup.return_value = 3
+
+    with mock.patch(
+        "app.secbot.artifacts.get_artifact_store", return_value=store
+    ), mock.patch("app.secbot.artifacts.settings.artifacts_ttl", 3600):
+        assert cleanup_artifacts() == 3
+    (before,) = store.cleanup.call_args.args
+    assert before == pytest.approx(time.time() - 3600, abs=5)
+
+    with mock.patch(
+        "app.secbot.artifacts.get_artifact_store", return_value=store
+    ), mock.patch("app.secbot.artifacts.settings.artifacts_ttl", 0):
+        assert cleanup_artifacts() == 0
+    assert store.cleanup.call_count == 1
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        {"artifacts_backend": "s3"},
+        {"artifacts_backend": "nfs"},
+    ],
+)
+def test_artifacts_settings_validation(values):
+    with pytest.raises(ValidationError):
+        SecbotSettings(**values)
+
+
+@pytest.mark.asyncio
+async def test_scan_result_file_read(tmp_path):
+    store = LocalArtifactStore(str(tmp_path))
+    ref = await store.put(REPORT)
+    file = GitlabScanResultFile(
+        commit_hash="a" * 40, scan_name="gitleaks", format="json", artifact=ref
+    )
+
+    with mock.patch(
+        "app.secbot.inputs.gitlab.schemas.get_artifact_store", return_value=store
+    ):
+        assert await file.read() == REPORT
+
+    # The reference survives the round trip through the task messages
+    assert GitlabScanResultFile.parse_raw(file.json()).artifact == ref
+
+
+@pytest.mark.asyncio
+async def test_scan_result_file_read_inline_content():
+    content = json.loads(REPORT)
+    file = GitlabScanResultFile(
+        commit_hash="a" * 40, scan_name="gitleaks", format="json", content=content
+    )
+
+    assert json.loads(await file.read()) == content
+
+
+@pytest.mark.asyncio
+async def test_scan_result_file_read_disabled_store():
+    file = GitlabScanResultFile(
+        commit_hash="a" * 40,
+        scan_name="gitleaks",
+        format="json",
+        artifact=ArtifactRef(key="00/report", size=2),
+    )
+
+    with mock.patch(
+        "app.secbot.inputs.gitlab.schemas.get_artifact_store", return_value=None
+    ):
+        with pytest.raises(ArtifactStoreDisabled):
+            await file.read()
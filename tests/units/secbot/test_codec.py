@@ -0,0 +1,104 @@
+from typing import List, Optional
+
+import pytest
+from celery import Celery
+from kombu.serialization import dumps, loads
+from pydantic import AnyUrl, BaseModel
+
+from app.secbot import codec
+from app.secbot.exceptions import SecbotCodecError
+from app.secbot.schemas import SecbotBaseModel, SecbotFailedResult, Severity
+
+
+class ExampleFinding(BaseModel):
+    title: str
+    severity: Severity
+    url: AnyUrl
+
+
+class ExampleResult(SecbotBaseModel):
+    name: str
+    findings: List[ExampleFinding]
+    failed: Optional[SecbotFailedResult] = None
+
+
+@pytest.fixture
+def example_result():
+    return ExampleResult(
+        name="gitleaks",
+        findings=[
+            ExampleFinding(
+                title="Generic API Key",
+                severity=Severity.HIGH,
+                url="https://defectdojo.example.com/finding/1",
+            )
+        ],
+        failed=SecbotFailedResult(
+            handler_name="semgrep", component_name="semgrep", error="Error"
+        ),
+    )
+
+
+def test_round_trip(example_result):
+    value = ((example_result, "text", 1), {"result": example_result, "items": [1]})
+
+    args, kwargs = codec.loads(codec.dumps(value))
+
+    assert args == [example_result, "text", 1]
+    assert kwargs == {"result": example_result, "items": [1]}
+    assert isinstance(args[0].findings[0].severity, Severity)
+    assert isinstance(args[0].failed, SecbotFailedResult)
+
+
+def test_encoding_uses_short_type_id(example_result):
+    encoded = codec.encode(example_result)
+
+    assert encoded[codec.TYPE_KEY] == "ExampleResult"
+    assert "__pydantic_path_model__" not in encoded
+
+
+def test_unknown_type_id():
+    with pytest.raises(SecbotCodecError):
+        codec.loads(b'{"__secbot_type__": "Unknown"}')
+
+
+def test_type_id_is_taken_by_another_model():
+    class SecbotFailedResult(BaseModel):
+        error: str
+
+    with pytest.raises(SecbotCodecError):
+        codec.register_model(SecbotFailedResult)
+
+
+def test_explicit_type_id():
+    class SecbotFailedResult(SecbotBaseModel, type_id="example.SecbotFailedResult"):
+        error: str
+
+    result = SecbotFailedResult(error="Error")
+
+    assert codec.encode(result)[codec.TYPE_KEY] == "example.SecbotFailedResult"
+    assert codec.loads(codec.dumps(result)) == result
+
+
+def test_celery_serializer(example_result):
+    codec.register_celery_serializer()
+
+    content_type, content_encoding, body = dumps(
+        ((example_result,), {}, {}), serializer=codec.CELERY_SERIALIZER
+    )
+
+    assert content_type == codec.CELERY_CONTENT_TYPE
+    assert loads(body, content_type, content_encoding) == [
+        [example_result],
+        {},
+        {},
+    ]
+
+
+def test_signature_round_trip(example_result):
+    celery_app = Celery()
+    signature = celery_app.signature("task", args=(example_result,))
+
+    decoded = celery_app.signature(codec.loads(codec.dumps(signature)))
+
+    assert decoded.args == [example_result]
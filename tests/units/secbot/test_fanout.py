@@ -0,0 +1,312 @@
+from collections import Counter
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+from celery import Celery
+
+from app.secbot import codec
+from app.secbot.admission import AdmissionDecision
+from app.secbot.config import SecbotConfigComponent, WorkflowJob
+from app.secbot.exceptions import DispatchShed
+from app.secbot.handlers import (
+    SecbotNotificationHandler,
+    SecbotOutputHandler,
+    SecbotScanHandler,
+)
+from app.secbot.inputs import SecbotInput, iter_fan_in_results
+from app.secbot.schemas import SecbotFailedResult
+
+executions = Counter()
+
+
+class ExampleScanHandler(SecbotScanHandler):
+    async def run(self, data: dict, component_name: str):
+        executions[component_name] += 1
+        return {"scan": component_name}
+
+
+class BrokenScanHandler(SecbotScanHandler):
+    async def run(self, data: dict, component_name: str):
+        executions[component_name] += 1
+        raise RuntimeError("Scan has failed")
+
+
+class ExampleOutputHandler(SecbotOutputHandler):
+    async def fetch_status(self, *args, **kwargs) -> bool:
+        return True
+
+    async def run(self, scan_result: dict, component_name: str):
+        executions[f"{scan_result['scan']}>{component_name}"] += 1
+        return {**scan_result, "output": component_name}
+
+
+class PollingOutputHandler(SecbotOutputHandler):
+    async def fetch_status(self, *args, **kwargs) -> bool:
+        return True
+
+    async def run(self, scan_result: dict, component_name: str):
+        return self.continue_later("poll", countdown=10, attempt=1)
+
+    async def poll(self, scan_result: dict, component_name: str, attempt: int):
+        executions[f"{scan_result['scan']}>{component_name}:poll"] += 1
+        if attempt < 3:
+            return self.continue_later("poll", countdown=10, attempt=attempt + 1)
+        return {**scan_result, "output": component_name}
+
+
+class ExampleNotificationHandler(SecbotNotificationHandler):
+    async def run(self, output_result: dict, component_name: str):
+        if "check" in output_result:
+            name = f"{output_result['check']}>{component_name}"
+        else:
+            name = (
+                f"{output_result['scan']}>{output_result['output']}>{component_name}"
+            )
+        executions[name] += 1
+
+
+class ExampleInput(SecbotInput):
+    def autodiscover(self):
+        for name in ("gitleaks", "semgrep"):
+            self.register_handler(name, ExampleScanHandler)
+        self.register_handler("broken", BrokenScanHandler)
+        for name in ("defectdojo", "archive"):
+            self.register_handler(name, ExampleOutputHandler)
+        self.register_handler("tracker", PollingOutputHandler)
+        self.register_handler("slack", ExampleNotificationHandler)
+
+    async def fan_in(self, results: tuple, data: dict) -> dict:
+        executions["fan_in"] += 1
+        return {
+            "check": ",".join(
+                sorted(
+                    f"{result.component_name}:failed"
+                    if isinstance(result, SecbotFailedResult)
+                    else f"{result['scan']}>{result['output']}"
+                    for result in iter_fan_in_results(results)
+                )
+            )
+        }
+
+
+def make_job(name: str, scans, outputs, notifications) -> WorkflowJob:
+    def components(names):
+        return [SecbotConfigComponent(name=item, handler_name=item) for item in names]
+
+    return WorkflowJob(
+        name=name,
+        input_name="example",
+        scans=components(scans),
+        outputs=components(outputs),
+        notifications=components(notifications),
+    )
+
+
+@pytest.fixture
+def example_input(monkeypatch):
+    # The eager chords don't need the redis result backend of the environment
+    monkeypatch.delenv("CELERY_RESULT_BACKEND", raising=False)
+    executions.clear()
+    return ExampleInput(config_name="example", celery_app=Celery())
+
+
+def test_scan_runs_once_for_every_output(example_input):
+    job = make_job("job", ["gitleaks"], ["defectdojo", "archive"], ["slack"])
+
+    workflows = example_input.build_workflows([job], {"key": "value"})
+    for workflow in workflows:
+        workflow.apply()
+
+    assert len(workflows) == 1
+    assert executions == {
+        "gitleaks": 1,
+        "gitleaks>defectdojo": 1,
+        "gitleaks>archive": 1,
+        "gitleaks>defectdojo>slack": 1,
+        "gitleaks>archive>slack": 1,
+    }
+
+
+def test_scan_shared_by_jobs_runs_once(example_input):
+    jobs = [
+        make_job("cheap", ["gitleaks"], ["defectdojo"], ["slack"]),
+        make_job("slow", ["gitleaks", "semgrep"], ["archive"], []),
+    ]
+
+    workflows = example_input.build_workflows(jobs, {"key": "value"})
+    for workflow in workflows:
+        workflow.apply()
+
+    assert len(workflows) == 2
+    assert executions == {
+        "gitleaks": 1,
+        "semgrep": 1,
+        "gitleaks>defectdojo": 1,
+        "gitleaks>archive": 1,
+        "semgrep>archive": 1,
+        "gitleaks>defectdojo>slack": 1,
+    }
+
+
+def test_fan_in_notifies_once_per_check(example_input):
+    example_input.celery_app.conf.task_always_eager = True
+    jobs = [
+        make_job("cheap", ["gitleaks"], ["defectdojo", "archive"], ["slack"]),
+        make_job("slow", ["semgrep", "broken"], ["archive"], ["slack"]),
+    ]
+
+    workflows = example_input.build_workflows(jobs, {"key": "value"}, fan_in=True)
+    for workflow in workflows:
+        workflow.apply()
+
+    check = "broken:failed,gitleaks>archive,gitleaks>defectdojo,semgrep>archive"
+    assert len(workflows) == 1
+    assert executions == {
+        "gitleaks": 1,
+        "semgrep": 1,
+        "broken": 1,
+        "gitleaks>defectdojo": 1,
+        "gitleaks>archive": 1,
+        "semgrep>archive": 1,
+        "fan_in": 1,
+        f"{check}>slack": 1,
+    }
+
+
+def test_component_queue_overrides_stage_queue(example_input):
+    job = make_job("job", ["gitleaks"], ["defectdojo"], [])
+    job.scans[0].queue = "secbot.scans.slow"
+
+    scan = example_input.build_component_task("scans", job.scans[0])
+    output = example_input.build_component_task("outputs", job.outputs[0])
+
+    assert scan.options["queue"] == "secbot.scans.slow"
+    assert "queue" not in output.options
+
+
+def test_component_concurrency_is_passed_to_task(example_input):
+    job = make_job("job", ["gitleaks"], ["defectdojo"], [])
+    job.outputs[0].concurrency = 4
+
+    scan = example_input.build_component_task("scans", job.scans[0])
+    output = example_input.build_component_task("outputs", job.outputs[0])
+
+    assert "concurrency" not in scan.kwargs
+    assert output.kwargs["concurrency"] == 4
+
+
+def test_continuation_passes_last_step_result_down_the_workflow(example_input):
+    job = make_job("job", ["gitleaks"], ["tracker", "archive"], ["slack"])
+
+    for workflow in example_input.build_workflows([job], {"key": "value"}):
+        workflow.apply()
+
+    assert executions == {
+        "gitleaks": 1,
+        "gitleaks>tracker:poll": 3,
+        "gitleaks>archive": 1,
+        "gitleaks>tracker>slack": 1,
+        "gitleaks>archive>slack": 1,
+    }
+
+
+def test_continuation_in_fan_in(example_input):
+    example_input.celery_app.conf.task_always_eager = True
+    job = make_job("job", ["gitleaks"], ["tracker"], ["slack"])
+
+    workflows = example_input.build_workflows([job], {"key": "value"}, fan_in=True)
+    for workflow in workflows:
+        workflow.apply()
+
+    assert executions == {
+        "gitleaks": 1,
+        "gitleaks>tracker:poll": 3,
+        "fan_in": 1,
+        "gitleaks>tracker>slack": 1,
+    }
+
+
+def test_continuation_is_delayed_on_its_queue(example_input):
+    job = make_job("job", ["gitleaks"], ["tracker"], [])
+    job.outputs[0].queue = "secbot.outputs.slow"
+    handler = example_input.outputs["tracker"]
+    signature = example_input.build_component_task("outputs", job.outputs[0])
+    task = mock.Mock(
+        si=handler.task.si,
+        request=SimpleNamespace(delivery_info={"routing_key": "secbot.outputs.slow"}),
+    )
+
+    handler.replace_with_continuation(
+        task,
+        handler.continue_later("poll", countdown=10, attempt=1),
+        {"scan": "gitleaks"},
+        **signature.kwargs,
+    )
+
+    (replacement,), _ = task.replace.call_args
+    assert replacement.options == {"countdown": 10, "queue": "secbot.outputs.slow"}
+    assert replacement.kwargs["continuation"].state == {"attempt": 1}
+    assert replacement.kwargs["component_name"] == "tracker"
+
+
+@pytest.mark.asyncio
+async def test_scheduled_workflow_keeps_task_ids(example_input):
+    job = make_job("job", ["gitleaks"], ["defectdojo"], ["slack"])
+    admission = mock.Mock(
+        measure=mock.AsyncMock(),
+        decide=mock.Mock(return_value=AdmissionDecision.ADMIT),
+        is_overloaded=mock.Mock(return_value=True),
+    )
+    scheduler = mock.Mock(submit=mock.AsyncMock(), release=mock.AsyncMock())
+
+    with mock.patch(
+        "app.secbot.inputs.get_admission_controller", return_value=admission
+    ), mock.patch("app.secbot.inputs.get_fair_scheduler", return_value=scheduler):
+        (result,) = await example_input.run(
+            {"key": "value"}, jobs=[job], fair_share_key="group/service"
+        )
+
+    # The workflow is published by the scheduler later, with the same task ids
+    (_, (workflow,)), _ = scheduler.submit.call_args
+    signature = example_input.celery_app.signature(codec.loads(codec.dumps(workflow)))
+    with mock.patch("celery.app.task.Task.apply_async") as apply_async_mock:
+        signature.apply_async()
+    while result.parent is not None:
+        result = result.parent
+    assert apply_async_mock.call_args.kwargs["task_id"] == result.id
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("overloaded, released", [(False, 5), (True, 3)])
+async def test_release_queued_workflows(example_input, overloaded, released):
+    admission = mock.Mock(
+        measure=mock.AsyncMock(),
+        is_overloaded=mock.Mock(return_value=overloaded),
+        release=mock.AsyncMock(return_value=2),
+    )
+    scheduler = mock.Mock(release=mock.AsyncMock(return_value=3))
+
+    with mock.patch(
+        "app.secbot.inputs.get_admission_controller", return_value=admission
+    ), mock.patch("app.secbot.inputs.get_fair_scheduler", return_value=scheduler):
+        assert await example_input.release() == released
+
+    scheduler.release.assert_awaited_once_with(
+        example_input.celery_app, example_input.scans_queue
+    )
+
+
+@pytest.mark.asyncio
+async def test_deferred_workflow_is_shed_when_holding_queue_is_full(example_input):
+    job = make_job("job", ["gitleaks"], ["defectdojo"], [])
+    admission = mock.Mock(
+        measure=mock.AsyncMock(),
+        decide=mock.Mock(return_value=AdmissionDecision.DEFER),
+        defer=mock.AsyncMock(return_value=False),
+    )
+
+    with mock.patch(
+        "app.secbot.inputs.get_admission_controller", return_value=admission
+    ), pytest.raises(DispatchShed):
+        await example_input.run({"key": "value"}, jobs=[job], low_priority=True)
@@ -0,0 +1,179 @@
+import asyncio
+import collections
+import time
+from unittest import mock
+
+import pytest
+from celery import Celery
+from prometheus_client import REGISTRY
+
+from app.metrics.common import get_location_labels_from_env
+from app.secbot import runtime
+from app.secbot.exceptions import ConcurrencyLimitTimeout
+from app.secbot.handlers import SecbotOutputHandler
+from app.secbot.limits import (
+    ACQUIRE_SCRIPT,
+    HANDLER_LIMIT,
+    RELEASE_SCRIPT,
+    RENEW_SCRIPT,
+    ConcurrencyLimit,
+    ConcurrencyLimiter,
+)
+
+
+class FakeLimitsRedis:
+    """The limits scripts over in-memory sorted sets, with the clock to move."""
+
+    def __init__(self):
+        self.leases = collections.defaultdict(dict)
+        self.offset = 0.0
+        self.renewals = 0
+
+    def now(self) -> int:
+        return int((time.monotonic() + self.offset) * 1000)
+
+    def eval(self, script, nkeys, *args):
+        (key,), argv = args[:nkeys], args[nkeys:]
+        leases = self.leases[key]
+        if script == ACQUIRE_SCRIPT:
+            limit, lease, token = argv
+            for holder, expiry in list(leases.items()):
+                if expiry <= self.now():
+                    del leases[holder]
+            if len(leases) < int(limit):
+                leases[token] = self.now() + int(lease)
+                return [1, len(leases)]
+            return [0, len(leases)]
+        if script == RENEW_SCRIPT:
+            lease, token = argv
+            if token not in leases:
+                return 0
+            self.renewals += 1
+            leases[token] = self.now() + int(lease)
+            return 1
+        assert script == RELEASE_SCRIPT
+        leases.pop(argv[0], None)
+        return len(leases)
+
+
+class FakeAsyncLimitsRedis:
+    def __init__(self, redis: FakeLimitsRedis):
+        self.redis = redis
+
+    async def eval(self, *args):
+        return self.redis.eval(*args)
+
+
+def make_limiter(**kwargs):
+    redis = FakeLimitsRedis()
+    return ConcurrencyLimiter(
+        FakeAsyncLimitsRedis(redis), redis, poll_interval=0.01, **kwargs
+    )
+
+
+LIMIT = ConcurrencyLimit(name="handler:defectdojo", limit=2)
+
+
+@pytest.mark.asyncio
+async def test_limiter_holds_up_to_limit():
+    limiter = make_limiter()
+    running, peak = 0, 0
+
+    async def request():
+        nonlocal running, peak
+        async with limiter.hold(LIMIT):
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.05)
+            running -= 1
+
+    await asyncio.gather(*(request() for _ in range(6)))
+
+    assert peak == 2
+    assert limiter.sync_redis.leases[limiter.key(LIMIT)] == {}
+
+
+def test_limiter_reclaims_expired_leases():
+    limiter = make_limiter(lease=60)
+    limiter.acquire_sync(LIMIT)
+    limiter.acquire_sync(LIMIT)
+
+    # The holders have crashed without releasing their slots
+    limiter.sync_redis.offset += 61
+
+    token = limiter.acquire_sync(LIMIT)
+    assert list(limiter.sync_redis.leases[limiter.key(LIMIT)]) == [token]
+
+
+def test_limiter_wait_timeout():
+    limiter = make_limiter(timeout=0.05)
+    limiter.acquire_sync(LIMIT)
+    limiter.acquire_sync(LIMIT)
+    labels = {**get_location_labels_from_env(), "limit": LIMIT.name}
+    timeouts = REGISTRY.get_sample_value("secbot_limit_timeouts_total", labels) or 0
+
+    with pytest.raises(ConcurrencyLimitTimeout):
+        limiter.acquire_sync(LIMIT)
+    assert REGISTRY.get_sample_value("secbot_limit_timeouts_total", labels) == (
+        timeouts + 1
+    )
+
+
+def test_limiter_renews_lease_while_held():
+    limiter = make_limiter(lease=0.03)
+
+    with limiter.hold_sync(LIMIT):
+        time.sleep(0.1)
+
+    assert limiter.sync_redis.renewals >= 2
+    assert limiter.sync_redis.leases[limiter.key(LIMIT)] == {}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "limit", [None, ConcurrencyLimit(name="gitlab:host", limit=0)]
+)
+async def test_limiter_without_limit(limit):
+    limiter = ConcurrencyLimiter(mock.Mock(), mock.Mock())
+
+    async with limiter.hold(limit):
+        pass
+    with limiter.hold_sync(limit):
+        pass
+
+    limiter.redis.eval.assert_not_called()
+    limiter.sync_redis.eval.assert_not_called()
+
+
+class LimitedOutputHandler(SecbotOutputHandler):
+    async def fetch_status(self, *args, **kwargs) -> bool:
+        return True
+
+    async def run(self, scan_result: dict, component_name: str):
+        return HANDLER_LIMIT.get()
+
+
+@pytest.fixture
+def worker_runtime(monkeypatch):
+    monkeypatch.setattr(runtime, "engine", mock.Mock(dispose=mock.AsyncMock()))
+    monkeypatch.setattr(runtime, "_runtime", None)
+    yield
+    runtime.stop_worker_runtime()
+
+
+@pytest.mark.parametrize(
+    "kwargs, limit",
+    [
+        ({"concurrency": 3}, ConcurrencyLimit(name="handler:tracker", limit=3)),
+        ({}, ConcurrencyLimit(name="handler:tracker", limit=0)),
+    ],
+)
+def test_handler_task_sets_handler_limit(worker_runtime, kwargs, limit):
+    handler = LimitedOutputHandler(celery_app=Celery(), config_name="tracker")
+
+    result = handler.task.apply(
+        args=({"scan": "gitleaks"},), kwargs={"component_name": "tracker", **kwargs}
+    )
+
+    assert result.get() == limit
+    assert HANDLER_LIMIT.get() is None
@@ -0,0 +1,93 @@
+from collections import Counter
+from unittest import mock
+
+import pytest
+
+from app.secbot import SecurityBot
+from app.secbot.plugins import (
+    LazyRegistry,
+    PluginEntry,
+    discover_plugins,
+    load_manifest,
+    main,
+)
+
+
+def test_manifest_is_up_to_date():
+    assert load_manifest() == discover_plugins()
+
+
+def test_manifest_check(tmp_path):
+    output = tmp_path / "plugins.json"
+
+    assert main(["--output", str(output), "--check"]) == 1
+    assert main(["--output", str(output)]) == 0
+    assert main(["--output", str(output), "--check"]) == 0
+
+
+def test_registry_creates_plugin_on_first_use():
+    created = Counter()
+
+    def factory(name, cls):
+        created[name] += 1
+        return cls()
+
+    registry = LazyRegistry(factory)
+    registry.declare("counter", PluginEntry(module="collections", cls="Counter"))
+
+    assert "counter" in registry
+    assert not created
+    assert registry["counter"] is registry["counter"]
+    assert created == {"counter": 1}
+
+
+def test_registry_missing_plugin():
+    registry = LazyRegistry(lambda name, cls: cls())
+    registry.declare("missing", PluginEntry(module="collections", cls="Missing"))
+
+    with pytest.raises(KeyError):
+        registry["missing"]
+    assert registry.load_all() == {}
+
+
+def registered_tasks(celery_app) -> set:
+    return {call.kwargs["name"] for call in celery_app.task.call_args_list}
+
+
+def test_handlers_are_registered_on_first_use():
+    celery_app = mock.Mock()
+    security_bot = SecurityBot(celery_app=celery_app)
+
+    gitlab_input = security_bot.get_input("gitlab")
+
+    assert "gitleaks" in gitlab_input.scans
+    assert registered_tasks(celery_app) == {
+        "secbot.input.gitlab.fan_in",
+        "secbot.input.gitlab.prefetch",
+        "secbot.input.gitlab.release",
+    }
+
+    gitlab_input.scans["gitleaks"]
+
+    assert registered_tasks(celery_app) == {
+        "secbot.input.gitlab.fan_in",
+        "secbot.input.gitlab.prefetch",
+        "secbot.input.gitlab.release",
+        "secbot.handler.gitleaks",
+    }
+
+
+def test_worker_loads_all_plugins():
+    celery_app = mock.Mock()
+    security_bot = SecurityBot(celery_app=celery_app)
+
+    security_bot.load_plugins()
+
+    assert registered_tasks(celery_app) == {
+        "secbot.input.gitlab.fan_in",
+        "secbot.input.gitlab.prefetch",
+        "secbot.input.gitlab.release",
+        "secbot.handler.gitleaks",
+        "secbot.handler.defectdojo",
+        "secbot.handler.slack",
+    }
@@ -1,9 +1,17 @@
 from unittest import mock
 
+import pytest
+from celery import Celery
+
 from app.secbot import SecurityBot
-from app.secbot.handlers import SecbotScanHandler
+from app.secbot.handlers import (
+    SecbotNotificationHandler,
+    SecbotOutputHandler,
+    SecbotScanHandler,
+)
 from app.secbot.inputs import SecbotInput
 from app.secbot.inputs.gitlab import GitlabInput
+from app.secbot.settings import settings
 
 
 def test_register_new_input():
@@ -35,3 +43,44 @@ def test_register_new_handler():
 
     assert "new_handler" in gitlab_input.scans
     init_mock.assert_called_once_with(config_name="new_handler", celery_app=celery_app)
+
+
+def test_io_bound_handler_is_routed_to_async_queue(monkeypatch):
+    monkeypatch.setattr(settings, "scans_queue", "secbot.scans")
+    monkeypatch.setattr(settings, "async_handlers_queue", "secbot.io")
+    celery_app = Celery()
+
+    class ExampleScanHandler(SecbotScanHandler):
+        async def run(self, *args, **kwargs):
+            pass
+
+    class ExampleNotificationHandler(SecbotNotificationHandler):
+        async def run(self, *args, **kwargs):
+            pass
+
+    scan = ExampleScanHandler(celery_app=celery_app, config_name="scan")
+    notification = ExampleNotificationHandler(
+        celery_app=celery_app, config_name="notification"
+    )
+
+    assert scan.task.queue == "secbot.scans"
+    assert notification.task.queue == "secbot.io"
+
+
+@pytest.mark.parametrize(
+    "queue, expected_queue", [("secbot.outputs", "secbot.outputs"), ("", None)]
+)
+def test_handler_is_routed_to_stage_queue(monkeypatch, queue, expected_queue):
+    monkeypatch.setattr(settings, "outputs_queue", queue)
+    monkeypatch.setattr(settings, "async_handlers_queue", None)
+
+    class ExampleOutputHandler(SecbotOutputHandler):
+        async def fetch_status(self, *args, **kwargs) -> bool:
+            return True
+
+        async def run(self, *args, **kwargs):
+            pass
+
+    output = ExampleOutputHandler(celery_app=Celery(), config_name="output")
+
+    assert getattr(output.task, "queue", None) == expected_queue
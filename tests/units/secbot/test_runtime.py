@@ -0,0 +1,103 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pytest
+
+from app.secbot import runtime
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    engine = mock.Mock(dispose=mock.AsyncMock())
+    monkeypatch.setattr(runtime, "engine", engine)
+    monkeypatch.setattr(runtime, "_runtime", None)
+    yield engine
+    runtime.stop_worker_runtime()
+
+
+async def get_session():
+    async with runtime.http_session() as session:
+        return session
+
+
+def test_tasks_share_event_loop(engine):
+    async def get_loop():
+        return asyncio.get_running_loop()
+
+    assert runtime.run_in_runtime(get_loop()) is runtime.run_in_runtime(get_loop())
+
+
+def test_tasks_share_http_session(engine):
+    first = runtime.run_in_runtime(get_session())
+    second = runtime.run_in_runtime(get_session())
+
+    assert first is second
+    assert not first.closed
+
+
+@pytest.mark.asyncio
+async def test_http_session_outside_runtime(engine):
+    session = await get_session()
+
+    assert session.closed
+
+
+def test_start_worker_runtime_drops_inherited_connections(engine):
+    runtime.start_worker_runtime()
+
+    engine.sync_engine.dispose.assert_called_once_with(close=False)
+    assert runtime._runtime is not None
+
+
+def test_stop_worker_runtime(engine):
+    session = runtime.run_in_runtime(get_session())
+    loop = runtime.get_runtime().loop
+
+    runtime.stop_worker_runtime()
+
+    assert session.closed
+    assert loop.is_closed()
+    engine.dispose.assert_awaited_once()
+    assert runtime._runtime is None
+
+
+def run_concurrently(worker_runtime, count: int, limit_key=None) -> int:
+    in_flight = peak = 0
+
+    async def handler():
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.2)
+        in_flight -= 1
+
+    # The threads of the celery pool submit the coroutines of their tasks
+    with ThreadPoolExecutor(max_workers=count) as executor:
+        futures = [
+            executor.submit(worker_runtime.run, handler(), limit_key)
+            for _ in range(count)
+        ]
+        for future in futures:
+            future.result()
+    return peak
+
+
+def test_threaded_runtime_runs_coroutines_concurrently(engine):
+    worker_runtime = runtime.WorkerRuntime(threaded=True)
+
+    try:
+        assert run_concurrently(worker_runtime, 20) == 20
+    finally:
+        worker_runtime.close()
+
+    assert worker_runtime.loop.is_closed()
+
+
+def test_threaded_runtime_limits_handler_concurrency(engine):
+    worker_runtime = runtime.WorkerRuntime(threaded=True, handler_concurrency=5)
+
+    try:
+        assert run_concurrently(worker_runtime, 20, limit_key="defectdojo") == 5
+    finally:
+        worker_runtime.close()
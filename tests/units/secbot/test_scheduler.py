@@ -0,0 +1,187 @@
+import collections
+import time
+from unittest import mock
+
+import pytest
+from celery import Celery
+
+from app.secbot.scheduler import (
+    SUBMIT_SCRIPT,
+    TAKE_SCRIPT,
+    FairScheduler,
+    SchedulerPriority,
+)
+
+
+class FakeSchedulerRedis:
+    """The scheduler scripts over in-memory lists.
+
+    The queues are the lists of the (due time, id, workflow) items,
+    sorted like the sorted sets.
+    """
+
+    def __init__(self):
+        self.lists = collections.defaultdict(list)
+        self.turn = 0
+        self.sequence = 0
+
+    async def eval(self, script, nkeys, *args):
+        keys, argv = args[:nkeys], args[nkeys:]
+        if script == SUBMIT_SCRIPT:
+            ring, queue, _ = keys
+            was_empty = not self.lists[queue]
+            for not_before, item in zip(argv[1::2], argv[2::2]):
+                self.sequence += 1
+                self.lists[queue].append((not_before, self.sequence, item))
+            self.lists[queue].sort(key=lambda entry: entry[:2])
+            if was_empty:
+                self.lists[ring].append(argv[0])
+            return len(self.lists[queue])
+        assert script == TAKE_SCRIPT
+        self.turn += 1
+        order = [0, 1] if self.turn % (int(argv[2]) + 1) else [1, 0]
+        for index in order:
+            ring = self.lists[keys[index]]
+            for _ in range(len(ring)):
+                project = ring.pop(0)
+                queue = self.lists[argv[index] + project]
+                if queue[0][0] > argv[3]:
+                    ring.append(project)
+                    continue
+                _, _, item = queue.pop(0)
+                if queue:
+                    ring.append(project)
+                return [index + 1, project, item]
+        return None
+
+
+@pytest.fixture
+def celery_app():
+    return Celery()
+
+
+def make_scheduler(queue_depth=0, **kwargs):
+    return FairScheduler(
+        FakeSchedulerRedis(),
+        mock.Mock(
+            llen=mock.AsyncMock(
+                side_effect=lambda name: queue_depth if name == "secbot.scans" else 0
+            )
+        ),
+        queue_target=kwargs.pop("queue_target", 100),
+        **kwargs,
+    )
+
+
+async def take_all(scheduler):
+    taken = []
+    while (item := await scheduler.take()) is not None:
+        priority, project, data = item
+        taken.append((priority.value, project, data["workflow"]["task"]))
+    return taken
+
+
+@pytest.mark.asyncio
+async def test_scheduler_round_robin_across_projects(celery_app):
+    scheduler = make_scheduler()
+    await scheduler.submit(
+        "group/monorepo",
+        [celery_app.signature(f"monorepo.{i}") for i in range(3)],
+        priority=SchedulerPriority.HIGH,
+    )
+    await scheduler.submit(
+        "group/service",
+        [celery_app.signature(f"service.{i}") for i in range(2)],
+        priority=SchedulerPriority.HIGH,
+    )
+
+    assert [task for *_, task in await take_all(scheduler)] == [
+        "monorepo.0",
+        "service.0",
+        "monorepo.1",
+        "service.1",
+        "monorepo.2",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_scheduler_weights_priorities(celery_app):
+    scheduler = make_scheduler(priority_weight=2)
+    await scheduler.submit(
+        "group/monorepo",
+        [celery_app.signature(f"push.{i}") for i in range(3)],
+        priority=SchedulerPriority.LOW,
+    )
+    await scheduler.submit(
+        "group/service",
+        [celery_app.signature(f"mr.{i}") for i in range(3)],
+        priority=SchedulerPriority.HIGH,
+    )
+
+    assert await take_all(scheduler) == [
+        ("high", "group/service", "mr.0"),
+        ("high", "group/service", "mr.1"),
+        ("low", "group/monorepo", "push.0"),
+        ("high", "group/service", "mr.2"),
+        ("low", "group/monorepo", "push.1"),
+        ("low", "group/monorepo", "push.2"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_scheduler_holds_workflows_until_due(celery_app):
+    scheduler = make_scheduler()
+    await scheduler.submit(
+        "group/service",
+        [celery_app.signature("mr.0")],
+        priority=SchedulerPriority.HIGH,
+        countdown=30,
+    )
+    await scheduler.submit(
+        "group/monorepo",
+        [celery_app.signature("push.0")],
+        priority=SchedulerPriority.LOW,
+    )
+
+    assert await take_all(scheduler) == [("low", "group/monorepo", "push.0")]
+    _, project, item = await scheduler.take(now=time.time() + 30)
+    assert (project, item["workflow"]["task"]) == ("group/service", "mr.0")
+
+
+@pytest.mark.asyncio
+async def test_scheduler_takes_due_workflow_before_debounced_one(celery_app):
+    scheduler = make_scheduler()
+    await scheduler.submit(
+        "group/service",
+        [celery_app.signature("mr.0")],
+        priority=SchedulerPriority.HIGH,
+        countdown=30,
+    )
+    await scheduler.submit(
+        "group/service",
+        [celery_app.signature("mr.1")],
+        priority=SchedulerPriority.HIGH,
+    )
+
+    assert await take_all(scheduler) == [("high", "group/service", "mr.1")]
+    _, _, item = await scheduler.take(now=time.time() + 30)
+    assert item["workflow"]["task"] == "mr.0"
+
+
+@pytest.mark.asyncio
+async def test_scheduler_release_up_to_queue_target(celery_app):
+    scheduler = make_scheduler(queue_depth=8, queue_target=10)
+    await scheduler.submit(
+        "group/service",
+        [celery_app.signature(f"mr.{i}") for i in range(5)],
+        priority=SchedulerPriority.HIGH,
+    )
+
+    with mock.patch("celery.canvas.Signature.apply_async") as apply_async_mock:
+        assert await scheduler.release(celery_app, "secbot.scans") == 2
+
+    scheduler.broker_redis.llen.assert_any_call("secbot.scans")
+    # The released workflows are due, the workers don't hold them out of the queue
+    apply_async_mock.assert_called_with()
+    assert apply_async_mock.call_count == 2
+    assert len(await take_all(scheduler)) == 3